@@ -106,6 +106,44 @@ else:
         }
     }
 
+# ## Cache configuration
+# CACHE_BACKEND selects locmem (default, per process), file or db (shared between
+# processes). None of them needs an external service; run
+# `python manage.py createcachetable` once before using the db backend. Polled
+# JSON endpoints only send ETags (and answer 304) with a shared backend.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', 300))
+
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', '/tmp/akti_cache'),
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', 'akti_cache_table'),
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'akti-cache',
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+
+# In-memory columnar snapshot of the student financial fields (pos/analytics.py),
+# used by the revenue report's filter endpoint instead of a query per request.
+# Each process keeps its own copy, so leave it off on short-lived serverless workers.
+REPORT_SNAPSHOT = os.environ.get('REPORT_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
 from django.contrib.auth import logout
+from pos.admin import cache_stats_view
 
 def root_redirect(request):
     user = getattr(request, 'user', None)
@@ -33,6 +34,7 @@ def root_redirect(request):
 
 urlpatterns = [
     path('', root_redirect, name='root'),
+    path('admin/cache-stats/', admin.site.admin_view(cache_stats_view), name='cache_stats'),
     path('admin/', admin.site.urls),
     path('management/', include('portal.urls')),
     path('', include('pos.urls')),
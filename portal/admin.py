@@ -12,6 +12,10 @@ class TrainerAdmin(admin.ModelAdmin):
     search_fields = ['name', 'user__username', 'user__email']
     readonly_fields = ['created_at', 'updated_at']
     
+    def get_queryset(self, request):
+        # Course and student counts annotated instead of counted per row
+        return super().get_queryset(request).select_related('user').with_stats()
+    
     def username(self, obj):
         return obj.user.username
     username.short_description = 'Username'
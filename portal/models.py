@@ -1,10 +1,30 @@
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from pos.models import Course, Student, Batch
 
 
+class TrainerQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate num_courses and num_students (backing assigned_courses_count/total_students)
+        
+        num_students counts, for every assignment, the students enrolled in
+        its course, as total_students always has; a subquery keeps the two
+        counts from multiplying each other.
+        """
+        enrolments = (
+            Student.courses.through.objects.filter(course__trainer_assignments__trainer=OuterRef('pk'))
+            .order_by().values('course__trainer_assignments__trainer').annotate(n=Count('pk')).values('n')
+        )
+        return self.annotate(
+            num_courses=Count('trainer_courses'),
+            num_students=Coalesce(Subquery(enrolments), 0),
+        )
+
+
 class Trainer(models.Model):
     """Model for storing trainer information"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='trainer_profile')
@@ -13,19 +33,22 @@ class Trainer(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = TrainerQuerySet.as_manager()
+    
     def __str__(self):
         return self.name
     
     @property
     def assigned_courses_count(self):
+        if hasattr(self, 'num_courses'):
+            return self.num_courses
         return self.trainer_courses.count()
     
     @property
     def total_students(self):
-        total = 0
-        for trainer_course in self.trainer_courses.all():
-            total += trainer_course.course.students.count()
-        return total
+        if hasattr(self, 'num_students'):
+            return self.num_students
+        return Trainer.objects.filter(pk=self.pk).with_stats().values_list('num_students', flat=True).get()
 
 
 class TrainerCourse(models.Model):
@@ -51,11 +74,8 @@ class TrainerCourse(models.Model):
     
     @property
     def total_lectures(self):
-        """Calculate total lectures based on course duration"""
-        if '1_month' in self.course.duration:
-            return 12
-        else:  # weekend or weekdays
-            return 24
+        """Total lectures for the course format (precomputed on Course from its duration)"""
+        return self.course.lectures_required
     
     @property
     def completed_lectures(self):
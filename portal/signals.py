@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from pos.cache import invalidate
+from .models import Attendance, Lecture, Trainer, TrainerCourse, TrainerQuestion, TrainerWeeklyFeedback
+
+
+ATTENDANCE_MODELS = (Trainer, TrainerCourse, Lecture, Attendance)
+FEEDBACK_MODELS = (TrainerWeeklyFeedback, TrainerQuestion)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_attendance_domain(sender, **kwargs):
+    """Invalidate cached portal fragments when trainers, assignments or attendance change."""
+    if sender in ATTENDANCE_MODELS:
+        invalidate('attendance')
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_feedback_domain(sender, **kwargs):
+    """Invalidate feedback validators when weekly feedback or its questions change."""
+    if sender in FEEDBACK_MODELS:
+        invalidate('feedback')
@@ -0,0 +1,75 @@
+"""
+Background tasks of the portal app, run by `manage.py run_worker` (see pos/jobs.py).
+"""
+from datetime import date, timedelta
+
+from django.db.models import Count
+from django.utils import timezone
+
+from pos.cache import cached, invalidate, is_shared
+from pos.jobs import task
+from pos.scheduler import periodic
+from .models import Lecture, TrainerCourse, TrainerWeeklyFeedback
+
+
+@periodic(cron='1 0 * * 1', jitter=60)
+@task('portal.create_feedback_stubs')
+def create_feedback_stubs(week_start=None):
+    """Create (or refresh the class counts of) the weekly feedback stubs of all active assignments
+
+    `week_start` is an ISO date string; the current week by default. Uses a
+    fixed number of queries however many assignments there are.
+    """
+    if week_start:
+        week_start = date.fromisoformat(week_start)
+    else:
+        today = timezone.now().date()
+        week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+
+    assignments = list(TrainerCourse.objects.filter(is_active=True).values_list('id', 'trainer_id', 'schedule'))
+    # Distinct lecture days with any attendance this week, per assignment
+    held = dict(
+        Lecture.objects.filter(date__gte=week_start, date__lte=week_end, attendances__isnull=False)
+        .values('trainer_course').annotate(days=Count('date', distinct=True)).values_list('trainer_course', 'days')
+    )
+    existing = {
+        feedback.trainer_course_id: feedback
+        for feedback in TrainerWeeklyFeedback.objects.filter(week_start=week_start)
+    }
+
+    created, changed = [], []
+    for trainer_course_id, trainer_id, schedule in assignments:
+        required = 2 if schedule == 'weekend' else 3
+        classes_held = held.get(trainer_course_id, 0)
+        feedback = existing.get(trainer_course_id)
+        if feedback is None:
+            created.append(TrainerWeeklyFeedback(
+                trainer_course_id=trainer_course_id, trainer_id=trainer_id, week_start=week_start,
+                week_end=week_end, classes_required=required, classes_held=classes_held,
+            ))
+        elif (feedback.classes_held, feedback.classes_required) != (classes_held, required):
+            feedback.classes_held = classes_held
+            feedback.classes_required = required
+            changed.append(feedback)
+
+    # ignore_conflicts: a dashboard request may have created the same stub meanwhile
+    TrainerWeeklyFeedback.objects.bulk_create(created, ignore_conflicts=True)
+    TrainerWeeklyFeedback.objects.bulk_update(changed, ['classes_held', 'classes_required'])
+    if created or changed:
+        # bulk writes skip the signals that invalidate cached fragments
+        invalidate('feedback')
+    return {'week_start': week_start.isoformat(), 'created': len(created), 'updated': len(changed)}
+
+
+@periodic(every=timedelta(minutes=10), jitter=60)
+@task('portal.warm_dashboard')
+def warm_dashboard():
+    """Build the portal admin dashboard fragment if it is missing from the cache"""
+    if not is_shared():
+        # See pos.warm_dashboards
+        return {'skipped': 'process-local cache'}
+    from .views import _build_admin_dashboard_context
+
+    cached('portal_dashboard', _build_admin_dashboard_context)
+    return ['portal_dashboard']
@@ -0,0 +1,37 @@
+from pos.testing import QueryBudgetTestCase
+
+
+class PortalQueryBudgetTests(QueryBudgetTestCase):
+    """Query budgets for the portal views (see pos/testing.py)."""
+
+    BUDGETS = [
+        {'name': 'portal:admin_dashboard', 'role': 'admin', 'budget': 10},
+        {'name': 'portal:trainer_management', 'role': 'admin', 'budget': 14},
+        {'name': 'portal:trainer_add', 'role': 'admin', 'budget': 4},
+        {'name': 'portal:trainer_edit', 'role': 'admin', 'budget': 6, 'args': ['trainer']},
+        {'name': 'portal:course_assignment', 'role': 'admin', 'budget': 12},
+        {'name': 'portal:course_assignment_form', 'role': 'admin', 'budget': 7},
+        {'name': 'portal:individual_attendance', 'role': 'admin', 'budget': 5},
+        {'name': 'portal:student_details', 'role': 'admin', 'budget': 10, 'args': ['student']},
+        {'name': 'portal:course_attendance_report', 'role': 'admin', 'budget': 7},
+        {'name': 'portal:batch_attendance_report', 'role': 'admin', 'budget': 15},
+        {'name': 'portal:admin_feedback_list', 'role': 'admin', 'budget': 7},
+        {'name': 'portal:admin_feedback_trainer', 'role': 'admin', 'budget': 6, 'args': ['trainer']},
+        {'name': 'portal:admin_feedback_trainer_course', 'role': 'admin', 'budget': 7, 'args': ['trainer_course']},
+        {'name': 'portal:download_report_no_id', 'role': 'admin', 'budget': 35, 'args': ['all']},
+        {'name': 'portal:trainer_dashboard', 'role': 'trainer', 'budget': 26},
+        {'name': 'portal:trainer_course_detail', 'role': 'trainer', 'budget': 14, 'args': ['trainer_course']},
+        {'name': 'portal:mark_attendance', 'role': 'trainer', 'budget': 10, 'args': ['lecture']},
+        {'name': 'portal:trainer_reports', 'role': 'trainer', 'budget': 18},
+        {'name': 'portal:trainer_profile', 'role': 'trainer', 'budget': 5},
+        {'name': 'portal:trainer_feedback_pending', 'role': 'trainer', 'budget': 7},
+        {'name': 'portal:portal_dashboard', 'role': 'admin', 'budget': 2},
+        {'name': 'portal:portal_dashboard', 'role': 'trainer', 'budget': 3},
+        {'name': 'portal:download_report', 'role': 'admin', 'budget': 33, 'args': ['course', 'course']},
+        {'name': 'portal:download_report', 'role': 'admin', 'budget': 33, 'args': ['batch', 'batch']},
+        # Last: opening attendance creates the next lecture
+        {'name': 'portal:trainer_start_attendance', 'role': 'trainer', 'budget': 17, 'args': ['trainer_course']},
+    ]
+    # Not budgeted: trainer_weeks, trainer_week_detail, trainer_assignment_new,
+    # trainer_quiz_form and trainer_quiz_assessments are UI scaffolds whose
+    # templates do not exist yet; they cannot render until those are added.
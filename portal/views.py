@@ -22,6 +22,7 @@ from .forms import (
     TrainerEditForm, TrainerSelfProfileForm
 )
 from pos.models import Course, Student, Batch
+from pos.cache import cached, conditional
 def _renumber_lectures_for_assignment(trainer_course: TrainerCourse) -> None:
     """Ensure lecture_number reflects chronological order for a given trainer_course.
     Performs a two-phase renumber to avoid unique_together collisions.
@@ -98,18 +99,23 @@ def portal_dashboard(request):
         return redirect('portal:portal_login')
 
 
-@login_required
-@user_passes_test(is_admin)
-def admin_dashboard(request):
-    """Admin dashboard for attendance management"""
-    context = {
+def _build_admin_dashboard_context():
+    """Compute the portal admin dashboard context (cached, see admin_dashboard)"""
+    return {
         'total_trainers': Trainer.objects.filter(is_active=True).count(),
         'total_courses': Course.objects.count(),
         'total_students': Student.objects.count(),
         'total_batches': Batch.objects.count(),
-        'recent_assignments': TrainerCourse.objects.select_related('trainer', 'course').order_by('-assigned_at')[:5],
-        'recent_lectures': Lecture.objects.select_related('trainer_course__trainer', 'trainer_course__course').order_by('-created_at')[:5],
+        'recent_assignments': list(TrainerCourse.objects.select_related('trainer', 'course').order_by('-assigned_at')[:5]),
+        'recent_lectures': list(Lecture.objects.select_related('trainer_course__trainer', 'trainer_course__course').order_by('-created_at')[:5]),
     }
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_dashboard(request):
+    """Admin dashboard for attendance management"""
+    context = cached('portal_dashboard', _build_admin_dashboard_context)
     return render(request, 'portal/admin/dashboard.html', context)
 
 
@@ -117,7 +123,7 @@ def admin_dashboard(request):
 @user_passes_test(is_admin)
 def trainer_management(request):
     """Admin view for managing trainers"""
-    trainers = Trainer.objects.select_related('user').all()
+    trainers = Trainer.objects.select_related('user').with_stats()
     
     # Remove inline creation; use dedicated add page instead
     form = TrainerCreationForm()
@@ -356,7 +362,7 @@ def batch_attendance_report(request):
         ).select_related('student', 'lecture__trainer_course__course', 'marked_by')
     
     # Additional context for trainers and their assigned courses
-    trainers = Trainer.objects.select_related('user').all()
+    trainers = Trainer.objects.select_related('user').with_stats()
     courses_by_trainer = {}
     for t in trainers:
         courses_by_trainer[t] = TrainerCourse.objects.filter(trainer=t, is_active=True).select_related('course', 'batch')
@@ -370,6 +376,44 @@ def batch_attendance_report(request):
     return render(request, 'portal/admin/batch_attendance_report.html', context)
 
 
+def _weekly_feedback(assigned_courses, today):
+    """Yield (assignment, feedback, classes held, classes required) for this week, per assignment
+
+    The week's feedback stubs are created ahead of time by the scheduled
+    portal.create_feedback_stubs task; a stub is only created here for an
+    assignment made since it last ran. Classes held (distinct lecture days
+    with attendance) come from one grouped query and are written back only
+    when they changed, so polling does not invalidate cached feedback.
+    """
+    week_start = today - timedelta(days=today.weekday())  # Monday as start of ISO week
+    week_end = week_start + timedelta(days=6)
+    held_by_assignment = dict(
+        Lecture.objects.filter(
+            trainer_course__in=assigned_courses, date__gte=week_start, date__lte=week_end, attendances__isnull=False,
+        ).values('trainer_course').annotate(days=Count('date', distinct=True)).values_list('trainer_course', 'days')
+    )
+    stubs = {
+        feedback.trainer_course_id: feedback
+        for feedback in TrainerWeeklyFeedback.objects.filter(trainer_course__in=assigned_courses, week_start=week_start)
+    }
+    for tc in assigned_courses:
+        required = 2 if (tc.schedule == 'weekend') else 3
+        held = held_by_assignment.get(tc.id, 0)
+        feedback = stubs.get(tc.id)
+        if feedback is None:
+            feedback, _ = TrainerWeeklyFeedback.objects.get_or_create(
+                trainer_course=tc,
+                trainer_id=tc.trainer_id,
+                week_start=week_start,
+                defaults={'week_end': week_end, 'classes_required': required, 'classes_held': held},
+            )
+        if feedback.classes_held != held or feedback.classes_required != required:
+            feedback.classes_held = held
+            feedback.classes_required = required
+            feedback.save(update_fields=['classes_held', 'classes_required'])
+        yield tc, feedback, held, required
+
+
 @login_required
 @user_passes_test(is_trainer)
 def trainer_dashboard(request):
@@ -386,45 +430,10 @@ def trainer_dashboard(request):
     today = timezone.now().date()
     todays_lectures = Lecture.objects.filter(trainer_course__trainer=trainer, date=today, attendances__isnull=False).distinct().count()
     # Compute pending weekly feedbacks for modal enforcement
-    def _iso_week_bounds(date_obj):
-        # Monday as start of ISO week
-        start = date_obj - timedelta(days=date_obj.weekday())
-        end = start + timedelta(days=6)
-        return start, end
-
-    today = timezone.now().date()
-    week_start, week_end = _iso_week_bounds(today)
-
-    # Find assignments with required classes reached this week (consider schedule)
     pending_feedbacks = []
-    for tc in assigned_courses:
-        schedule = getattr(tc, 'schedule', None)
-        required = 2 if (schedule == 'weekend') else 3
-        # Count distinct lecture days with any attendance in this ISO week
-        held = Lecture.objects.filter(
-            trainer_course=tc,
-            date__gte=week_start,
-            date__lte=week_end,
-            attendances__isnull=False,
-        ).values('date').distinct().count()
-        # Create or get feedback stub for this week
-        feedback, created = TrainerWeeklyFeedback.objects.get_or_create(
-            trainer_course=tc,
-            trainer=tc.trainer,
-            week_start=week_start,
-            defaults={
-                'week_end': week_end,
-                'classes_required': required,
-                'classes_held': held,
-            }
-        )
-        # Update counts if changed
-        if not created and feedback.classes_held != held:
-            feedback.classes_held = held
-            feedback.classes_required = required
-            feedback.save(update_fields=['classes_held', 'classes_required'])
+    for tc, feedback, held, required in _weekly_feedback(assigned_courses, today):
         # Determine if it should be enforced now
-        is_weekdays = (schedule != 'weekend')
+        is_weekdays = (tc.schedule != 'weekend')
         enforce_day = 5 if is_weekdays else 0  # Saturday (5) or Monday (0)
         # Relax: open if forced by admin regardless of day, otherwise on configured day with >=1 class
         should_enforce = (
@@ -465,7 +474,7 @@ def trainer_course_detail(request, trainer_course_id):
     
     # Get students enrolled in this course (respect batch and schedule)
     schedule = getattr(trainer_course, 'schedule', None)
-    students = _students_for_assignment(trainer_course.course, trainer_course.batch, schedule)
+    students = _students_for_assignment(trainer_course.course, trainer_course.batch, schedule).select_related('batch')
     
     context = {
         'trainer_course': trainer_course,
@@ -532,7 +541,7 @@ def trainer_create_attendance_for_date(request, trainer_course_id):
         return JsonResponse({'success': False, 'message': 'Invalid method'}, status=405)
 
     trainer = request.user.trainer_profile
-    trainer_course = get_object_or_404(TrainerCourse, id=trainer_course_id, trainer=trainer)
+    trainer_course = get_object_or_404(TrainerCourse.objects.select_related('course'), id=trainer_course_id, trainer=trainer)
 
     try:
         payload = json.loads(request.body or '{}')
@@ -561,7 +570,7 @@ def trainer_create_attendance_for_date(request, trainer_course_id):
         start_dt = now_local
     else:
         start_dt = pk_tz.localize(datetime.combine(target_date, default_start.timetz()))
-    duration_minutes = 60 if ('1_month' in (trainer_course.course.duration or '')) else 90
+    duration_minutes = trainer_course.course.slot_minutes
     end_dt = start_dt + timedelta(minutes=duration_minutes)
 
     lecture = Lecture.objects.create(
@@ -580,7 +589,7 @@ def trainer_create_attendance_for_date(request, trainer_course_id):
 def trainer_start_attendance(request, trainer_course_id):
     """Create or resume the next lecture for the trainer's course and redirect to mark_attendance."""
     trainer = request.user.trainer_profile
-    trainer_course = get_object_or_404(TrainerCourse, id=trainer_course_id, trainer=trainer)
+    trainer_course = get_object_or_404(TrainerCourse.objects.select_related('course'), id=trainer_course_id, trainer=trainer)
 
     # Stop if course is already completed
     if trainer_course.completed_lectures >= trainer_course.total_lectures:
@@ -599,8 +608,8 @@ def trainer_start_attendance(request, trainer_course_id):
     else:
         today = timezone.now().date()
         start_dt = timezone.now()
-        # Duration: default 90 minutes; for 1 month courses use 60
-        duration_minutes = 60 if ('1_month' in (trainer_course.course.duration or '')) else 90
+        # Duration: 90 minutes; 60 for 1 month courses (Course.slot_minutes)
+        duration_minutes = trainer_course.course.slot_minutes
         end_dt = start_dt + timedelta(minutes=duration_minutes)
         lecture = Lecture.objects.create(
             trainer_course=trainer_course,
@@ -619,7 +628,7 @@ def trainer_start_attendance(request, trainer_course_id):
 def mark_attendance(request, lecture_id):
     """Trainer view for marking attendance"""
     trainer = request.user.trainer_profile
-    lecture = get_object_or_404(Lecture, id=lecture_id, trainer_course__trainer=trainer)
+    lecture = get_object_or_404(Lecture.objects.select_related('trainer_course__course'), id=lecture_id, trainer_course__trainer=trainer)
     
     if request.method == 'POST':
         # Handle bulk attendance submission
@@ -639,7 +648,7 @@ def mark_attendance(request, lecture_id):
         target_date = selected_date or lecture.date
         if target_date == now_local.date():
             # Determine slot end
-            duration_minutes = 60 if ('1_month' in (lecture.trainer_course.course.duration or '')) else 90
+            duration_minutes = lecture.trainer_course.course.slot_minutes
             if lecture.end_time:
                 end_dt = pk_tz.localize(datetime.combine(target_date, lecture.end_time))
             else:
@@ -686,7 +695,7 @@ def mark_attendance(request, lecture_id):
         if not Attendance.objects.filter(lecture=lecture).exists():
             pk_tz = pytz.timezone('Asia/Karachi')
             now = timezone.now().astimezone(pk_tz)
-            duration_minutes = 60 if ('1_month' in (lecture.trainer_course.course.duration or '')) else 90
+            duration_minutes = lecture.trainer_course.course.slot_minutes
             new_end = now + timedelta(minutes=duration_minutes)
             lecture.date = selected_date or now.date()
             lecture.start_time = now.time().replace(second=0, microsecond=0)
@@ -738,20 +747,20 @@ def mark_attendance(request, lecture_id):
     existing_attendance = {}
     attendance_counts = {"present": 0, "absent": 0}
     for attendance in Attendance.objects.filter(lecture=lecture):
-        existing_attendance[attendance.student.id] = {
+        existing_attendance[attendance.student_id] = {
             'status': attendance.status
         }
         if attendance.status in attendance_counts:
             attendance_counts[attendance.status] += 1
     
-    # Build per-student attendance history for this course
-    attendance_history = {}
-    for student in students:
-        records = Attendance.objects.filter(
-            student=student,
-            lecture__trainer_course__course=lecture.trainer_course.course
-        ).select_related('lecture').order_by('-lecture__date')
-        attendance_history[student.id] = list(records)
+    # Build per-student attendance history for this course (one query for all students)
+    attendance_history = {student.id: [] for student in students}
+    records = Attendance.objects.filter(
+        student__in=students,
+        lecture__trainer_course__course=lecture.trainer_course.course
+    ).select_related('lecture').order_by('-lecture__date')
+    for record in records:
+        attendance_history[record.student_id].append(record)
 
     # Prepare previous lectures (exclude current) for horizontal history columns (respect batch)
     # Only get lectures from the same trainer course assignment (same batch and schedule)
@@ -895,33 +904,15 @@ def ajax_mark_attendance(request):
 
 @login_required
 @user_passes_test(is_trainer)
+@conditional('attendance', 'feedback', extra=lambda request: timezone.now().date())
 def trainer_feedback_pending(request):
     """Return pending feedback stubs for current week per assignment, used by dashboard JS."""
     trainer = request.user.trainer_profile
     today = timezone.now().date()
-    week_start = today - timedelta(days=today.weekday())
-    week_end = week_start + timedelta(days=6)
-    assigned_courses = TrainerCourse.objects.filter(trainer=trainer, is_active=True)
+    assigned_courses = TrainerCourse.objects.filter(trainer=trainer, is_active=True).select_related('course', 'batch')
     items = []
-    for tc in assigned_courses:
-        schedule = getattr(tc, 'schedule', None)
-        required = 2 if (schedule == 'weekend') else 3
-        held = Lecture.objects.filter(
-            trainer_course=tc,
-            date__gte=week_start,
-            date__lte=week_end,
-            attendances__isnull=False,
-        ).values('date').distinct().count()
-        feedback, _ = TrainerWeeklyFeedback.objects.get_or_create(
-            trainer_course=tc,
-            trainer=trainer,
-            week_start=week_start,
-            defaults={'week_end': week_end, 'classes_required': required, 'classes_held': held}
-        )
-        feedback.classes_held = held
-        feedback.classes_required = required
-        feedback.save(update_fields=['classes_held', 'classes_required'])
-        is_weekdays = (schedule != 'weekend')
+    for tc, feedback, held, required in _weekly_feedback(assigned_courses, today):
+        is_weekdays = (tc.schedule != 'weekend')
         enforce_day = 5 if is_weekdays else 0
         # If forced, ignore day; else respect enforcement day with >=1 class
         if (feedback.force_open or ((held >= 1) and (today.weekday() == enforce_day))) and (not feedback.is_submitted):
@@ -982,7 +973,7 @@ def trainer_feedback_submit(request):
 @user_passes_test(is_admin)
 def admin_feedback_list(request):
     """Admin landing: list all active trainers."""
-    trainers = Trainer.objects.filter(is_active=True).order_by('name')
+    trainers = Trainer.objects.filter(is_active=True).with_stats().order_by('name')
     context = {'trainers': trainers}
     return render(request, 'portal/admin/feedback_list.html', context)
 
@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from .models import *
+from .cache import get_stats, reset_stats
 
 # Custom admin classes
 class StudentInvoiceAdmin(admin.ModelAdmin):
@@ -18,9 +22,77 @@ class StudentAdmin(admin.ModelAdmin):
     search_fields = ('name', 'phone_number', 'cnic')
     readonly_fields = ('created_at', 'updated_at')
 
+class InvoiceSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('invoice_number', 'student', 'invoice_type', 'amount', 'csr_name', 'issued_at', 'regenerated_at')
+    list_filter = ('invoice_type', 'issued_at')
+    search_fields = ('invoice_number', 'student__name')
+    exclude = ('html',)
+    readonly_fields = ('student', 'invoice_type', 'invoice_number', 'amount', 'csr_name', 'issued_at', 'regenerated_at')
+    
+    def get_queryset(self, request):
+        # The compressed HTML is only needed for reprints
+        return super().get_queryset(request).select_related('student').defer('html')
+
+class PaymentAdmin(admin.ModelAdmin):
+    list_display = ('student', 'kind', 'amount', 'method', 'paid_at', 'csr')
+    list_filter = ('kind', 'method', 'paid_at')
+    search_fields = ('student__name', 'student__phone_number')
+    raw_id_fields = ('student', 'csr')
+    date_hierarchy = 'paid_at'
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('student', 'csr')
+    
+    def has_change_permission(self, request, obj=None):
+        # Ledger rows are never edited: correct a payment with a reversal
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'status', 'priority', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'locked_by')
+    readonly_fields = ('attempts', 'locked_by', 'locked_at', 'result', 'error', 'created_by', 'created_at', 'finished_at')
+
+class PeriodicTaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'schedule', 'enabled', 'next_run_at', 'last_started_at', 'last_status', 'last_duration', 'run_count')
+    list_filter = ('enabled', 'last_status')
+    list_editable = ('enabled',)
+    readonly_fields = ('name', 'schedule', 'last_started_at', 'last_duration', 'last_status', 'last_result', 'last_error', 'run_count')
+    actions = ['run_now']
+    
+    def has_add_permission(self, request):
+        # Rows come from the registry in pos/scheduler.py
+        return False
+    
+    @admin.action(description='Run at the next scheduler tick')
+    def run_now(self, request, queryset):
+        updated = queryset.update(next_run_at=timezone.now())
+        self.message_user(request, f'{updated} task(s) will run at the next tick.')
+
 # Register your models here.
 admin.site.register(Course)
 admin.site.register(Student, StudentAdmin)
 admin.site.register(CSRProfile)
 admin.site.register(InvoiceSettings)
 admin.site.register(StudentInvoice, StudentInvoiceAdmin)
+admin.site.register(InvoiceSnapshot, InvoiceSnapshotAdmin)
+admin.site.register(Payment, PaymentAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(PeriodicTask, PeriodicTaskAdmin)
+
+
+# Cache statistics page (linked from the admin index)
+def cache_stats_view(request):
+    """Show hit/miss counters of the dashboard/reference-data cache"""
+    if request.method == 'POST':
+        reset_stats()
+        return redirect('cache_stats')
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Cache statistics',
+        'stats': get_stats(),
+    }
+    return TemplateResponse(request, 'admin/cache_stats.html', context)
@@ -0,0 +1,394 @@
+"""
+In-memory columnar snapshot of the student financial fields, for the
+interactive report filters (enabled with settings.REPORT_SNAPSHOT).
+
+Each process loads the columns once into compact typed arrays:
+- batch and creating CSR;
+- course membership;
+- registration date, the amounts and the payment status;
+- the payment ledger (student, date, amount).
+After that it only re-reads the students whose updated_at moved and the
+payments added since. A filter is a boolean mask over the columns and a
+group-by is a sum under a mask. Both use NumPy when it is installed and the
+standard array module otherwise, and neither touches the database.
+
+Writes that bypass Student.save() must set updated_at for the snapshot to
+see them. StudentQuerySet._transition, refresh_course_cache, the course
+m2m signal and ChunkedCommand.update_in_chunks do. Deleted students or
+payments show up in the row counts, which trigger a full reload.
+"""
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+from itertools import compress
+
+from django.utils import timezone
+
+from .cache import get_versions
+from .models import Payment, Student
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Per-student columns and their array typecodes; dates are ordinals, 0 when missing
+COLUMNS = {
+    'batch': 'q',
+    'creator': 'q',
+    'registered': 'q',
+    'discounted_price': 'q',
+    'balance': 'q',
+    'paid': 'b',
+}
+# Per-payment columns: the student's position in the student columns, the date and the amount
+PAYMENT_COLUMNS = ('student', 'paid_on', 'amount')
+# Columns holding codes into Snapshot.keys rather than values
+KEYED = ('batch', 'creator')
+
+# Rows changed (or payments added) since the last refresh are re-read with this overlap, to catch
+# transactions that committed after a later one
+REFRESH_OVERLAP = timedelta(seconds=5)
+# Seconds between checks for changes while the 'students' cache version stays the same
+REFRESH_INTERVAL = 2.0
+# More changed rows than this are read with a full reload instead
+MAX_INCREMENTAL = 10000
+
+FIELDS = (
+    'id', 'batch_id', 'created_by_id', 'created_at', 'discounted_price', 'balance', 'payment_status', 'updated_at',
+)
+
+
+class _ArrayOps:
+    """Masks as lists of bools over array.array columns"""
+
+    @staticmethod
+    def column(values, typecode):
+        return array(typecode, values)
+
+    @staticmethod
+    def everything(size):
+        return [True] * size
+
+    @staticmethod
+    def nothing(size):
+        return [False] * size
+
+    @staticmethod
+    def equals(column, value):
+        return [item == value for item in column]
+
+    @staticmethod
+    def between(column, low, high):
+        return [low <= item <= high for item in column]
+
+    @staticmethod
+    def take(column, positions):
+        return [column[position] for position in positions]
+
+    @staticmethod
+    def scatter(size, positions, mask):
+        result = [False] * size
+        for position in compress(positions, mask):
+            result[position] = True
+        return result
+
+    @staticmethod
+    def both(mask, other):
+        return [a and b for a, b in zip(mask, other)]
+
+    @staticmethod
+    def either(mask, other):
+        return [a or b for a, b in zip(mask, other)]
+
+    @staticmethod
+    def total(mask, column=None):
+        return sum(compress(column, mask)) if column is not None else sum(mask)
+
+    @staticmethod
+    def group(codes, size, mask, column=None):
+        totals = [0] * size
+        if column is None:
+            for code in compress(codes, mask):
+                totals[code] += 1
+        else:
+            for code, value in compress(zip(codes, column), mask):
+                totals[code] += value
+        return totals
+
+
+class _NumpyOps:
+    """Masks as NumPy boolean arrays"""
+
+    @staticmethod
+    def column(values, typecode):
+        column = numpy.array(values)
+        return column.astype(bool) if typecode == 'b' else column
+
+    @staticmethod
+    def everything(size):
+        return numpy.ones(size, dtype=bool)
+
+    @staticmethod
+    def nothing(size):
+        return numpy.zeros(size, dtype=bool)
+
+    @staticmethod
+    def equals(column, value):
+        return column == value
+
+    @staticmethod
+    def between(column, low, high):
+        return (column >= low) & (column <= high)
+
+    @staticmethod
+    def take(column, positions):
+        return column[positions]
+
+    @staticmethod
+    def scatter(size, positions, mask):
+        result = numpy.zeros(size, dtype=bool)
+        result[positions[mask]] = True
+        return result
+
+    @staticmethod
+    def both(mask, other):
+        return mask & other
+
+    @staticmethod
+    def either(mask, other):
+        return mask | other
+
+    @staticmethod
+    def total(mask, column=None):
+        return int(column[mask].sum()) if column is not None else int(numpy.count_nonzero(mask))
+
+    @staticmethod
+    def group(codes, size, mask, column=None):
+        weights = column[mask] if column is not None else None
+        return [int(total) for total in numpy.bincount(codes[mask], weights=weights, minlength=size)]
+
+
+class Frame:
+    """An immutable view of the snapshot at one refresh, safe to query from any thread"""
+
+    def __init__(self, size, columns, courses, keys, payments, ops):
+        self.size = size
+        self.ops = ops
+        self.columns = {name: ops.column(column, COLUMNS[name]) for name, column in columns.items()}
+        self.payments = {name: ops.column(column, 'q') for name, column in payments.items()}
+        self.courses = {course_id: ops.column(members, 'b') for course_id, members in courses.items()}
+        self.keys = {name: list(values) for name, values in keys.items()}
+        self.codes = {name: {key: code for code, key in enumerate(values)} for name, values in self.keys.items()}
+
+    def mask(self, everyone=True, creator=None, batch=None, course=None, payment_status=None):
+        """Students matching the filters; `creator` (a CSR id or None) applies unless `everyone`"""
+        ops = self.ops
+        mask = ops.everything(self.size)
+        filters = [] if everyone else [('creator', creator)]
+        if batch is not None:
+            filters.append(('batch', batch))
+        for name, value in filters:
+            if value not in self.codes[name]:
+                return ops.nothing(self.size)
+            mask = ops.both(mask, ops.equals(self.columns[name], self.codes[name][value]))
+        if course is not None:
+            if course not in self.courses:
+                return ops.nothing(self.size)
+            mask = ops.both(mask, self.courses[course])
+        if payment_status:
+            mask = ops.both(mask, ops.equals(self.columns['paid'], payment_status == 'paid'))
+        return mask
+
+    def between(self, name, start=None, end=None, payments=False):
+        """Students (or payments) whose date column `name` is within start..end (inclusive)"""
+        low = start.toordinal() if start else 1
+        high = end.toordinal() if end else date.max.toordinal()
+        return self.ops.between((self.payments if payments else self.columns)[name], low, high)
+
+    def _payments_of(self, mask, start, end):
+        positions = self.payments['student']
+        return self.ops.both(self.ops.take(mask, positions), self.between('paid_on', start, end, payments=True))
+
+    def paid(self, start=None, end=None):
+        """Students with a payment received within start..end"""
+        payments = self._payments_of(self.ops.everything(self.size), start, end)
+        return self.ops.scatter(self.size, self.payments['student'], payments)
+
+    def total(self, mask, column=None):
+        """Sum of `column` (the number of students when None) under `mask`"""
+        return self.ops.total(mask, self.columns[column] if column else None)
+
+    def group(self, by, mask, column=None):
+        """{key: sum of `column` (or count) under `mask`} by 'batch', 'creator' or 'course'
+
+        A student in several courses counts under each of them. Keys with
+        no students under the mask are left out.
+        """
+        values = self.columns[column] if column else None
+        if by == 'course':
+            totals = {course_id: self.ops.total(self.ops.both(mask, members), values)
+                      for course_id, members in self.courses.items()}
+        else:
+            keys = self.keys[by]
+            totals = dict(zip(keys, self.ops.group(self.columns[by], len(keys), mask, values)))
+        if column is None:
+            return {key: total for key, total in totals.items() if total}
+        counts = self.group(by, mask)
+        return {key: total for key, total in totals.items() if key in counts}
+
+    def received(self, by, mask, start=None, end=None):
+        """{key: amount received within start..end} from the payments of the students under `mask`"""
+        ops, positions, amounts = self.ops, self.payments['student'], self.payments['amount']
+        payments = self._payments_of(mask, start, end)
+        if by == 'course':
+            totals = {course_id: ops.total(ops.both(payments, ops.take(members, positions)), amounts)
+                      for course_id, members in self.courses.items()}
+        else:
+            keys = self.keys[by]
+            totals = dict(zip(keys, ops.group(ops.take(self.columns[by], positions), len(keys), payments, amounts)))
+        return {key: total for key, total in totals.items() if total}
+
+
+class Snapshot:
+    """The columns of every student and payment, kept up to date by refresh()"""
+
+    def __init__(self, ops=None):
+        self.ops = ops or (_NumpyOps if numpy is not None else _ArrayOps)
+        self._clear()
+
+    def _clear(self):
+        self.rows = {}
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.courses = {}
+        self.keys = {name: [] for name in KEYED}
+        self._codes = {name: {} for name in KEYED}
+        self.payment_ids = set()
+        self.payments = {name: array('q') for name in PAYMENT_COLUMNS}
+        self.loaded_until = None
+        self.payments_until = None
+        self.version = None
+        self.checked_at = 0.0
+        self.frame = None
+
+    def load(self):
+        """Read every student and payment"""
+        self._clear()
+        self.version = get_versions(['students'])[0]
+        self._read(Student.objects.all(), Student.courses.through.objects.all(), Payment.objects.all())
+        self.checked_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """Re-read the students changed and the payments added since the last read
+
+        A full reload when students or payments were deleted, or too many changed.
+        """
+        version = get_versions(['students'])[0]
+        if not force and version == self.version and time.monotonic() - self.checked_at < REFRESH_INTERVAL:
+            return
+        self.version = version
+        self.checked_at = time.monotonic()
+        if self.loaded_until is None:
+            return self.load()
+        changed = Student.objects.filter(updated_at__gte=self.loaded_until - REFRESH_OVERLAP)
+        ids = list(changed.values_list('id', flat=True)[:MAX_INCREMENTAL + 1])
+        if len(ids) > MAX_INCREMENTAL:
+            return self.load()
+        payments = Payment.objects.all()
+        if self.payments_until is not None:
+            payments = payments.filter(created_at__gte=self.payments_until - REFRESH_OVERLAP)
+        self._read(
+            Student.objects.filter(id__in=ids), Student.courses.through.objects.filter(student_id__in=ids),
+            payments, read_students=bool(ids),
+        )
+        if len(self.rows) != Student.objects.count() or len(self.payment_ids) != Payment.objects.count():
+            self.load()
+
+    def _read(self, students, memberships, payments, read_students=True):
+        changed = read_students and self._read_students(students, memberships)
+        changed = self._read_payments(payments) or changed
+        if changed or self.frame is None:
+            self.frame = Frame(len(self.rows), self.columns, self.courses, self.keys, self.payments, self.ops)
+
+    def _read_students(self, students, memberships):
+        columns = self.columns
+        changed = False
+        for (pk, batch_id, creator_id, created_at, discounted_price, balance,
+                payment_status, updated_at) in students.values_list(*FIELDS).iterator():
+            values = (
+                self._code('batch', batch_id),
+                self._code('creator', creator_id),
+                timezone.localtime(created_at).toordinal() if created_at else 0,
+                discounted_price, balance,
+                payment_status == 'paid',
+            )
+            position = self.rows.get(pk)
+            if position is None:
+                position = self.rows[pk] = len(self.rows)
+                for name, value in zip(COLUMNS, values):
+                    columns[name].append(value)
+                for members in self.courses.values():
+                    members.append(0)
+            else:
+                for name, value in zip(COLUMNS, values):
+                    columns[name][position] = value
+                for members in self.courses.values():
+                    members[position] = 0
+            changed = True
+            if self.loaded_until is None or updated_at > self.loaded_until:
+                self.loaded_until = updated_at
+        if changed:
+            for student_id, course_id in memberships.values_list('student_id', 'course_id').iterator():
+                if student_id not in self.rows:
+                    # Enrolled after the students were read; picked up by the next refresh
+                    continue
+                members = self.courses.get(course_id)
+                if members is None:
+                    members = self.courses[course_id] = array('b', bytes(len(self.rows)))
+                members[self.rows[student_id]] = 1
+        return changed
+
+    def _read_payments(self, payments):
+        # Payments are never edited: only new ones are added
+        changed = False
+        rows = payments.values_list('id', 'student_id', 'paid_at', 'amount', 'created_at')
+        for pk, student_id, paid_at, amount, created_at in rows.iterator():
+            position = self.rows.get(student_id)
+            if pk in self.payment_ids or position is None:
+                # Already read, or for a student the next refresh reads (the counts then differ)
+                continue
+            self.payment_ids.add(pk)
+            for name, value in zip(PAYMENT_COLUMNS, (position, timezone.localtime(paid_at).toordinal(), amount)):
+                self.payments[name].append(value)
+            changed = True
+            if self.payments_until is None or created_at > self.payments_until:
+                self.payments_until = created_at
+        return changed
+
+    def _code(self, name, value):
+        codes = self._codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.keys[name])
+            self.keys[name].append(value)
+        return code
+
+
+_snapshot = Snapshot()
+_lock = threading.Lock()
+
+
+def get_frame():
+    """This process's snapshot, brought up to date, as a Frame to query"""
+    with _lock:
+        _snapshot.refresh()
+        return _snapshot.frame
+
+
+def reset():
+    """Drop the snapshot; the next get_frame() reloads it"""
+    global _snapshot
+    with _lock:
+        _snapshot = Snapshot()
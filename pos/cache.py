@@ -0,0 +1,252 @@
+"""
+Versioned caching for dashboards and reference data.
+
+Every cached fragment depends on one or more data domains (students, batches,
+courses, ...). Each domain has a version number stored in the cache; the
+fragment key embeds the current version of all its domains. Model signals
+bump a domain's version whenever one of its rows is written (see
+pos/signals.py and portal/signals.py), so a stale fragment is never read
+again and simply expires. A write made inside a transaction bumps the version
+again once the transaction commits: until then other requests still read the
+old rows, and may have cached them under the intermediate version.
+
+Code that writes through QuerySet.update() or bulk_create() bypasses the
+model signals and must call invalidate() itself.
+
+JSON endpoints polled by the front end use the conditional() view decorator:
+their ETag is derived from the domain versions, so a repeat request for
+unchanged data is answered with 304 Not Modified without running the view.
+This needs a shared cache backend (see is_shared()); with the per-process
+local-memory cache the endpoints are served without validators.
+
+Expensive reports use single_flight(): identical concurrent requests (same
+fragment, same normalized parameters, same data version) wait for the first
+one to finish and share its result instead of all computing it.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.views.decorators.http import condition
+
+
+KEY_PREFIX = 'pos'
+
+# Data domains that can be invalidated independently
+DOMAINS = ('students', 'batches', 'courses', 'csrs', 'invoice_settings', 'attendance', 'feedback')
+
+# Cached fragments and the domains they are built from
+FRAGMENTS = {
+    'admin_dashboard': ('students', 'batches', 'courses', 'csrs'),
+    'csr_dashboard': ('students', 'batches', 'courses', 'csrs'),
+    'portal_dashboard': ('students', 'batches', 'courses', 'attendance'),
+    'batch_stats': ('students', 'batches'),
+    'filter_options': ('batches', 'courses'),
+    'widget_monthly_revenue': ('students',),
+    'widget_course_distribution': ('students', 'courses'),
+    'widget_csr_performance': ('students', 'csrs'),
+    'report_revenue': ('students', 'batches', 'courses'),
+    'commission_report': ('students', 'csrs'),
+}
+
+# Single-flight: how long a computation may hold the lock, and how often waiters poll
+LOCK_TIMEOUT = 60
+LOCK_POLL_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+def _version_key(domain):
+    return f'{KEY_PREFIX}:version:{domain}'
+
+
+def _stats_key(name, outcome):
+    return f'{KEY_PREFIX}:stats:{name}:{outcome}'
+
+
+def _initial_version():
+    # Start from a timestamp so an evicted version never reuses old fragment keys
+    return int(time.time() * 1000)
+
+
+def get_versions(domains):
+    """Return the current version number for each domain, initializing missing ones."""
+    keys = [_version_key(domain) for domain in domains]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _initial_version(), None)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+def _bump(domains):
+    for domain in domains:
+        key = _version_key(domain)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+def invalidate(*domains):
+    """Bump the version of the given domains so fragments built from them are rebuilt.
+
+    Inside a transaction the versions are bumped now (for reads later in the
+    same transaction) and again on commit.
+    """
+    _bump(domains)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(domains))
+
+
+def is_shared():
+    """Whether other processes see this process's cache entries (not so for the local-memory cache)"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def make_key(name, *parts):
+    """Build the cache key of a fragment from its name, domain versions and extra key parts."""
+    versions = get_versions(FRAGMENTS[name])
+    key = f"{KEY_PREFIX}:{name}:{'.'.join(str(v) for v in versions)}"
+    if parts:
+        key = f"{key}:{':'.join(str(p) for p in parts)}"
+    return key
+
+
+def fragment_etag(name, *parts):
+    """Return a quoted ETag that changes whenever the fragment's data versions change."""
+    return '"%s"' % hashlib.md5(make_key(name, *parts).encode()).hexdigest()
+
+
+def conditional(*domains, per_user=True, extra=None):
+    """View decorator answering 304 Not Modified while `domains` are unchanged.
+
+    The ETag covers the domain versions, the path and query string, the CSRF
+    cookie and (unless per_user=False) the requesting user. `extra(request)` can
+    add anything else the response depends on. Apply it below login_required
+    so anonymous requests are still redirected.
+
+    Without a shared cache each process keeps its own versions and never sees
+    writes handled by the others, so no validators are emitted at all.
+    """
+    def etag_func(request, *args, **kwargs):
+        parts = [request.path, sorted(request.GET.lists()), get_versions(domains),
+                 request.META.get('CSRF_COOKIE', '')]
+        if per_user:
+            parts.append(request.user.pk)
+        if extra:
+            parts.append(extra(request))
+        return hashlib.md5(repr(parts).encode()).hexdigest()
+
+    def decorator(view):
+        validated = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_shared():
+                return view(request, *args, **kwargs)
+            return validated(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _record(name, outcome):
+    key = _stats_key(name, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def cached(name, builder, *parts, timeout=DEFAULT_TIMEOUT):
+    """Return the cached value of fragment `name`, calling `builder()` on a miss.
+
+    Extra `parts` are appended to the key, e.g. a CSR id for per-user fragments.
+    """
+    key = make_key(name, *parts)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        _record(name, 'miss')
+        value = builder()
+        cache.set(key, value, timeout)
+    else:
+        _record(name, 'hit')
+    return value
+
+
+def single_flight(name, builder, *parts, timeout=DEFAULT_TIMEOUT, lock_timeout=LOCK_TIMEOUT):
+    """Like cached(), but concurrent misses for the same key run `builder()` only once.
+
+    The first request takes a cache lock (cache.add is atomic) and computes the
+    value; the others poll for the result until the lock is released or expires.
+    If the lock holder fails or times out, the next waiter takes over.
+    """
+    key = make_key(name, *parts)
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        _record(name, 'hit')
+        return value
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        if cache.add(lock_key, 1, lock_timeout):
+            try:
+                # Another request may have finished between our get and add
+                value = cache.get(key, _MISSING)
+                if value is _MISSING:
+                    _record(name, 'miss')
+                    value = builder()
+                    cache.set(key, value, timeout)
+                else:
+                    _record(name, 'hit')
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            _record(name, 'hit')
+            return value
+        if time.monotonic() > deadline:
+            # Lock holder is stuck; compute without the lock rather than fail the request
+            _record(name, 'miss')
+            value = builder()
+            cache.set(key, value, timeout)
+            return value
+
+
+def get_stats():
+    """Return hit/miss counters for every registered fragment."""
+    keys = {}
+    for name in FRAGMENTS:
+        keys[name] = (_stats_key(name, 'hit'), _stats_key(name, 'miss'))
+    found = cache.get_many([k for pair in keys.values() for k in pair])
+    stats = []
+    for name, (hit_key, miss_key) in keys.items():
+        hits = found.get(hit_key, 0)
+        misses = found.get(miss_key, 0)
+        total = hits + misses
+        stats.append({
+            'name': name,
+            'domains': ', '.join(FRAGMENTS[name]),
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits * 100 / total, 1) if total else 0,
+        })
+    return stats
+
+
+def reset_stats():
+    """Clear all hit/miss counters."""
+    cache.delete_many([_stats_key(name, outcome) for name in FRAGMENTS for outcome in ('hit', 'miss')])
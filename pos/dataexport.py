@@ -0,0 +1,255 @@
+"""
+Native data export and load (export_data / load_data commands).
+
+Each model is written to its own gzip-compressed JSON Lines file,
+<app_label>.<model_name>.jsonl.gz. The first line names the model and its
+columns; every following line is one row, a compact JSON array of the
+column values. Rows are streamed in primary-key order with .iterator(), so
+memory stays flat however large a table is. Tables are exported
+concurrently in a thread pool; each worker uses its own database connection,
+reading a snapshot exported from one REPEATABLE READ transaction, so child
+rows never reference parents missing from the dump. Without exportable
+snapshots (anything but Postgres) the tables are read one after the other
+in a single transaction.
+
+A manifest.json lists the exported models in load order (foreign key
+targets first) with their row counts. The loader follows that order and
+inserts the rows with bulk_create in chunks, inside one transaction.
+Replacing the existing rows is refused while tables outside the export
+still reference them.
+"""
+import base64
+import datetime
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+
+# Users with their groups and permissions (and the content types these point
+# at), the admin log referencing them, and the application data
+DEFAULT_LABELS = ('contenttypes', 'auth', 'admin', 'pos', 'portal')
+CHUNK_SIZE = 2000
+MANIFEST = 'manifest.json'
+
+
+class ReplaceError(Exception):
+    """Replacing the exported tables would orphan rows of tables outside the export."""
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder, keeping full microsecond precision, plus binary columns as base64
+    (what BinaryField.to_python reads)"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        if isinstance(o, (bytes, memoryview)):
+            return base64.b64encode(bytes(o)).decode('ascii')
+        return super().default(o)
+
+
+def resolve_models(labels=DEFAULT_LABELS):
+    """Return the concrete models selected by app labels or app_label.model_name labels.
+
+    Auto-created many-to-many tables are included when all the models they
+    link are selected.
+    """
+    selected = []
+    for label in labels:
+        if '.' in label:
+            selected.append(apps.get_model(label))
+        else:
+            selected.extend(apps.get_app_config(label).get_models())
+    selected = [model for model in dict.fromkeys(selected) if model._meta.managed and not model._meta.proxy]
+
+    for model in list(selected):
+        for field in model._meta.local_many_to_many:
+            through = field.remote_field.through
+            if through._meta.auto_created and field.related_model in selected and through not in selected:
+                selected.append(through)
+    return sort_models(selected)
+
+
+def sort_models(models):
+    """Order models so that every foreign key target comes before the models pointing at it"""
+    remaining = list(models)
+    ordered = []
+    while remaining:
+        for model in remaining:
+            targets = {
+                field.related_model for field in model._meta.concrete_fields
+                if field.is_relation and field.related_model is not model
+            }
+            if not targets & set(remaining):
+                ordered.append(model)
+                remaining.remove(model)
+                break
+        else:
+            # A cycle between models: keep the rest in the given order
+            # (Postgres checks foreign keys at commit, so this still loads)
+            ordered.extend(remaining)
+            break
+    return ordered
+
+
+def model_path(directory, model):
+    return os.path.join(directory, f'{model._meta.label_lower}.jsonl.gz')
+
+
+def export_model(model, directory, chunk_size=CHUNK_SIZE):
+    """Write one model's rows to its .jsonl.gz file; returns (label, rows, seconds)"""
+    started = time.monotonic()
+    columns = [field.attname for field in model._meta.concrete_fields]
+    rows = 0
+    with gzip.open(model_path(directory, model), 'wt', encoding='utf-8', compresslevel=6) as out:
+        out.write(json.dumps({'model': model._meta.label_lower, 'columns': columns}) + '\n')
+        queryset = model._base_manager.order_by('pk').values_list(*columns)
+        for row in queryset.iterator(chunk_size=chunk_size):
+            out.write(json.dumps(row, cls=ExportEncoder, separators=(',', ':')) + '\n')
+            rows += 1
+    return model._meta.label_lower, rows, time.monotonic() - started
+
+
+def _set_snapshot(snapshot=None):
+    """Make the current transaction REPEATABLE READ; export its snapshot, or adopt `snapshot`"""
+    with connection.cursor() as cursor:
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        if snapshot:
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+            return snapshot
+        cursor.execute('SELECT pg_export_snapshot()')
+        return cursor.fetchone()[0]
+
+
+def _export_in_worker(model, directory, chunk_size, snapshot):
+    try:
+        with transaction.atomic():
+            _set_snapshot(snapshot)
+            return export_model(model, directory, chunk_size)
+    finally:
+        # Each worker thread opened its own connection; do not leave it behind
+        connections.close_all()
+
+
+def export_data(directory, labels=DEFAULT_LABELS, workers=4, chunk_size=CHUNK_SIZE, progress=None):
+    """Export the selected models into `directory`; returns the manifest dict"""
+    os.makedirs(directory, exist_ok=True)
+    models = resolve_models(labels)
+    started = time.monotonic()
+    counts = {}
+
+    def done(result):
+        label, rows, seconds = result
+        counts[label] = rows
+        if progress:
+            progress(f'{label}: {rows} rows in {seconds:.2f}s')
+
+    with transaction.atomic():
+        if workers > 1 and connection.vendor == 'postgresql':
+            # The exported snapshot stays valid while this transaction is open
+            snapshot = _set_snapshot()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for result in pool.map(lambda model: _export_in_worker(model, directory, chunk_size, snapshot), models):
+                    done(result)
+        else:
+            for model in models:
+                done(export_model(model, directory, chunk_size))
+
+    manifest = {
+        'models': [model._meta.label_lower for model in models],
+        'counts': counts,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def iter_rows(path):
+    """Yield (columns, row) pairs from an exported .jsonl.gz file"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            yield header['columns'], json.loads(line)
+
+
+def load_model(model, directory, chunk_size=CHUNK_SIZE):
+    """Insert the rows of one exported model with bulk_create; returns the row count"""
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    manager = model._base_manager
+    batch = []
+    rows = 0
+    for columns, values in iter_rows(model_path(directory, model)):
+        batch.append(model(**{
+            column: None if value is None else fields[column].to_python(value)
+            for column, value in zip(columns, values)
+        }))
+        if len(batch) >= chunk_size:
+            manager.bulk_create(batch)
+            rows += len(batch)
+            batch = []
+    if batch:
+        manager.bulk_create(batch)
+        rows += len(batch)
+    return rows
+
+
+def unexported_references(models):
+    """Return the foreign keys (app_label.model.field) of tables outside `models` holding rows that point into them"""
+    replaced = set(models)
+    references = []
+    for model in apps.get_models(include_auto_created=True):
+        if model in replaced or not model._meta.managed or model._meta.proxy:
+            continue
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model in replaced:
+                if model._base_manager.filter(**{f'{field.name}__isnull': False}).exists():
+                    references.append(f'{model._meta.label_lower}.{field.name}')
+    return references
+
+
+def load_data(directory, chunk_size=CHUNK_SIZE, replace=False, progress=None):
+    """Load an export made by export_data() into the default database; returns {label: rows}
+
+    Raises ReplaceError when `replace` would delete rows that tables outside
+    the export still reference.
+    """
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    models = [apps.get_model(label) for label in manifest['models']]
+    counts = {}
+
+    with transaction.atomic():
+        if replace:
+            references = unexported_references(models)
+            if references:
+                raise ReplaceError(
+                    f"Rows of tables missing from the export reference the tables to replace: {', '.join(references)}"
+                )
+            # Children first, without per-row cascades: every table is being replaced
+            for model in reversed(models):
+                model._base_manager.all()._raw_delete(connection.alias)
+        for model in models:
+            started = time.monotonic()
+            counts[model._meta.label_lower] = load_model(model, directory, chunk_size)
+            if progress:
+                progress(f'{model._meta.label_lower}: {counts[model._meta.label_lower]} rows '
+                         f'in {time.monotonic() - started:.2f}s')
+
+        # Explicit primary keys were inserted: move the id sequences past them
+        sql = connection.ops.sequence_reset_sql(no_style(), models)
+        if sql:
+            with connection.cursor() as cursor:
+                for statement in sql:
+                    cursor.execute(statement)
+    # Content types may have been replaced under new ids
+    ContentType.objects.clear_cache()
+    return counts
@@ -0,0 +1,331 @@
+"""
+Bulk student import from CSV or XLSX rosters.
+
+Rows are read one at a time, validated and priced against catalogs loaded
+once up front (courses, batches, existing CNICs and phone numbers), and
+written in chunks: one bulk_create for the students and one for their
+course links per chunk, each chunk in its own transaction. Rows that fail
+validation are skipped and reported with their line number; they never
+abort the rest of the import.
+
+Used by the student_import view and the import_students management command.
+
+Expected columns (header row, case-insensitive):
+    name, guardian_name, phone_number, cnic, courses, batch, discount,
+    advance_payment, schedule, second_installment_due_date
+`courses` lists course names (or ids) separated by ';' or ','. `batch` is
+a batch number and may be omitted when a default batch is given.
+"""
+import csv
+import io
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import Batch, Course, Payment, Student
+
+
+CHUNK_SIZE = 500
+
+IMPORT_COLUMNS = (
+    'name', 'guardian_name', 'phone_number', 'cnic', 'courses', 'batch', 'discount',
+    'advance_payment', 'schedule', 'second_installment_due_date',
+)
+REQUIRED_COLUMNS = ('name', 'phone_number', 'cnic', 'courses')
+
+# 13-digit CNIC / B-Form number, with or without dashes
+CNIC_RE = re.compile(r'^\d{5}-?\d{7}-?\d$')
+# Local or international mobile number once spaces and dashes are removed
+PHONE_RE = re.compile(r'^\+?\d{10,13}$')
+
+SCHEDULES = dict(Student.SCHEDULE_CHOICES)
+
+
+class ImportFormatError(Exception):
+    """The file as a whole cannot be read (unknown type, missing columns)."""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)
+    rows: int = 0
+    seconds: float = 0.0
+    dry_run: bool = False
+
+    @property
+    def skipped(self):
+        return len(self.errors)
+
+
+def normalize_cnic(value):
+    """Return the CNIC as 12345-1234567-1"""
+    digits = re.sub(r'\D', '', value)
+    return f'{digits[:5]}-{digits[5:12]}-{digits[12:]}'
+
+
+def normalize_phone(value):
+    return re.sub(r'[\s-]', '', value)
+
+
+def _columns(header):
+    columns = [str(column or '').strip().lower() for column in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ImportFormatError(f"Missing column(s): {', '.join(missing)}")
+    return columns
+
+
+def iter_csv_rows(file):
+    """Yield (line_number, {column: value}) from a CSV file opened in binary mode"""
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if header is None:
+            raise ImportFormatError('The file is empty.')
+        columns = _columns(header)
+        for row in reader:
+            if any(cell.strip() for cell in row):
+                yield reader.line_num, dict(zip(columns, row))
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+def iter_xlsx_rows(file):
+    """Yield (line_number, {column: value}) from the first sheet of an XLSX file"""
+    # Imported here: openpyxl is only needed for XLSX uploads
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFormatError('The file is empty.')
+        columns = _columns(header)
+        for line_number, row in enumerate(rows, start=2):
+            if any(cell not in (None, '') for cell in row):
+                yield line_number, dict(zip(columns, row))
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, filename):
+    """Yield the rows of a CSV or XLSX file, chosen by extension"""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        return iter_csv_rows(file)
+    if extension in ('xlsx', 'xlsm'):
+        return iter_xlsx_rows(file)
+    raise ImportFormatError('Upload a .csv or .xlsx file.')
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _decimal(value, label):
+    text = _text(value)
+    if not text:
+        return Decimal('0')
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f'{label} must be a number')
+    if number < 0:
+        raise ValueError(f'{label} cannot be negative')
+    return number
+
+
+def _date(value, label):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = _text(value)
+    for fmt in ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f'{label} must be a date (YYYY-MM-DD)')
+
+
+class StudentImporter:
+    """
+    Import students for one CSR.
+
+    Args:
+        csr: CSRProfile recorded as the creator of every imported student
+        batch: default Batch for rows without a batch column (optional)
+        chunk_size: students written per bulk_create / transaction
+        dry_run: validate and price every row without writing anything
+    """
+
+    def __init__(self, csr, batch=None, chunk_size=CHUNK_SIZE, dry_run=False):
+        self.csr = csr
+        self.batch = batch
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.creator_name = csr.get_full_name() if csr else ''
+        self.today = timezone.now().date()
+        self._load_catalogs()
+
+    def _load_catalogs(self):
+        # Courses by id and by lower-cased name, with their prices and names
+        self.courses = {}
+        for course_id, name, price in Course.objects.values_list('id', 'name', 'price'):
+            self.courses[str(course_id)] = (course_id, price, name)
+            self.courses[name.strip().lower()] = (course_id, price, name)
+        self.batches = {number.lower(): batch_id for batch_id, number in Batch.objects.values_list('id', 'batch_number')}
+        # Existing students, to reject rows that were already enrolled
+        self.known_cnics = set()
+        self.known_students = set()
+        for cnic, phone, name in Student.objects.values_list('cnic', 'phone_number', 'name').iterator():
+            if cnic:
+                self.known_cnics.add(re.sub(r'\D', '', cnic))
+            self.known_students.add((normalize_phone(phone), name.strip().lower()))
+
+    def build(self, row):
+        """Validate and price one row; return (Student, [course ids]) or raise ValueError"""
+        missing = [column for column in REQUIRED_COLUMNS if not _text(row.get(column))]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+
+        name = _text(row['name'])
+        cnic = _text(row['cnic'])
+        if not CNIC_RE.match(cnic):
+            raise ValueError(f'invalid CNIC "{cnic}"')
+        cnic_digits = re.sub(r'\D', '', cnic)
+        if cnic_digits in self.known_cnics:
+            raise ValueError(f'a student with CNIC {normalize_cnic(cnic)} already exists')
+
+        phone = normalize_phone(_text(row['phone_number']))
+        if not PHONE_RE.match(phone):
+            raise ValueError(f'invalid phone number "{phone}"')
+        if (phone, name.lower()) in self.known_students:
+            raise ValueError(f'{name} with phone {phone} already exists')
+
+        batch_id = self.batch.id if self.batch else None
+        batch_number = _text(row.get('batch'))
+        if batch_number:
+            batch_id = self.batches.get(batch_number.lower())
+            if batch_id is None:
+                raise ValueError(f'unknown batch "{batch_number}"')
+        if batch_id is None:
+            raise ValueError('missing batch')
+
+        course_ids = []
+        course_names = {}
+        course_total = Decimal('0')
+        for course_name in re.split(r'[;,]', _text(row['courses'])):
+            course_name = course_name.strip()
+            if not course_name:
+                continue
+            course = self.courses.get(course_name.lower())
+            if course is None:
+                raise ValueError(f'unknown course "{course_name}"')
+            if course[0] not in course_ids:
+                course_ids.append(course[0])
+                course_names[course[0]] = course[2]
+                course_total += course[1]
+
+        schedule = _text(row.get('schedule')).lower() or 'weekend'
+        if schedule not in SCHEDULES:
+            raise ValueError(f'invalid schedule "{schedule}"')
+
+        # Same pricing rules as enrollment in student_management
+        discount_percent = _decimal(row.get('discount'), 'discount')
+        if discount_percent > 100:
+            raise ValueError('discount cannot exceed 100%')
+        advance_payment = int(_decimal(row.get('advance_payment'), 'advance_payment'))
+        discounted_price = course_total - (course_total * discount_percent / Decimal('100'))
+        second_installment = int(max(Decimal('0'), discounted_price - advance_payment))
+        is_paid = advance_payment >= discounted_price
+
+        student = Student(
+            name=name,
+            guardian_name=_text(row.get('guardian_name')),
+            phone_number=phone,
+            cnic=normalize_cnic(cnic),
+            batch_id=batch_id,
+            # The through rows are bulk-inserted without m2m_changed: fill the course cache here
+            course_names=[course_names[course_id] for course_id in sorted(course_names)],
+            course_count=len(course_names),
+            discount=discount_percent,
+            total_fees=int(course_total),
+            discounted_price=int(discounted_price),
+            advance_payment=advance_payment,
+            second_installment=second_installment,
+            payment_status='paid' if is_paid else 'pending',
+            # bulk_create skips Student.save(): apply its rules for new records here
+            balance=second_installment,
+            total_amount=advance_payment + second_installment if is_paid else advance_payment,
+            second_installment_due_date=_date(row.get('second_installment_due_date'), 'second_installment_due_date'),
+            due_date=self.today if is_paid else None,
+            schedule=schedule,
+            created_by=self.csr,
+            created_by_name=self.creator_name,
+        )
+
+        self.known_cnics.add(cnic_digits)
+        self.known_students.add((phone, name.lower()))
+        return student, course_ids
+
+    def write(self, chunk):
+        """Insert one chunk of (Student, [course ids]) in a single transaction"""
+        through = Student.courses.through
+        with transaction.atomic():
+            students = Student.objects.bulk_create([student for student, _ in chunk])
+            through.objects.bulk_create([
+                through(student_id=student.pk, course_id=course_id)
+                for student, (_, course_ids) in zip(students, chunk)
+                for course_id in course_ids
+            ])
+            Payment.objects.record_advances(students, csr=self.csr)
+        return len(students)
+
+    def run(self, rows):
+        """Import the (line_number, row) pairs produced by iter_rows()"""
+        result = ImportResult(dry_run=self.dry_run)
+        started = time.monotonic()
+        chunk = []
+        try:
+            for line_number, row in rows:
+                result.rows += 1
+                try:
+                    chunk.append(self.build(row))
+                except ValueError as e:
+                    result.errors.append((line_number, str(e)))
+                    continue
+                if len(chunk) >= self.chunk_size:
+                    result.created += len(chunk) if self.dry_run else self.write(chunk)
+                    chunk = []
+            if chunk:
+                result.created += len(chunk) if self.dry_run else self.write(chunk)
+        finally:
+            # bulk_create skips the signals that normally invalidate cached fragments
+            if result.created and not self.dry_run:
+                invalidate('students')
+        result.seconds = time.monotonic() - started
+        return result
+
+
+def import_students(file, filename, csr, batch=None, chunk_size=CHUNK_SIZE, dry_run=False):
+    """Import a CSV/XLSX roster; returns an ImportResult"""
+    importer = StudentImporter(csr, batch=batch, chunk_size=chunk_size, dry_run=dry_run)
+    return importer.run(iter_rows(file, filename))
@@ -0,0 +1,125 @@
+"""
+Database-backed job queue.
+
+Tasks are plain functions registered with @task; the web tier calls
+enqueue() and returns, and `manage.py run_worker` runs the jobs. Only
+JSON-serializable keyword arguments and return values are supported: the
+kwargs and the result are stored on the Job row.
+
+Workers claim jobs in priority order with SELECT ... FOR UPDATE SKIP LOCKED,
+so concurrent workers never wait on each other's rows. Databases without
+SKIP LOCKED (SQLite, in tests and local runs) read the candidates without
+locking; the conditional UPDATE that marks a job running then decides which
+worker gets it. A failed job is retried with exponential backoff until
+max_attempts, then marked failed with its traceback. Tasks that commit
+their work in parts are enqueued with max_attempts=1: a failure or a
+stopped worker then fails the job instead of running it again.
+"""
+import json
+import traceback
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+
+TASKS = {}
+
+# Retry delays: RETRY_BASE_SECONDS, doubled per attempt, at most RETRY_MAX_SECONDS
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+
+def task(name):
+    """Register the decorated function as the task `name`"""
+    def register(func):
+        TASKS[name] = func
+        func.task_name = name
+        return func
+    return register
+
+
+def enqueue(func, priority=0, run_at=None, max_attempts=3, created_by=None, **kwargs):
+    """Queue a job running `func` (a registered task or its name) with `kwargs`; returns the Job"""
+    return Job.objects.create(
+        task=getattr(func, 'task_name', func),
+        kwargs=kwargs,
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts,
+        created_by=created_by,
+    )
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt, after `attempts` failed ones"""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def claim(worker, limit=1):
+    """Mark up to `limit` due jobs as running for `worker` and return them, highest priority first"""
+    now = timezone.now()
+    due = Job.objects.filter(status='queued', run_at__lte=now).order_by('-priority', 'run_at', 'pk')
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # status='queued' again: without row locks another worker may have taken some of them
+        Job.objects.filter(pk__in=ids, status='queued').update(
+            status='running', locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+    claimed = Job.objects.filter(pk__in=ids, status='running', locked_by=worker, locked_at=now)
+    return sorted(claimed, key=lambda job: ids.index(job.pk))
+
+
+def _storable(result):
+    """Return `result` if the result column can store it, else its repr"""
+    try:
+        json.dumps(result, cls=DjangoJSONEncoder)
+    except (TypeError, ValueError):
+        return repr(result)
+    return result
+
+
+def run(job):
+    """Run a claimed job and record the outcome; returns the job's new status"""
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            raise LookupError(f'Unknown task "{job.task}"')
+        result = func(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            status, changes = 'queued', {'run_at': timezone.now() + retry_delay(job.attempts)}
+        else:
+            status, changes = 'failed', {'finished_at': timezone.now()}
+        Job.objects.filter(pk=job.pk).update(status=status, error=error, locked_by='', locked_at=None, **changes)
+        return status
+
+    Job.objects.filter(pk=job.pk).update(
+        status='done', result=_storable(result), error='', finished_at=timezone.now(),
+    )
+    return 'done'
+
+
+def release_stale(older_than=timedelta(hours=1)):
+    """Requeue running jobs whose worker stopped before finishing them; returns how many
+
+    The interrupted run counts as an attempt: a job that keeps crashing its
+    worker ends up failed instead of being retried forever.
+    """
+    cutoff = timezone.now() - older_than
+    stale = Job.objects.filter(status='running', locked_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', error='Worker stopped while running the job', finished_at=timezone.now(),
+        locked_by='', locked_at=None,
+    )
+    requeued = stale.update(status='queued', run_at=timezone.now(), locked_by='', locked_at=None)
+    return failed + requeued
@@ -0,0 +1,87 @@
+"""
+Base class for maintenance commands that rewrite many rows.
+
+Rows are processed in primary-key order, a chunk at a time: each chunk is a
+single set-based statement in its own short transaction, so a large table is
+never locked for the whole run and an interrupted command can simply be run
+again. Every command gets --dry-run and --chunk-size and reports progress
+and timing.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from pos.cache import invalidate
+
+
+class ChunkedCommand(BaseCommand):
+    default_chunk_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would change without writing anything',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=self.default_chunk_size,
+            help=f'Rows per statement (default: {self.default_chunk_size})',
+        )
+
+    def execute(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.chunk_size = options['chunk_size']
+        self.started = time.monotonic()
+        return super().execute(*args, **options)
+
+    def elapsed(self):
+        return f'{time.monotonic() - self.started:.2f}s'
+
+    def pk_chunks(self, queryset):
+        """Yield lists of primary keys of `queryset`, `chunk_size` at a time, in pk order.
+
+        Keyset pagination (pk > last seen) keeps every chunk query cheap, and
+        rows that stop matching the queryset after an update are not skipped.
+        """
+        last_pk = None
+        while True:
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:self.chunk_size])
+            if not pks:
+                return
+            yield pks
+            last_pk = pks[-1]
+
+    def progress(self, done, total, label):
+        self.stdout.write(f'  {done}/{total} {label} ({self.elapsed()})')
+
+    def update_in_chunks(self, queryset, label, **changes):
+        """Apply `changes` to every row of `queryset` with one UPDATE per chunk.
+
+        Returns the number of rows updated (or that would be, with --dry-run).
+        """
+        total = queryset.count()
+        if self.dry_run or not total:
+            verb = 'Would update' if self.dry_run else 'Nothing to update:'
+            self.stdout.write(f'{verb} {total} {label}')
+            return total if self.dry_run else 0
+
+        self.stdout.write(f'Updating {total} {label}...')
+        if any(field.name == 'updated_at' for field in queryset.model._meta.fields):
+            # update() skips auto_now; the report snapshot (pos/analytics.py) reads changes from updated_at
+            changes.setdefault('updated_at', timezone.now())
+        updated = 0
+        for pks in self.pk_chunks(queryset):
+            with transaction.atomic():
+                updated += queryset.filter(pk__in=pks).update(**changes)
+            self.progress(updated, total, label)
+        if updated:
+            # update() skips the model signals that invalidate cached fragments
+            invalidate('students')
+        return updated
@@ -0,0 +1,20 @@
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from pos.management.chunked import ChunkedCommand
+from pos.models import CSRProfile, Student
+
+
+class Command(ChunkedCommand):
+    help = "Fills empty created_by_name values from the creating CSR's name (or 'Unknown')"
+
+    def handle(self, *args, **options):
+        creator_name = CSRProfile.objects.filter(pk=OuterRef('created_by_id')).values('full_name')[:1]
+        students = Student.objects.filter(Q(created_by_name='') | Q(created_by_name__isnull=True))
+        updated = self.update_in_chunks(
+            students, 'students',
+            created_by_name=Coalesce(Subquery(creator_name), Value('Unknown')),
+        )
+
+        verb = 'Would fill' if self.dry_run else 'Filled'
+        self.stdout.write(self.style.SUCCESS(f'{verb} the creator name of {updated} students in {self.elapsed()}'))
@@ -5,6 +5,8 @@ import subprocess
 import datetime
 from pathlib import Path
 
+from pos.dataexport import export_data
+
 
 class Command(BaseCommand):
     help = 'Create a complete database dump'
@@ -95,39 +97,19 @@ class Command(BaseCommand):
             self.stdout.write(f'STDERR: {e.stderr}')
             return
         
-        # Create Django fixtures dump
-        self.stdout.write('\n📦 Creating Django fixtures dump...')
-        fixtures_dir = Path(settings.BASE_DIR) / "database_dumps" / "fixtures"
-        fixtures_dir.mkdir(exist_ok=True)
-        
-        from django.apps import apps
-        app_names = [app.name for app in apps.get_app_configs() if not app.name.startswith('django.')]
-        
-        for app_name in app_names:
-            try:
-                fixture_filename = f"{app_name}_{timestamp}.json"
-                fixture_path = fixtures_dir / fixture_filename
-                
-                fixture_cmd = [
-                    'python', 'manage.py', 'dumpdata', app_name,
-                    '--indent', '2',
-                    '--output', str(fixture_path)
-                ]
-                
-                subprocess.run(fixture_cmd, capture_output=True, text=True, check=True)
-                self.stdout.write(f'✅ Created fixture: {fixture_filename}')
-                
-            except subprocess.CalledProcessError as e:
-                self.stdout.write(
-                    self.style.WARNING(f'⚠️  Warning: Could not create fixture for {app_name}')
-                )
+        # Create the data export (in process, all tables in parallel)
+        self.stdout.write('\n📦 Creating data export...')
+        export_dir = Path(settings.BASE_DIR) / "database_dumps" / f"export_{timestamp}"
+        manifest = export_data(export_dir, progress=self.stdout.write)
+        self.stdout.write(f"✅ Exported {sum(manifest['counts'].values())} rows in {manifest['seconds']:.2f}s")
         
         self.stdout.write(
             self.style.SUCCESS('\n🎉 Database dump process completed!')
         )
         self.stdout.write(f'📁 PostgreSQL dump: {dump_path}')
-        self.stdout.write(f'📁 Django fixtures: {fixtures_dir}')
+        self.stdout.write(f'📁 Data export: {export_dir}')
         
         # Show restore instructions
         self.stdout.write('\n📋 To restore the database:')
         self.stdout.write(f'psql -h {db_config["HOST"]} -U {db_config["USER"]} -d {db_config["NAME"]} < {dump_path}')
+        self.stdout.write(f'or, for the application data only: python manage.py load_data {export_dir} --replace')
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from pos.importer import CHUNK_SIZE, ImportFormatError, import_students
+from pos.models import Batch, CSRProfile
+
+
+class Command(BaseCommand):
+    help = 'Import students from a CSV or XLSX roster (see pos/importer.py for the columns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import')
+        parser.add_argument(
+            '--csr',
+            required=True,
+            help='Username of the CSR recorded as the creator of the students',
+        )
+        parser.add_argument(
+            '--batch',
+            help='Batch number for rows without a batch column',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Students written per transaction (default: {CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate and report without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            csr = CSRProfile.objects.get(user__username=options['csr'])
+        except CSRProfile.DoesNotExist:
+            raise CommandError(f"No CSR with username {options['csr']}")
+
+        batch = None
+        if options['batch']:
+            try:
+                batch = Batch.objects.get(batch_number=options['batch'])
+            except Batch.DoesNotExist:
+                raise CommandError(f"Batch {options['batch']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as file:
+                result = import_students(
+                    file, options['path'], csr, batch=batch,
+                    chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+                )
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        for line_number, error in result.errors:
+            self.stdout.write(self.style.WARNING(f'Line {line_number}: {error}'))
+
+        verb = 'Would import' if result.dry_run else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created} of {result.rows} students in {result.seconds:.2f}s '
+            f'({result.skipped} rows skipped)'
+        ))
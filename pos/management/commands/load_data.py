@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+import os
+import time
+
+from pos.cache import DOMAINS, invalidate
+from pos.dataexport import CHUNK_SIZE, MANIFEST, ReplaceError, load_data
+
+
+class Command(BaseCommand):
+    help = 'Load an export made by export_data (bulk inserts, foreign key targets first)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory written by export_data')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows per bulk insert (default: {CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--replace',
+            action='store_true',
+            help='Delete the existing rows of the exported tables first',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.exists(os.path.join(options['directory'], MANIFEST)):
+            raise CommandError(f"{options['directory']} has no {MANIFEST}; is it an export_data directory?")
+
+        started = time.monotonic()
+        try:
+            counts = load_data(
+                options['directory'], chunk_size=options['chunk_size'],
+                replace=options['replace'], progress=self.stdout.write,
+            )
+        except ReplaceError as e:
+            raise CommandError(f'{e}. Export those tables too, or load without --replace.')
+        # bulk_create skips the model signals that invalidate cached fragments
+        invalidate(*DOMAINS)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {sum(counts.values())} rows into {len(counts)} tables in {time.monotonic() - started:.2f}s'
+        ))
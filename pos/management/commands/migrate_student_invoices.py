@@ -1,59 +1,69 @@
-from django.core.management.base import BaseCommand
+from pos.management.chunked import ChunkedCommand
 from pos.models import Student, StudentInvoice
 from django.db import transaction
 from django.utils import timezone
 
 
-class Command(BaseCommand):
+class Command(ChunkedCommand):
     help = 'Migrates existing students to the StudentInvoice model'
 
+    def parse_invoice_number(self, name, invoice_number):
+        """Return (present_invoice_no, pending_invoice_no) parsed from the legacy invoice number"""
+        if not invoice_number:
+            return 0, 0
+        try:
+            # Check if it's a pending invoice (starts with P)
+            if invoice_number.startswith('P'):
+                # Remove the P prefix and convert to integer
+                return 0, int(invoice_number[1:])
+            # Regular invoice, convert to integer
+            return int(invoice_number), 0
+        except (ValueError, TypeError):
+            # If conversion fails, just use 0 (default)
+            self.stdout.write(self.style.WARNING(
+                f'Could not parse invoice number "{invoice_number}" for student {name}'
+            ))
+            return 0, 0
+
     def handle(self, *args, **options):
-        # Get all students
-        students = Student.objects.all()
+        # Only students without an invoice record need one
+        students = Student.objects.filter(invoice_numbers__isnull=True)
+        total = students.count()
+        skipped_count = StudentInvoice.objects.count()
+
+        self.stdout.write(self.style.SUCCESS(f'Found {total} students to process'))
+        if self.dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'Would create {total} invoice records, skipping {skipped_count} existing records'
+            ))
+            return
+
         created_count = 0
-        skipped_count = 0
-        
-        self.stdout.write(self.style.SUCCESS(f'Found {students.count()} students to process'))
-        
-        with transaction.atomic():
-            for student in students:
-                # Check if student already has an invoice record
-                invoice_exists = StudentInvoice.objects.filter(student=student).exists()
-                
-                if invoice_exists:
-                    skipped_count += 1
-                    continue
-                
-                # Create new StudentInvoice record
-                invoice = StudentInvoice(
-                    student=student,
-                    created_at=timezone.now()
-                )
-                
-                # If student has an existing invoice number, try to parse it
-                if student.invoice_number:
-                    try:
-                        # Check if it's a pending invoice (starts with P)
-                        if student.invoice_number.startswith('P'):
-                            # Remove the P prefix and convert to integer
-                            invoice.pending_invoice_no = int(student.invoice_number[1:])
-                        else:
-                            # Regular invoice, convert to integer
-                            invoice.present_invoice_no = int(student.invoice_number)
-                    except (ValueError, TypeError):
-                        # If conversion fails, just use 0 (default)
-                        self.stdout.write(self.style.WARNING(
-                            f'Could not parse invoice number "{student.invoice_number}" for student {student.name}'
-                        ))
-                
-                # Save the invoice record
-                invoice.save()
-                created_count += 1
-                
-                # Progress indicator for large datasets
-                if created_count % 100 == 0:
-                    self.stdout.write(f'Processed {created_count} students...')
-        
+        processed = 0
+        now = timezone.now()
+        for pks in self.pk_chunks(students):
+            invoices = []
+            for student_id, name, invoice_number in Student.objects.filter(pk__in=pks).values_list('id', 'name', 'invoice_number'):
+                present_no, pending_no = self.parse_invoice_number(name, invoice_number)
+                invoices.append(StudentInvoice(
+                    student_id=student_id,
+                    present_invoice_no=present_no,
+                    pending_invoice_no=pending_no,
+                    created_at=now,
+                ))
+            # ignore_conflicts: a record created meanwhile (e.g. by an invoice view) is kept as is.
+            # The rows actually inserted are the ones carrying this run's created_at
+            with transaction.atomic():
+                StudentInvoice.objects.bulk_create(invoices, ignore_conflicts=True)
+                inserted = StudentInvoice.objects.filter(student_id__in=pks, created_at=now).count()
+            created_count += inserted
+            skipped_count += len(invoices) - inserted
+            processed += len(pks)
+
+            # Progress indicator for large datasets
+            self.progress(processed, total, 'students')
+
         self.stdout.write(self.style.SUCCESS(
-            f'Migration complete! Created {created_count} invoice records, skipped {skipped_count} existing records'
+            f'Migration complete! Created {created_count} invoice records, skipped {skipped_count} existing records '
+            f'in {self.elapsed()}'
         ))
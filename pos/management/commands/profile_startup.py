@@ -0,0 +1,124 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Runs in a fresh interpreter: load the WSGI app, then serve one request
+COLD_START_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+module_name, attr = sys.argv[1].rsplit('.', 1)
+app = getattr(__import__(module_name, fromlist=[attr]), attr)
+loaded = time.perf_counter()
+status = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[2], 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+    'SERVER_NAME': sys.argv[3], 'SERVER_PORT': '443', 'HTTP_HOST': sys.argv[3],
+    'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'https', 'wsgi.input': sys.stdin.buffer,
+    'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0), 'wsgi.multithread': False,
+    'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+body = b''.join(app(environ, lambda s, h, exc_info=None: status.append(s)))
+served = time.perf_counter()
+print(json.dumps({'load': loaded - started, 'first_response': served - started,
+                  'status': status[0] if status else '', 'bytes': len(body),
+                  'modules': sorted(sys.modules)}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start: time to first response on a fresh interpreter and import cost per module'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/login/',
+            help='Request path served after startup (default: /login/)',
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Host header of the request (default: localhost)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=3,
+            help='Cold starts to measure; the median is reported (default: 3)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=20,
+            help='Number of modules listed (default: 20)',
+        )
+
+    def cold_start(self, importtime=False):
+        """Start a fresh interpreter, serve one request and return (result, importtime lines)"""
+        cmd = [sys.executable]
+        if importtime:
+            cmd += ['-X', 'importtime']
+        cmd += ['-c', COLD_START_SCRIPT, settings.WSGI_APPLICATION, self.path, self.host]
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'api.settings'))
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        if proc.returncode != 0:
+            raise CommandError(f'Cold start failed:\n{proc.stderr[-2000:]}')
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        lines = [line for line in proc.stderr.splitlines() if line.startswith('import time:')]
+        return result, lines
+
+    def parse_importtime(self, lines):
+        """Return [(module, self_us, cumulative_us, depth)] from -X importtime output"""
+        modules = []
+        for line in lines[1:]:  # first line is the column header
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        return modules
+
+    def handle(self, *args, **options):
+        self.path = options['path']
+        self.host = options['host']
+
+        # Timings without -X importtime (it adds its own overhead)
+        results = [self.cold_start()[0] for _ in range(max(1, options['runs']))]
+        first_response = statistics.median(r['first_response'] for r in results)
+        load = statistics.median(r['load'] for r in results)
+
+        result, lines = self.cold_start(importtime=True)
+        modules = self.parse_importtime(lines)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Cold start ({self.path}, median of {len(results)}): WSGI app loaded in {load * 1000:.0f} ms, "
+            f"first response ({result['status']}) after {first_response * 1000:.0f} ms"
+        ))
+        self.stdout.write(f"Modules imported: {len(result['modules'])}")
+        if os.environ.get('PYTHONDONTWRITEBYTECODE'):
+            self.stdout.write(self.style.WARNING(
+                'PYTHONDONTWRITEBYTECODE is set: stale bytecode is recompiled on every start and inflates the numbers'
+            ))
+
+        top = options['top']
+        self.stdout.write('\nSlowest imports (cumulative ms, including dependencies):')
+        for name, self_us, cumulative_us, depth in sorted(modules, key=lambda m: -m[2])[:top]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f}  {name}')
+
+        # Totals per top-level package show which dependencies are worth deferring
+        packages = {}
+        for name, self_us, cumulative_us, depth in modules:
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+        self.stdout.write('\nImport cost per package (self ms):')
+        for package, self_us in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+            self.stdout.write(f'  {self_us / 1000:8.1f}  {package}')
+
+        project_apps = ('api', 'pos', 'portal')
+        heavy = [m for m in ('openpyxl', 'pytz') if m in result['modules']]
+        loaded_apps = sorted(m for m in result['modules'] if m.split('.')[0] in project_apps)
+        self.stdout.write(f"\nProject modules loaded: {', '.join(loaded_apps)}")
+        if heavy:
+            self.stdout.write(self.style.WARNING(f"Loaded at startup: {', '.join(heavy)}"))
@@ -0,0 +1,90 @@
+from datetime import timedelta
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from pos import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Runs the periodic tasks (see pos/scheduler.py) until stopped; one instance at a time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=10.0,
+            help='Seconds between checks for due tasks (default: 10)',
+        )
+        parser.add_argument(
+            '--lease-ttl',
+            type=int,
+            default=300,
+            help='Seconds the scheduler lease lasts without renewal; longer than the slowest task (default: 300)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the tasks that are due now and exit',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Show the registered tasks and their status, and exit',
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        rows = scheduler.sync()
+        if options['list']:
+            for name, row in sorted(rows.items()):
+                last = f'{row.last_status} at {row.last_started_at:%Y-%m-%d %H:%M} ({row.last_duration:.2f}s)' if row.run_count else 'never run'
+                paused = '' if row.enabled else ' [paused]'
+                self.stdout.write(f'{name}{paused}: {row.schedule}; next {row.next_run_at:%Y-%m-%d %H:%M:%S}; last {last}')
+            return
+
+        holder = f'{socket.gethostname()}:{os.getpid()}'
+        ttl = timedelta(seconds=options['lease_ttl'])
+        stopping = []
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running task...')
+            stopping.append(signum)
+        previous_handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+        self.stdout.write(self.style.SUCCESS(f'Scheduler {holder} started ({len(rows)} tasks)'))
+        leading = False
+        try:
+            while not stopping:
+                if scheduler.acquire_lease(holder, ttl):
+                    if not leading:
+                        self.stdout.write(self.style.SUCCESS('Holding the scheduler lease'))
+                        leading = True
+                    for row in scheduler.due_tasks():
+                        # Renewed before every task, so the lease only lapses if one task outlasts it
+                        if stopping or not scheduler.acquire_lease(holder, ttl):
+                            break
+                        self.report(row, scheduler.run_task(row))
+                elif leading or options['once']:
+                    self.stdout.write(self.style.WARNING('Another scheduler holds the lease; standing by'))
+                    leading = False
+                if options['once']:
+                    break
+                time.sleep(options['tick'])
+        finally:
+            if leading:
+                scheduler.release_lease(holder)
+            connections.close_all()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Scheduler {holder} stopped'))
+
+    def report(self, row, status):
+        style = self.style.SUCCESS if status == 'ok' else self.style.ERROR
+        next_run = timezone.localtime(row.next_run_at)
+        self.stdout.write(style(f'{row.name}: {status} in {row.last_duration:.2f}s, next at {next_run:%Y-%m-%d %H:%M:%S}'))
@@ -0,0 +1,130 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.module_loading import autodiscover_modules
+
+from pos import jobs
+from pos.models import Job
+
+
+def execute(job_id):
+    """Run one claimed job in a pool worker; returns (job id, task, status, seconds)"""
+    try:
+        # Process pool workers import the apps' tasks modules themselves
+        autodiscover_modules('tasks')
+        job = Job.objects.get(pk=job_id)
+        started = time.monotonic()
+        status = jobs.run(job)
+        return job.pk, job.task, status, time.monotonic() - started
+    finally:
+        # Each pool worker has its own connection; do not leave it open between jobs
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (see pos/jobs.py) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=2,
+            help='Jobs run at the same time (default: 2)',
+        )
+        parser.add_argument(
+            '--pool',
+            choices=['thread', 'process'],
+            default='thread',
+            help='Run jobs in threads or in separate processes (default: thread)',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds between queue checks when idle (default: 2)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=3600,
+            help='Requeue jobs left running this many seconds by a stopped worker (default: 3600)',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        stale_after = timedelta(seconds=options['stale_after'])
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+
+        if options['pool'] == 'process':
+            # spawn: children start clean instead of sharing this process's database connections
+            pool = ProcessPoolExecutor(
+                max_workers=concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        else:
+            pool = ThreadPoolExecutor(max_workers=concurrency)
+
+        stopping = []
+        def stop(signum, frame):
+            self.stdout.write('Stopping: finishing the running jobs...')
+            stopping.append(signum)
+        previous_handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker {worker} started ({concurrency} {options['pool']}s, tasks: {', '.join(sorted(jobs.TASKS))})"
+        ))
+        running = set()
+        last_stale_check = 0
+        try:
+            while not stopping:
+                if time.monotonic() - last_stale_check > 60:
+                    released = jobs.release_stale(stale_after)
+                    if released:
+                        self.stdout.write(self.style.WARNING(f'Released {released} stale jobs'))
+                    last_stale_check = time.monotonic()
+
+                free = concurrency - len(running)
+                for job in jobs.claim(worker, free) if free else []:
+                    running.add(pool.submit(execute, job.pk))
+
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                # Until a job finishes (freeing a slot), or the next poll for newly queued jobs
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.report(future)
+        finally:
+            for future in wait(running).done:
+                self.report(future)
+            pool.shutdown()
+            connections.close_all()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f'Worker {worker} stopped'))
+
+    def report(self, future):
+        try:
+            job_id, task, status, seconds = future.result()
+        except Exception as e:
+            # The job could not even be loaded; it is released as stale later
+            self.stdout.write(self.style.ERROR(f'Worker error: {e}'))
+            return
+        style = self.style.SUCCESS if status == 'done' else self.style.WARNING
+        self.stdout.write(style(f'Job #{job_id} {task}: {status} in {seconds:.2f}s'))
@@ -1,42 +1,39 @@
-from django.core.management.base import BaseCommand
-from pos.models import Student
-from django.utils import timezone
 from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from pos.management.chunked import ChunkedCommand
+from pos.models import Student
 
 
-class Command(BaseCommand):
+class Command(ChunkedCommand):
     help = 'Transfers due_date values to second_installment_due_date and sets due_date to dash'
 
     def handle(self, *args, **options):
         # First check if second_installment_due_date field exists in the database
         with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_name='pos_student' 
-                AND column_name='second_installment_due_date'
-            """)
-            if not cursor.fetchone():
-                self.stdout.write(self.style.ERROR(
-                    'The second_installment_due_date field does not exist in the database. '
-                    'Please run migrations first with: python manage.py migrate'
-                ))
-                return
+            columns = [column.name for column in connection.introspection.get_table_description(cursor, Student._meta.db_table)]
+        if 'second_installment_due_date' not in columns:
+            self.stdout.write(self.style.ERROR(
+                'The second_installment_due_date field does not exist in the database. '
+                'Please run migrations first with: python manage.py migrate'
+            ))
+            return
+
+        # Students with due_date values
+        students_with_due_date = Student.objects.filter(due_date__isnull=False)
+        to_transfer = students_with_due_date.filter(second_installment_due_date__isnull=True).count()
+        self.stdout.write(f"Found {students_with_due_date.count()} students with due_date values to transfer")
 
-        # Count students with due_date values
-        students_with_due_date = Student.objects.filter(due_date__isnull=False).count()
-        self.stdout.write(f"Found {students_with_due_date} students with due_date values to transfer")
+        # Keep an existing second_installment_due_date, otherwise take over the due_date.
+        # We can't set a dash directly in a DateField, so we'll handle this in the template display
+        cleared_count = self.update_in_chunks(
+            students_with_due_date,
+            'students with a due date',
+            second_installment_due_date=Coalesce(F('second_installment_due_date'), F('due_date')),
+            due_date=None,
+        )
 
-        # Process each student individually to handle the date transfer
-        updated_count = 0
-        for student in Student.objects.filter(due_date__isnull=False):
-            if not student.second_installment_due_date:
-                student.second_installment_due_date = student.due_date
-                updated_count += 1
-            # We can't set a dash directly in a DateField, so we'll handle this in the template display
-            student.due_date = None
-            student.save()
-        
-        self.stdout.write(f"Transferred {updated_count} due_date values to second_installment_due_date")
-        self.stdout.write(f"Set due_date to null for {students_with_due_date} students")
-        self.stdout.write(self.style.SUCCESS('Successfully transferred due dates'))
+        verb = 'Would transfer' if self.dry_run else 'Transferred'
+        self.stdout.write(f"{verb} {to_transfer} due_date values to second_installment_due_date")
+        self.stdout.write(f"Set due_date to null for {cleared_count} students")
+        self.stdout.write(self.style.SUCCESS(f'Successfully transferred due dates in {self.elapsed()}'))
@@ -1,24 +1,23 @@
-from django.core.management.base import BaseCommand
+from django.db.models import F
+from pos.management.chunked import ChunkedCommand
 from pos.models import Student
 
-class Command(BaseCommand):
+class Command(ChunkedCommand):
     help = 'Update balance field for all existing student records'
 
     def handle(self, *args, **options):
-        # Get all student records
-        students = Student.objects.all()
-        updated_count = 0
+        # Pending payments: balance equals second_installment; paid: balance is 0.
+        # Only rows that are out of line are touched, so reruns are cheap.
+        updated_count = self.update_in_chunks(
+            Student.objects.filter(payment_status='pending').exclude(balance=F('second_installment')),
+            'pending students',
+            balance=F('second_installment'),
+        )
+        updated_count += self.update_in_chunks(
+            Student.objects.filter(payment_status='paid').exclude(balance=0),
+            'paid students',
+            balance=0,
+        )
         
-        for student in students:
-            if student.payment_status == 'pending':
-                # For pending payments, set balance equal to second_installment
-                student.balance = student.second_installment
-                student.save(update_fields=['balance'])
-                updated_count += 1
-            elif student.payment_status == 'paid':
-                # For paid payments, set balance to 0
-                student.balance = 0
-                student.save(update_fields=['balance'])
-                updated_count += 1
-        
-        self.stdout.write(self.style.SUCCESS(f'Successfully updated balance for {updated_count} students'))
+        verb = 'Would update' if self.dry_run else 'Successfully updated'
+        self.stdout.write(self.style.SUCCESS(f'{verb} balance for {updated_count} students in {self.elapsed()}'))
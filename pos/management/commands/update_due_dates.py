@@ -1,29 +1,28 @@
-from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.db.models.functions import TruncDate
+from pos.management.chunked import ChunkedCommand
 from pos.models import Student
-from django.db.models import F
 
 
-class Command(BaseCommand):
+class Command(ChunkedCommand):
     help = 'Updates due_date to match created_at for students who paid in full at once'
 
     def handle(self, *args, **options):
         self.stdout.write("Starting due date update for full payment students...")
 
         # Find students who paid in full at once (advance_payment equals discounted_price)
+        # whose due_date does not match their registration date yet
         full_payment_students = Student.objects.filter(
-            advance_payment=F('discounted_price')
+            Q(due_date__isnull=True) | ~Q(due_date=TruncDate('created_at')),
+            advance_payment=F('discounted_price'),
+            created_at__isnull=False,
         )
 
-        count = full_payment_students.count()
-        self.stdout.write(f"Found {count} students who paid in full at once")
-
         # Update due_date to match created_at for these students
-        updated_count = 0
-        for student in full_payment_students:
-            if student.created_at:
-                student.due_date = student.created_at
-                student.save(update_fields=['due_date'])
-                updated_count += 1
+        updated_count = self.update_in_chunks(
+            full_payment_students, 'full payment students', due_date=TruncDate('created_at')
+        )
 
-        self.stdout.write(self.style.SUCCESS(f"Updated due_date for {updated_count} students"))
+        verb = 'Would update' if self.dry_run else 'Updated'
+        self.stdout.write(self.style.SUCCESS(f"{verb} due_date for {updated_count} students in {self.elapsed()}"))
         self.stdout.write(self.style.SUCCESS("Successfully completed due date updates"))
@@ -0,0 +1,34 @@
+# Generated by Django 4.1.3 on 2026-10-19 14:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0020_invoicesettings_avatar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invoice_type', models.CharField(choices=[('present', 'Regular'), ('pending', 'Pending Payment')], max_length=10)),
+                ('invoice_number', models.CharField(max_length=50)),
+                ('amount', models.IntegerField(default=0, help_text='Amount shown as paid on the invoice')),
+                ('csr_name', models.CharField(blank=True, max_length=100)),
+                ('html', models.BinaryField(help_text='gzip-compressed rendered HTML')),
+                ('issued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('regenerated_at', models.DateTimeField(blank=True, null=True)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_snapshots', to='pos.student')),
+            ],
+            options={
+                'verbose_name': 'Invoice Snapshot',
+                'verbose_name_plural': 'Invoice Snapshots',
+                'unique_together': {('student', 'invoice_type')},
+            },
+        ),
+    ]
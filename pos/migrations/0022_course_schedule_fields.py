@@ -0,0 +1,58 @@
+# Generated by Django 4.1.3 on 2026-10-19 14:31
+
+from django.db import migrations, models
+
+
+def derive_schedule_fields(apps, schema_editor):
+    """Fill the schedule columns from the comma-separated duration strings.
+
+    Mirrors Course.schedule_values() as it was when this migration was
+    written; one UPDATE per distinct duration string.
+    """
+    Course = apps.get_model('pos', 'Course')
+    for duration in Course.objects.values_list('duration', flat=True).distinct():
+        tags = {tag.strip() for tag in (duration or '').split(',') if tag.strip()}
+        one_month = '1_month' in tags
+        Course.objects.filter(duration=duration).update(
+            is_weekend='weekend' in tags,
+            is_weekdays='weekdays' in tags,
+            is_one_month=one_month,
+            lectures_required=12 if one_month else 24,
+            slot_minutes=60 if one_month else 90,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0021_invoicesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='is_one_month',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='is_weekdays',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='is_weekend',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lectures_required',
+            field=models.PositiveSmallIntegerField(default=24, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=90, editable=False, help_text='Length of one lecture'),
+        ),
+        migrations.RunPython(derive_schedule_fields, migrations.RunPython.noop),
+    ]
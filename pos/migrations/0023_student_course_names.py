@@ -0,0 +1,41 @@
+# Generated by Django 4.1.3 on 2026-10-19 14:32
+
+from django.db import migrations, models
+
+
+def fill_course_names(apps, schema_editor):
+    """Copy each student's course names from the through table, 1000 students at a time"""
+    Student = apps.get_model('pos', 'Student')
+    through = Student.courses.through
+    ids = list(Student.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), 1000):
+        names = {pk: [] for pk in ids[start:start + 1000]}
+        rows = through.objects.filter(student_id__in=names).order_by('student_id', 'course_id')
+        for student_id, course_name in rows.values_list('student_id', 'course__name'):
+            names[student_id].append(course_name)
+        Student.objects.bulk_update(
+            [Student(pk=pk, course_names=course_names, course_count=len(course_names))
+             for pk, course_names in names.items()],
+            ['course_names', 'course_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0022_course_schedule_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='course_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='course_names',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Names of the enrolled courses'),
+        ),
+        migrations.RunPython(fill_course_names, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.1.3 on 2026-10-19 14:48
+
+from django.db import migrations
+
+
+# Fill an empty created_by_name from the creating CSR (or 'Unknown') on every
+# write, including bulk_create(), update() and raw SQL that bypass Student.save().
+# Django 4.1 has no db_default, so the ORM always sends a value: the trigger
+# does the work and the column default only covers raw inserts.
+POSTGRES_INSTALL = [
+    """
+    CREATE OR REPLACE FUNCTION pos_student_fill_creator_name() RETURNS trigger AS $$
+    BEGIN
+        IF NEW.created_by_name IS NULL OR NEW.created_by_name = '' THEN
+            NEW.created_by_name := COALESCE(
+                (SELECT full_name FROM pos_csrprofile WHERE id = NEW.created_by_id), 'Unknown'
+            );
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS pos_student_fill_creator_name ON pos_student",
+    """
+    CREATE TRIGGER pos_student_fill_creator_name
+    BEFORE INSERT OR UPDATE OF created_by_name ON pos_student
+    FOR EACH ROW EXECUTE FUNCTION pos_student_fill_creator_name()
+    """,
+    "ALTER TABLE pos_student ALTER COLUMN created_by_name SET DEFAULT 'Unknown'",
+]
+POSTGRES_REMOVE = [
+    "ALTER TABLE pos_student ALTER COLUMN created_by_name DROP DEFAULT",
+    "DROP TRIGGER IF EXISTS pos_student_fill_creator_name ON pos_student",
+    "DROP FUNCTION IF EXISTS pos_student_fill_creator_name()",
+]
+
+# SQLite (local development and tests) cannot assign NEW in a trigger: fix
+# the row right after the write instead. Note that SQLite rebuilds the table
+# (dropping its triggers) when a later migration alters pos_student columns.
+SQLITE_FILL = """
+    BEGIN
+        UPDATE pos_student SET created_by_name = COALESCE(
+            (SELECT full_name FROM pos_csrprofile WHERE id = NEW.created_by_id), 'Unknown'
+        ) WHERE id = NEW.id;
+    END
+"""
+SQLITE_INSTALL = [
+    "CREATE TRIGGER IF NOT EXISTS pos_student_fill_creator_name_insert AFTER INSERT ON pos_student "
+    "WHEN NEW.created_by_name IS NULL OR NEW.created_by_name = ''" + SQLITE_FILL,
+    "CREATE TRIGGER IF NOT EXISTS pos_student_fill_creator_name_update AFTER UPDATE OF created_by_name ON pos_student "
+    "WHEN NEW.created_by_name IS NULL OR NEW.created_by_name = ''" + SQLITE_FILL,
+]
+SQLITE_REMOVE = [
+    "DROP TRIGGER IF EXISTS pos_student_fill_creator_name_insert",
+    "DROP TRIGGER IF EXISTS pos_student_fill_creator_name_update",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0023_student_course_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'postgresql': POSTGRES_INSTALL, 'sqlite': SQLITE_INSTALL}),
+            run_for_vendor({'postgresql': POSTGRES_REMOVE, 'sqlite': SQLITE_REMOVE}),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.3 on 2026-10-19 14:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0026_periodictask_lease'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(condition=models.Q(('balance__gt', 0), ('payment_status', 'pending')), fields=['second_installment_due_date', 'id'], name='pos_student_receivable_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.1.3 on 2026-10-19 16:05
+
+from datetime import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_payments(apps, schema_editor):
+    """Ledger rows from the fields the reports used so far, 1000 students at a time
+
+    The advance was counted as received at registration (created_at), the
+    second installment on the day the pending invoice was generated
+    (due_date), so the reports' totals do not change.
+    """
+    Student = apps.get_model('pos', 'Student')
+    Payment = apps.get_model('pos', 'Payment')
+    ids = list(Student.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(ids), 1000):
+        payments = []
+        students = Student.objects.filter(pk__in=ids[start:start + 1000]).values_list(
+            'pk', 'advance_payment', 'second_installment', 'payment_method', 'created_at', 'due_date', 'created_by_id',
+        )
+        for pk, advance, installment, method, created_at, due_date, creator_id in students:
+            if advance > 0:
+                payments.append(Payment(
+                    student_id=pk, amount=advance, kind='advance', method=method, paid_at=created_at, csr_id=creator_id,
+                ))
+            if installment > 0 and due_date:
+                paid_at = django.utils.timezone.make_aware(datetime.combine(due_date, datetime.min.time()))
+                payments.append(Payment(
+                    student_id=pk, amount=installment, kind='installment', method=method, paid_at=paid_at, csr_id=creator_id,
+                ))
+        Payment.objects.bulk_create(payments)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0027_student_receivable_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(help_text='Negative for a reversal')),
+                ('kind', models.CharField(choices=[('advance', 'Advance payment'), ('installment', 'Second installment'), ('reversal', 'Reversal')], max_length=12)),
+                ('method', models.CharField(choices=[('cash', 'Cash'), ('bank', 'Bank Transfer'), ('online', 'Online Payment')], default='cash', max_length=10)),
+                ('paid_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('csr', models.ForeignKey(blank=True, help_text='CSR who took the payment', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payments', to='pos.csrprofile')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='pos.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['paid_at', 'amount'], name='pos_payment_paid_at_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_payments, migrations.RunPython.noop),
+    ]
@@ -1,22 +1,107 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+from datetime import datetime, timedelta
 from decimal import Decimal
+import gzip
 from django.contrib.auth.models import User
+from .cache import invalidate
 
 
 class Course(models.Model):
+    # 1-month courses are 12 one-hour lectures; weekend/weekdays courses are 24 of 90 minutes
+    ONE_MONTH_LECTURES, ONE_MONTH_SLOT_MINUTES = 12, 60
+    STANDARD_LECTURES, STANDARD_SLOT_MINUTES = 24, 90
+    # Columns derived from `duration` on save
+    SCHEDULE_FIELDS = ('is_weekend', 'is_weekdays', 'is_one_month', 'lectures_required', 'slot_minutes')
+
     # Store comma-separated schedule/duration values (e.g., "weekend,1_month")
     name = models.CharField(max_length=100)
     trainer_name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2, help_text='Price in PKR')
     duration = models.CharField(max_length=100, help_text='Comma-separated schedule/duration tags')
+    # Structured copy of `duration`, kept in sync by save() so it can be filtered and indexed
+    is_weekend = models.BooleanField(default=False, db_index=True, editable=False)
+    is_weekdays = models.BooleanField(default=False, db_index=True, editable=False)
+    is_one_month = models.BooleanField(default=False, db_index=True, editable=False)
+    lectures_required = models.PositiveSmallIntegerField(default=STANDARD_LECTURES, editable=False)
+    slot_minutes = models.PositiveSmallIntegerField(default=STANDARD_SLOT_MINUTES, editable=False,
+                                                    help_text='Length of one lecture')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def parse_duration(duration):
+        """Return the list of tags in a comma-separated duration string"""
+        return [tag.strip() for tag in (duration or '').split(',') if tag.strip()]
+
+    @classmethod
+    def schedule_values(cls, duration):
+        """Return the derived schedule columns for a duration string (see SCHEDULE_FIELDS)"""
+        tags = cls.parse_duration(duration)
+        one_month = '1_month' in tags
+        return {
+            'is_weekend': 'weekend' in tags,
+            'is_weekdays': 'weekdays' in tags,
+            'is_one_month': one_month,
+            'lectures_required': cls.ONE_MONTH_LECTURES if one_month else cls.STANDARD_LECTURES,
+            'slot_minutes': cls.ONE_MONTH_SLOT_MINUTES if one_month else cls.STANDARD_SLOT_MINUTES,
+        }
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so save() can refresh the students' course_names after a rename
+        instance._loaded_name = instance.__dict__.get('name')
+        return instance
+
+    def save(self, *args, **kwargs):
+        for field, value in self.schedule_values(self.duration).items():
+            setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'duration' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(self.SCHEDULE_FIELDS)
+        renamed = (
+            getattr(self, '_loaded_name', None) not in (None, self.name)
+            and (update_fields is None or 'name' in update_fields)
+        )
+        super().save(*args, **kwargs)
+        if renamed:
+            self._loaded_name = self.name
+            self.students.all().refresh_course_cache()
+
+
+def numbered_invoices():
+    """Count of the regular and pending invoice numbers issued, over StudentInvoice rows"""
+    return Count('pk', filter=Q(present_invoice_no__gt=0)) + Count('pk', filter=Q(pending_invoice_no__gt=0))
+
+
+class CSRProfileQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate the per-CSR counts shown on the management pages, in this one query
+        
+        num_students, num_paid_students (paid in full) and num_invoices
+        (invoices issued for the CSR's students) back student_count and
+        invoice_count without a COUNT per row.
+        """
+        invoices = (
+            StudentInvoice.objects.filter(student__created_by=OuterRef('pk'))
+            .order_by().values('student__created_by').annotate(n=numbered_invoices()).values('n')
+        )
+        return self.annotate(
+            num_students=Count('students', distinct=True),
+            num_paid_students=Count(
+                'students', filter=Q(students__payment_status='paid', students__balance=0), distinct=True
+            ),
+            num_invoices=Coalesce(Subquery(invoices), 0),
+        )
+
 
 class CSRProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='csr_profile')
@@ -29,18 +114,39 @@ class CSRProfile(models.Model):
     def __str__(self):
         return self.full_name
     
+    objects = CSRProfileQuerySet.as_manager()
+    
     def get_full_name(self):
         return self.full_name
     
     @property
     def invoice_count(self):
-        return self.invoices.count() if hasattr(self, 'invoices') else 0
-
-
+        """Invoices issued for this CSR's students (annotated by with_stats(), else one COUNT)"""
+        if hasattr(self, 'num_invoices'):
+            return self.num_invoices
+        return StudentInvoice.objects.filter(student__created_by=self).aggregate(n=numbered_invoices())['n']
 
     @property
     def student_count(self):
-        return self.students.count() if hasattr(self, 'students') else 0
+        if hasattr(self, 'num_students'):
+            return self.num_students
+        return self.students.count()
+
+
+class BatchQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Annotate student count and revenue sums per batch, in this one query
+        
+        num_students backs student_count; total_revenue, received_payment
+        and pending_payment sum the students' discounted price, advance and
+        second installment (None for a batch without students).
+        """
+        return self.annotate(
+            num_students=Count('students'),
+            total_revenue=Sum('students__discounted_price'),
+            received_payment=Sum('students__advance_payment'),
+            pending_payment=Sum('students__second_installment'),
+        )
 
 
 class Batch(models.Model):
@@ -55,14 +161,156 @@ class Batch(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = BatchQuerySet.as_manager()
+    
     def __str__(self):
         return f"Batch {self.batch_number}"
     
     @property
     def student_count(self):
+        if hasattr(self, 'num_students'):
+            return self.num_students
         return self.students.count()
 
 
+# Receivables aging buckets: (key, label, days overdue up to and including);
+# no due date or a due date not yet passed is current
+AGING_BUCKETS = [
+    ('current', 'Current', 0),
+    ('1-30', '1-30 days', 30),
+    ('31-60', '31-60 days', 60),
+    ('61-90', '61-90 days', 90),
+    ('90+', '90+ days', None),
+]
+
+
+def day_start(day):
+    """The first moment of `day` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def paid_between(start=None, end=None, prefix=''):
+    """Q for payments received on the dates start..end (inclusive; either may be None)
+    
+    `prefix` is the path to the payment, e.g. 'payments__' from a student.
+    """
+    condition = Q()
+    if start:
+        condition &= Q(**{f'{prefix}paid_at__gte': day_start(start)})
+    if end:
+        condition &= Q(**{f'{prefix}paid_at__lt': day_start(end + timedelta(days=1))})
+    return condition
+
+
+class StudentQuerySet(models.QuerySet):
+    """Set-based payment status transitions, mirroring Student.save()."""
+    
+    def _transition(self, ids, from_status, to_status, record, **changes):
+        with transaction.atomic():
+            # Locked, so the ledger gets exactly the rows this UPDATE changes
+            changed = list(
+                self.filter(pk__in=ids, payment_status=from_status).select_for_update().values_list('pk', flat=True)
+            )
+            if not changed:
+                return 0
+            updated = self.filter(pk__in=changed).update(
+                payment_status=to_status, updated_at=timezone.now(), **changes
+            )
+            record(changed)
+        # update() skips the post_save signal that invalidates cached fragments
+        invalidate('students')
+        return updated
+    
+    def mark_paid(self, ids, paid_at=None, csr=None, **changes):
+        """Mark the pending students in `ids` as paid in one UPDATE; returns the number changed
+        
+        Extra `changes` (e.g. payment_method) are written to the changed rows only.
+        Their second installment is recorded in the payment ledger, received
+        at `paid_at` (default now) by `csr`, unless already recorded.
+        """
+        return self._transition(
+            ids, 'pending', 'paid',
+            lambda changed: Payment.objects.record_installments(changed, paid_at, csr, changes.get('payment_method')),
+            balance=0, total_amount=F('advance_payment') + F('second_installment'), **changes
+        )
+    
+    def mark_pending(self, ids, csr=None, **changes):
+        """Mark the paid students in `ids` as pending in one UPDATE, reversing their recorded installment; returns the number changed"""
+        return self._transition(
+            ids, 'paid', 'pending',
+            lambda changed: Payment.objects.record_reversals(changed, csr),
+            balance=F('second_installment'), total_amount=F('advance_payment'), **changes
+        )
+    
+    def with_installment_received(self):
+        """Annotate `installment_received`: the second installment payments in the ledger, net of reversals"""
+        return self.annotate(installment_received=Coalesce(
+            Sum('payments__amount', filter=Q(payments__kind__in=INSTALLMENT_KINDS)), 0
+        ))
+    
+    def receivables(self):
+        """Pending students with an outstanding balance (the rows of pos_student_receivable_idx)"""
+        return self.filter(payment_status='pending', balance__gt=0)
+    
+    def with_aging(self, today):
+        """Annotate `aging` (an AGING_BUCKETS key) from second_installment_due_date as of `today`
+        
+        Compares the due date against precomputed cut-off dates rather than
+        computing days overdue per row, so the comparison can use the index.
+        """
+        whens = [
+            When(second_installment_due_date__gte=today - timedelta(days=days), then=Value(key))
+            for key, _, days in AGING_BUCKETS[1:-1]
+        ]
+        return self.annotate(aging=Case(
+            When(Q(second_installment_due_date__isnull=True) | Q(second_installment_due_date__gte=today), then=Value('current')),
+            *whens,
+            default=Value(AGING_BUCKETS[-1][0]),
+            output_field=models.CharField(),
+        ))
+    
+    def in_aging_bucket(self, key, today):
+        """Filter to one aging bucket as of `today` with due date ranges (index-friendly)"""
+        if key == 'current':
+            return self.filter(Q(second_installment_due_date__isnull=True) | Q(second_installment_due_date__gte=today))
+        keys = [bucket for bucket, _, _ in AGING_BUCKETS]
+        index = keys.index(key)
+        # Overdue by more than the previous bucket's days, and at most this bucket's (if bounded)
+        queryset = self.filter(second_installment_due_date__lt=today - timedelta(days=AGING_BUCKETS[index - 1][2]))
+        days = AGING_BUCKETS[index][2]
+        if days is not None:
+            queryset = queryset.filter(second_installment_due_date__gte=today - timedelta(days=days))
+        return queryset
+    
+    def course_cache_values(self, ids):
+        """Return {student id: [course names]} for `ids`, read from the through table in course id order"""
+        names = {pk: [] for pk in ids}
+        through = self.model.courses.through
+        rows = through.objects.filter(student_id__in=ids).order_by('student_id', 'course_id')
+        for student_id, course_name in rows.values_list('student_id', 'course__name'):
+            names[student_id].append(course_name)
+        return names
+    
+    def refresh_course_cache(self, chunk_size=1000):
+        """Recompute course_names/course_count of the students in this queryset; returns the number updated
+        
+        One read of the through table and one bulk UPDATE per chunk of students.
+        """
+        ids = list(self.values_list('pk', flat=True))
+        now = timezone.now()
+        for start in range(0, len(ids), chunk_size):
+            names = self.course_cache_values(ids[start:start + chunk_size])
+            self.model.objects.bulk_update(
+                [self.model(pk=pk, course_names=course_names, course_count=len(course_names), updated_at=now)
+                 for pk, course_names in names.items()],
+                ['course_names', 'course_count', 'updated_at'],
+            )
+        if ids:
+            # bulk_update() skips the post_save signal that invalidates cached fragments
+            invalidate('students')
+        return len(ids)
+
+
 class Student(models.Model):
     """Student model for storing student information"""
     SCHEDULE_CHOICES = [
@@ -87,6 +335,10 @@ class Student(models.Model):
     phone_number = models.CharField(max_length=15)
     cnic = models.CharField(max_length=15, blank=True, help_text="CNIC or B-Form number")
     courses = models.ManyToManyField(Course, related_name='students')
+    # Denormalized from `courses` for listings and exports (filters still use the through table);
+    # kept in sync by StudentQuerySet.refresh_course_cache() on m2m_changed and course renames
+    course_names = models.JSONField(default=list, blank=True, editable=False, help_text="Names of the enrolled courses")
+    course_count = models.PositiveSmallIntegerField(default=0, editable=False)
     batch = models.ForeignKey(Batch, on_delete=models.CASCADE, related_name='students')
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0, validators=[MinValueValidator(0)], help_text="Discount percentage")
     total_fees = models.IntegerField(validators=[MinValueValidator(0)])
@@ -107,30 +359,58 @@ class Student(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Loaded values remembered by from_db()/refresh_from_db() so save() can detect changes
+    TRACKED_FIELDS = ('payment_status',)
+    _loaded_values = {}
+    
+    objects = StudentQuerySet.as_manager()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_loaded_values()
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._remember_loaded_values(fields)
+    
+    def _remember_loaded_values(self, fields=None):
+        loaded = dict(self._loaded_values)
+        for name in self.TRACKED_FIELDS:
+            if name in self.__dict__ and (fields is None or name in fields):
+                loaded[name] = self.__dict__[name]
+        self._loaded_values = loaded
+    
     def save(self, *args, **kwargs):
         """Persist creator CSR name and handle payment status changes."""
         # Check if this is an existing record being updated
         if self.pk:
-            # Get the original object from the database
-            try:
-                original = Student.objects.get(pk=self.pk)
-                
-                # If payment status is changing from pending to paid
-                if original.payment_status == 'pending' and self.payment_status == 'paid':
-                    # Set balance to 0 when payment status changes to paid
-                    # But keep second_installment value for record-keeping
-                    self.balance = 0
-                    # Update total_amount to include both advance payment and second installment
-                    self.total_amount = self.advance_payment + self.second_installment
-                
-                # If payment status is changing from paid to pending
-                elif original.payment_status == 'paid' and self.payment_status == 'pending':
-                    # Restore balance to match second_installment when going back to pending
-                    self.balance = self.second_installment
-                    # Reset total_amount to just advance payment
-                    self.total_amount = self.advance_payment
-            except Student.DoesNotExist:
-                pass
+            # Compare with the status loaded from the database; only instances
+            # that were not loaded from it (or deferred the field) need a lookup
+            original_status = self._loaded_values.get('payment_status')
+            if original_status is None:
+                original_status = Student.objects.filter(pk=self.pk).values_list('payment_status', flat=True).first()
+            
+            # If payment status is changing from pending to paid
+            if original_status == 'pending' and self.payment_status == 'paid':
+                # Set balance to 0 when payment status changes to paid
+                # But keep second_installment value for record-keeping
+                self.balance = 0
+                # Update total_amount to include both advance payment and second installment
+                self.total_amount = self.advance_payment + self.second_installment
+            
+            # If payment status is changing from paid to pending
+            elif original_status == 'paid' and self.payment_status == 'pending':
+                # Restore balance to match second_installment when going back to pending
+                self.balance = self.second_installment
+                # Reset total_amount to just advance payment
+                self.total_amount = self.advance_payment
+            
+            # A partial save of the status must also write the fields derived from it
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'payment_status' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'balance', 'total_amount'}
         else:
             # For new records, initialize balance to match second_installment
             self.balance = self.second_installment
@@ -146,20 +426,36 @@ class Student(models.Model):
             self.created_by_name = self.created_by.get_full_name()
             
         super().save(*args, **kwargs)
+        self._remember_loaded_values()
+
+    class Meta:
+        indexes = [
+            # Receivables (aging report): only the pending rows with a balance, in due date order
+            models.Index(
+                fields=['second_installment_due_date', 'id'],
+                condition=Q(payment_status='pending', balance__gt=0),
+                name='pos_student_receivable_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def course_list(self):
+        """Comma-joined course names, from the denormalized course_names"""
+        return ', '.join(self.course_names)
+
     def get_creator_name(self):
-        """Return the name of the CSR who enrolled the student, falling back to stored value."""
-        # If CSR still exists, prefer its current full name
-        if self.created_by:
-            # If local cache missing, backfill it
-            if not self.created_by_name:
-                self.created_by_name = self.created_by.get_full_name()
-                super().save(update_fields=["created_by_name"])
+        """Return the name of the CSR who enrolled the student, falling back to stored value.
+        
+        Read-only and query-free: the CSR's current name is used only when
+        created_by was loaded (select_related); otherwise the stored name.
+        Empty stored names are filled by the backfill_creator_names command
+        and, for new rows, by a database trigger (migration 0024).
+        """
+        if Student.created_by.is_cached(self) and self.created_by:
             return self.created_by.get_full_name()
-        # Fallback to stored name
         return self.created_by_name or "Unknown"
 
     @property
@@ -169,6 +465,101 @@ class Student(models.Model):
         return self.balance
 
 
+# Kinds of ledger entries; a reversal (negative) cancels a second installment
+PAYMENT_KINDS = [
+    ('advance', 'Advance payment'),
+    ('installment', 'Second installment'),
+    ('reversal', 'Reversal'),
+]
+INSTALLMENT_KINDS = ('installment', 'reversal')
+
+
+class PaymentQuerySet(models.QuerySet):
+    """Ledger writes (bulk, one INSERT per call) and date-range reads."""
+    
+    def received_between(self, start=None, end=None):
+        """Payments received on the dates start..end (inclusive; either may be None)"""
+        return self.filter(paid_between(start, end))
+    
+    def _record(self, payments):
+        payments = self.bulk_create(payments)
+        if payments:
+            # bulk_create() skips the post_save signal that invalidates cached fragments
+            invalidate('students')
+        return len(payments)
+    
+    def record_advances(self, students, csr=None):
+        """Record the advance payment of newly enrolled `students`, received when they registered"""
+        return self._record([
+            self.model(
+                student_id=student.pk, amount=student.advance_payment, kind='advance', method=student.payment_method,
+                paid_at=student.created_at, csr_id=csr.pk if csr else student.created_by_id,
+            )
+            for student in students if student.advance_payment > 0
+        ])
+    
+    def record_installments(self, ids, paid_at=None, csr=None, method=None):
+        """Record the second installment of the students in `ids`; returns the number recorded
+        
+        Students whose installment is already recorded (and not reversed),
+        e.g. when their pending invoice was generated, are skipped.
+        """
+        owed = Student.objects.filter(pk__in=ids, second_installment__gt=0).with_installment_received()
+        owed = owed.filter(installment_received__lte=0)
+        paid_at = paid_at or timezone.now()
+        return self._record([
+            self.model(
+                student_id=pk, amount=amount, kind='installment', method=method or student_method,
+                paid_at=paid_at, csr_id=csr.pk if csr else creator_id,
+            )
+            for pk, amount, student_method, creator_id in owed.values_list(
+                'pk', 'second_installment', 'payment_method', 'created_by_id'
+            )
+        ])
+    
+    def record_reversals(self, ids, csr=None):
+        """Reverse the recorded second installment of the students in `ids`; returns the number reversed"""
+        received = Student.objects.filter(pk__in=ids).with_installment_received().filter(installment_received__gt=0)
+        now = timezone.now()
+        return self._record([
+            self.model(
+                student_id=pk, amount=-amount, kind='reversal', method=student_method,
+                paid_at=now, csr_id=csr.pk if csr else creator_id,
+            )
+            for pk, amount, student_method, creator_id in received.values_list(
+                'pk', 'installment_received', 'payment_method', 'created_by_id'
+            )
+        ])
+
+
+class Payment(models.Model):
+    """
+    One payment received from a student, or the reversal of one: the ledger
+    behind every "received in range" figure of the reports. Enrollment
+    records the advance; marking a student paid or generating the pending
+    invoice records the second installment (see PaymentQuerySet). Rows are
+    only ever added, so a range total is one SUM over the paid_at index.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='payments')
+    amount = models.IntegerField(help_text="Negative for a reversal")
+    kind = models.CharField(max_length=12, choices=PAYMENT_KINDS)
+    method = models.CharField(max_length=10, choices=Student.PAYMENT_METHOD_CHOICES, default='cash')
+    paid_at = models.DateTimeField(default=timezone.now)
+    csr = models.ForeignKey(CSRProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='payments', help_text="CSR who took the payment")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = PaymentQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Received in a date range: an index-only scan for SUM(amount)
+            models.Index(fields=['paid_at', 'amount'], name='pos_payment_paid_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.amount} for {self.student_id}"
+
+
 class InvoiceSettings(models.Model):
     """Model to store CSR-specific invoice settings"""
     csr = models.OneToOneField(CSRProfile, on_delete=models.CASCADE, related_name='invoice_settings')
@@ -194,9 +585,36 @@ class InvoiceSettings(models.Model):
         return f"{self.current_serial_number}"
         
     def increment_serial_number(self):
-        """Increment the serial number counter and save"""
-        self.current_serial_number += 1
-        self.save()
+        """Increment the serial number counter (atomically, see reserve_serial_numbers)"""
+        self.reserve_serial_numbers(1)
+        
+    def reserve_serial_numbers(self, count=1):
+        """Atomically reserve `count` consecutive serial numbers and return them as a range.
+        
+        A single UPDATE ... RETURNING bumps the counter in the database, so
+        concurrent callers never receive the same number and no other column
+        of the settings row is rewritten. current_serial_number on this
+        instance is only refreshed for display.
+        """
+        table = connection.ops.quote_name(self._meta.db_table)
+        if connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET current_serial_number = current_serial_number + %s, updated_at = %s "
+                    f"WHERE id = %s RETURNING current_serial_number",
+                    [count, timezone.now(), self.pk],
+                )
+                last = cursor.fetchone()[0]
+        else:
+            # No RETURNING support: the UPDATE row lock is held until the read
+            with transaction.atomic():
+                InvoiceSettings.objects.filter(pk=self.pk).update(
+                    current_serial_number=F('current_serial_number') + count,
+                    updated_at=timezone.now(),
+                )
+                last = InvoiceSettings.objects.filter(pk=self.pk).values_list('current_serial_number', flat=True).get()
+        self.current_serial_number = last
+        return range(last - count + 1, last + 1)
         
     def get_next_serial_number(self):
         """DEPRECATED: Use get_current_serial_number() instead.
@@ -219,6 +637,155 @@ class StudentInvoice(models.Model):
     def __str__(self):
         return f"Invoice for {self.student.name}"
     
+    def assign_number(self, invoice_settings, pending=False):
+        """Give this invoice a serial number from `invoice_settings` if it has none yet.
+        
+        Returns the (new or existing) number; only the invoice number column is written.
+        The row is locked while the number is checked and reserved, so two
+        concurrent first prints get the same number and no serial is burned.
+        """
+        field = 'pending_invoice_no' if pending else 'present_invoice_no'
+        if getattr(self, field) == 0:
+            with transaction.atomic():
+                number = StudentInvoice.objects.select_for_update().filter(pk=self.pk).values_list(field, flat=True).get()
+                if number == 0:
+                    number = invoice_settings.reserve_serial_numbers(1)[0]
+                    StudentInvoice.objects.filter(pk=self.pk).update(**{field: number, 'updated_at': timezone.now()})
+            setattr(self, field, number)
+        return getattr(self, field)
+    
     class Meta:
         verbose_name = "Student Invoice"
         verbose_name_plural = "Student Invoices"
+
+
+class InvoiceSnapshot(models.Model):
+    """
+    Rendered invoice stored at first issuance, one per student and invoice type.
+    Reprints serve the stored (gzip-compressed) HTML, so an issued invoice never
+    changes when bank details or student data are edited later; use the
+    regenerate action to re-render it after a correction.
+    """
+    INVOICE_TYPE_CHOICES = [
+        ('present', 'Regular'),
+        ('pending', 'Pending Payment'),
+    ]
+    
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='invoice_snapshots')
+    invoice_type = models.CharField(max_length=10, choices=INVOICE_TYPE_CHOICES)
+    invoice_number = models.CharField(max_length=50)
+    amount = models.IntegerField(default=0, help_text="Amount shown as paid on the invoice")
+    csr_name = models.CharField(max_length=100, blank=True)
+    html = models.BinaryField(help_text="gzip-compressed rendered HTML")
+    issued_at = models.DateTimeField(default=timezone.now)
+    regenerated_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Invoice #{self.invoice_number} ({self.get_invoice_type_display()}) for {self.student_id}"
+    
+    class Meta:
+        unique_together = ['student', 'invoice_type']
+        verbose_name = "Invoice Snapshot"
+        verbose_name_plural = "Invoice Snapshots"
+    
+    @classmethod
+    def store(cls, student, invoice_type, html, **fields):
+        """Save (or replace, when regenerating) the rendered HTML of an invoice"""
+        fields['html'] = gzip.compress(html.encode('utf-8'))
+        snapshot, created = cls.objects.get_or_create(student=student, invoice_type=invoice_type, defaults=fields)
+        if not created:
+            for name, value in fields.items():
+                setattr(snapshot, name, value)
+            snapshot.regenerated_at = timezone.now()
+            snapshot.save()
+        return snapshot
+    
+    def get_html(self):
+        """Return the decompressed HTML"""
+        return gzip.decompress(bytes(self.html)).decode('utf-8')
+    
+    def get_body_html(self):
+        """Return the content of the stored document's <body>, to print it inside another page"""
+        html = self.get_html()
+        return html.split('<body>', 1)[-1].rsplit('</body>', 1)[0]
+
+
+class Job(models.Model):
+    """
+    Background job in the database-backed queue (see pos/jobs.py).
+    The web tier only enqueues rows; `manage.py run_worker` claims and runs
+    them, retrying failures with exponential backoff.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    task = models.CharField(max_length=100, help_text="Registered task name")
+    kwargs = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
+    priority = models.SmallIntegerField(default=0, help_text="Higher priorities run first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now, help_text="Not started before this time (retry backoff)")
+    locked_by = models.CharField(max_length=100, blank=True, help_text="Worker running the job")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True, help_text="Traceback of the last failed attempt")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"Job #{self.pk} {self.task} ({self.status})"
+    
+    class Meta:
+        indexes = [
+            # Only queued rows are scanned when claiming, in claim order
+            models.Index(fields=['-priority', 'run_at'], condition=Q(status='queued'), name='pos_job_queued_idx'),
+        ]
+
+
+class PeriodicTask(models.Model):
+    """
+    Run history of a task scheduled in the periodic registry (see
+    pos/scheduler.py). Rows are created by `manage.py run_scheduler`;
+    admins can pause a task or make it run at the next tick.
+    """
+    STATUS_CHOICES = [
+        ('', 'Never run'),
+        ('ok', 'OK'),
+        ('error', 'Error'),
+    ]
+    
+    name = models.CharField(max_length=100, unique=True, help_text="Registered task name")
+    schedule = models.CharField(max_length=100, blank=True, help_text="Schedule from the registry, for display")
+    enabled = models.BooleanField(default=True)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_duration = models.FloatField(null=True, blank=True, help_text="Seconds")
+    last_status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True)
+    last_result = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    last_error = models.TextField(blank=True)
+    run_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        ordering = ['name']
+
+
+class Lease(models.Model):
+    """
+    Named lease held by one process at a time until it expires, e.g. so that
+    only one `run_scheduler` instance runs the periodic tasks.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.CharField(max_length=100, blank=True)
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.name} ({self.holder or 'free'})"
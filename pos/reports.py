@@ -0,0 +1,1200 @@
+"""
+Report views: student and revenue reports, their Excel exports, the
+commission report and the receivables aging report.
+
+Kept apart from pos.views so that the login and dashboard routes do not
+import the report machinery: pos.urls loads this module on the first report
+request (see lazy_view there), and openpyxl only when a workbook is built.
+"""
+from django.conf import settings
+from django.shortcuts import render, redirect
+from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib import messages
+from django.utils import timezone
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.db.models import Count, Exists, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import AGING_BUCKETS, INSTALLMENT_KINDS, CSRProfile, Course, Batch, Payment, Student, day_start, paid_between
+from .cache import cached, conditional, single_flight
+import io
+import csv
+from datetime import datetime, timedelta
+
+
+# Comparison periods of the revenue report, for a bounded date range
+COMPARISONS = {
+    'previous': 'Previous period',
+    'last_year': 'Same period last year',
+}
+REVENUE_METRICS = ('total_revenue', 'received_payment', 'pending_payment', 'student_count')
+
+
+def comparison_period(kind, start, end):
+    """The (start, end) dates compared with the range start..end (inclusive)"""
+    if kind == 'previous':
+        # The same number of days, ending the day before the range starts
+        previous_end = start - timedelta(days=1)
+        return previous_end - (end - start), previous_end
+    return _year_before(start), _year_before(end)
+
+
+def _year_before(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+
+def payment_activity(start, end):
+    """Q for students who registered or had a payment received on the dates start..end (either may be None)"""
+    registered = Q()
+    if start:
+        registered &= Q(created_at__gte=day_start(start))
+    if end:
+        registered &= Q(created_at__lt=day_start(end + timedelta(days=1)))
+    return registered | Q(Exists(Payment.objects.received_between(start, end).filter(student=OuterRef('pk'))))
+
+
+def with_payments_in_range(students, start, end):
+    """Annotate the ledger's advance_in_range and second_installment_in_range (net of reversals) on `students`"""
+    payments = Payment.objects.received_between(start, end).filter(student=OuterRef('pk')).order_by().values('student')
+    def received(kinds):
+        return Coalesce(Subquery(payments.filter(kind__in=kinds).annotate(total=Sum('amount')).values('total')), 0)
+    return students.annotate(advance_in_range=received(['advance']), second_installment_in_range=received(INSTALLMENT_KINDS))
+
+
+def _period_aggregates(suffix, start, end):
+    """Conditional aggregates of the student metrics for one period, named <metric><suffix>
+
+    They cover the students who registered or paid in the period (all of
+    them without bounds); the payments received come from the ledger, see
+    _received_by().
+    """
+    active = payment_activity(start, end) if start or end else None
+    return {
+        f'total_revenue{suffix}': Coalesce(Sum('discounted_price', filter=active), 0),
+        f'pending_payment{suffix}': Coalesce(Sum('balance', filter=active), 0),
+        f'student_count{suffix}': Count('id', filter=active),
+    }, active
+
+
+def _received_by(field, students, periods):
+    """{group: {'received_payment<suffix>': amount}} of `students` from the payment ledger
+
+    One grouped SUM over the payments in the periods (a range scan of the
+    paid_at index), with one conditional sum per period.
+    """
+    payments = Payment.objects.filter(student__in=students.values('pk'))
+    if all(start or end for start, end in periods.values()):
+        window = Q()
+        for start, end in periods.values():
+            window |= paid_between(start, end)
+        payments = payments.filter(window)
+    aggregates = {
+        f'received_payment{suffix}': Coalesce(Sum('amount', filter=paid_between(start, end)), 0)
+        for suffix, (start, end) in periods.items()
+    }
+    return {
+        row.pop(f'student__{field}'): row
+        for row in payments.values(f'student__{field}').annotate(**aggregates).order_by()
+    }
+
+
+def _with_changes(current, previous):
+    """`previous` metrics plus their change to `current`: <metric>_delta and <metric>_pct (None from zero)"""
+    compared = dict(previous)
+    for metric in REVENUE_METRICS:
+        delta = current[metric] - previous[metric]
+        compared[f'{metric}_delta'] = delta
+        compared[f'{metric}_pct'] = round(delta * 100 / previous[metric], 1) if previous[metric] else None
+    return compared
+
+
+def _metrics(row, suffix=''):
+    return {
+        metric: row[f'{metric}{suffix}'] if metric == 'student_count' else float(row[f'{metric}{suffix}'])
+        for metric in REVENUE_METRICS
+    }
+
+
+def calculate_date_range_revenue(students, start_date=None, end_date=None, compare=()):
+    """Revenue by batch and by course, from the payments received within the date range
+
+    Two grouped queries per grouping, the students' metrics and the payment
+    ledger's sums, compute the range and every comparison period in `compare`
+    (keys of COMPARISONS; only for a bounded range) with conditional
+    aggregates, i.e. SUM(...) FILTER (WHERE ...) on PostgreSQL.
+    With comparisons each row gets a `comparison` dict: per period its
+    metrics with their deltas and percentages.
+    """
+    if isinstance(start_date, str):
+        start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+    if isinstance(end_date, str):
+        end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    periods = {'': (start_date, end_date)}
+    if start_date and end_date:
+        for kind in compare:
+            periods[f'_{kind}'] = comparison_period(kind, start_date, end_date)
+
+    aggregates, activity = {}, Q()
+    for suffix, (start, end) in periods.items():
+        period_aggregates, active = _period_aggregates(suffix, start, end)
+        aggregates.update(period_aggregates)
+        if active is not None:
+            activity |= active
+    # Only students with a payment in one of the periods
+    active_students = students.filter(activity)
+
+    def grouped(field):
+        received = _received_by(field, students, periods)
+        rows = []
+        for row in active_students.values(field).annotate(**aggregates).order_by(field):
+            if row[field] is None:
+                # Students without a course
+                continue
+            row.update(received.get(row[field]) or {f'received_payment{suffix}': 0 for suffix in periods})
+            item = {field: row[field], **_metrics(row)}
+            if len(periods) > 1:
+                item['comparison'] = {
+                    suffix[1:]: _with_changes(item, _metrics(row, suffix)) for suffix in periods if suffix
+                }
+            rows.append(item)
+        return rows
+
+    # A student in several courses counts under each of them
+    return grouped('batch__batch_number'), grouped('courses__name')
+
+
+def comparison_totals(rows):
+    """Per comparison period, the totals of `rows` with their change against the rows' own totals"""
+    if not rows or 'comparison' not in rows[0]:
+        return {}
+    current = {metric: sum(item[metric] for item in rows) for metric in REVENUE_METRICS}
+    return {
+        kind: _with_changes(current, {
+            metric: sum(item['comparison'][kind][metric] for item in rows) for metric in REVENUE_METRICS
+        })
+        for kind in rows[0]['comparison']
+    }
+
+
+def _comparison_periods(start_date, end_date, compare):
+    """{kind: {'label', 'start', 'end'}} of the requested comparison periods (ISO dates)"""
+    if not (start_date and end_date):
+        return {}
+    periods = {}
+    for kind in compare:
+        start, end = comparison_period(kind, start_date, end_date)
+        periods[kind] = {'label': COMPARISONS[kind], 'start': start.isoformat(), 'end': end.isoformat()}
+    return periods
+
+
+def _revenue_creator(user):
+    """(everyone, csr id): admins and lead CSRs see every student, other users those they created"""
+    if user.is_superuser:
+        return True, None
+    try:
+        csr = user.csr_profile
+    except CSRProfile.DoesNotExist:
+        return False, None
+    return csr.lead_role, csr.id
+
+
+def _revenue_scope(user, batch_id, course_id):
+    """(students the revenue reports cover, scope key): all for admins and lead CSRs, own students otherwise"""
+    everyone, csr_id = _revenue_creator(user)
+    if everyone:
+        students, scope = Student.objects.all(), 'all'
+    else:
+        students, scope = Student.objects.filter(created_by_id=csr_id), f'csr-{csr_id}' if csr_id else 'none'
+    
+    if batch_id:
+        students = students.filter(batch_id=batch_id)
+    if course_id:
+        # A subquery rather than a join, so the per-course grouping still sees all of the student's courses
+        students = students.filter(id__in=Student.courses.through.objects.filter(course_id=course_id).values('student_id'))
+    return students, scope
+
+
+def snapshot_revenue(user, batch_id, course_id, start_date=None, end_date=None, compare=()):
+    """calculate_date_range_revenue() computed from the in-memory snapshot (pos/analytics.py)
+
+    Same rows and comparisons, with the same rules as _period_aggregates()
+    and _received_by(), without querying the students or the payments.
+    """
+    from .analytics import get_frame
+
+    frame = get_frame()
+    everyone, csr_id = _revenue_creator(user)
+    scope = frame.mask(
+        everyone, csr_id, batch=int(batch_id) if batch_id else None, course=int(course_id) if course_id else None,
+    )
+    periods = {'': (start_date, end_date)}
+    if start_date and end_date:
+        for kind in compare:
+            periods[kind] = comparison_period(kind, start_date, end_date)
+
+    batches, courses = get_filter_options()
+    labels = {
+        'batch': ('batch__batch_number', {batch.id: batch.batch_number for batch in batches}),
+        'course': ('courses__name', {course.id: course.name for course in courses}),
+    }
+    # Per period, the students who registered or paid in it
+    active = {
+        kind: frame.ops.both(scope, frame.ops.either(frame.between('registered', start, end), frame.paid(start, end)))
+        if start or end else scope
+        for kind, (start, end) in periods.items()
+    }
+    groupings = []
+    for by, (field, names) in labels.items():
+        metrics = {}
+        for kind, (start, end) in periods.items():
+            metrics[kind] = {
+                'total_revenue': frame.group(by, active[kind], 'discounted_price'),
+                'received_payment': frame.received(by, scope, start, end),
+                'pending_payment': frame.group(by, active[kind], 'balance'),
+                'student_count': frame.group(by, active[kind]),
+            }
+        # Groups with a payment in one of the periods
+        keys = {key for period in metrics.values() for key in period['student_count']}
+        rows = []
+        for key in keys:
+            values = {
+                kind: {
+                    metric: totals.get(key, 0) if metric == 'student_count' else float(totals.get(key, 0))
+                    for metric, totals in period.items()
+                }
+                for kind, period in metrics.items()
+            }
+            item = {field: names.get(key, str(key)), **values.pop('')}
+            if values:
+                item['comparison'] = {kind: _with_changes(item, period) for kind, period in values.items()}
+            rows.append(item)
+        groupings.append(sorted(rows, key=lambda item: item[field]))
+    return groupings[0], groupings[1]
+
+
+def get_filter_options():
+    """Return the (batches, courses) lists used by the report filter dropdowns (cached)"""
+    return cached('filter_options', lambda: (list(Batch.objects.all()), list(Course.objects.all())))
+
+
+# Report Generation Views
+@login_required
+def report_students(request):
+    """Generate student details report with filters"""
+    # Get filter parameters
+    batch_id = request.GET.get('batch')
+    course_id = request.GET.get('course')
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    payment_status = request.GET.get('payment_status')
+    export_format = request.GET.get('export')
+    
+    # Determine base queryset based on user role
+    base_students = Student.objects.select_related('batch', 'created_by')
+    csr = None
+    if not request.user.is_superuser:
+        try:
+            csr = request.user.csr_profile
+        except CSRProfile.DoesNotExist:
+            csr = None
+
+    if request.user.is_superuser or (csr and csr.lead_role):
+        students = base_students
+    else:
+        # Regular CSRs only see their own students
+        students = base_students.filter(created_by=csr)
+    
+    # Apply filters if provided
+    if batch_id:
+        students = students.filter(batch_id=batch_id)
+    
+    if course_id:
+        students = students.filter(courses__id=course_id)
+    
+    start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    if start_date or end_date:
+        # Students who registered or made a payment within the date range, with their payments in it
+        students = with_payments_in_range(students.filter(payment_activity(start_date, end_date)).distinct(), start_date, end_date)
+    
+    if payment_status:
+        students = students.filter(payment_status=payment_status)
+    
+    # Get all batches and courses for the filter dropdown
+    batches, courses = get_filter_options()
+    
+    # Check if we need to export to Excel
+    if export_format == 'excel':
+        # Imported here: openpyxl is slow to import and only needed for exports
+        from openpyxl import Workbook
+        from openpyxl.utils import get_column_letter
+        
+        # Create a new workbook
+        wb = Workbook()
+        
+        # Create Student Details Sheet
+        ws = wb.active
+        ws.title = "Student Details"
+        
+        # Define headers for Excel export
+        headers = [
+            'ID', 'Name', 'Course', 'Status', 'CSR', 'Phone', 'Email', 'Batch',
+            'Registration Date', 'Pending Payment Due Date', 'Original Price', 'Discounted Price', 'Advance Payment', 'Second Installment', 'Balance', 'Total Amount',
+            'Advance Payment in Range', 'Second Installment in Range', 'Total Payment in Range'
+        ]
+        
+        # Write headers
+        for col, header in enumerate(headers, 1):
+            ws.cell(row=1, column=col, value=header)
+        
+        # Sort students by date
+        students = sorted(students, key=lambda s: s.created_at if s.created_at else timezone.now())
+        
+        # Write student data
+        row = 2
+        for index, student in enumerate(students, 1):
+            courses_list = student.course_list
+            # Use the balance field from the Student model
+            balance = student.balance if student.balance is not None else 0
+            
+            # Payments within the date range, from the payment ledger
+            advance_in_range = float(getattr(student, 'advance_in_range', 0))
+            second_installment_in_range = float(getattr(student, 'second_installment_in_range', 0))
+            
+            total_payment_in_range = advance_in_range + second_installment_in_range
+            
+            # Write student details to Excel
+            ws.cell(row=row, column=1, value=index)
+            ws.cell(row=row, column=2, value=student.name)
+            ws.cell(row=row, column=3, value=courses_list)
+            ws.cell(row=row, column=4, value='Paid' if student.payment_status == 'paid' else 'Pending')
+            ws.cell(row=row, column=5, value=student.get_creator_name() if hasattr(student, 'get_creator_name') else 'N/A')
+            ws.cell(row=row, column=6, value=student.phone_number if hasattr(student, 'phone_number') else '')
+            ws.cell(row=row, column=7, value=student.email if hasattr(student, 'email') else '')
+            ws.cell(row=row, column=8, value=student.batch.batch_number if student.batch else 'N/A')
+            ws.cell(row=row, column=9, value=student.created_at.strftime('%Y-%m-%d') if student.created_at else '')
+            ws.cell(row=row, column=10, value=student.due_date.strftime('%Y-%m-%d') if student.due_date else '')
+            ws.cell(row=row, column=11, value=float(student.total_fees) if student.total_fees else 0)
+            ws.cell(row=row, column=12, value=float(student.discounted_price) if student.discounted_price else 0)
+            ws.cell(row=row, column=13, value=float(student.advance_payment) if student.advance_payment else 0)
+            ws.cell(row=row, column=14, value=float(student.second_installment) if student.second_installment else 0)
+            ws.cell(row=row, column=15, value=float(balance))
+            ws.cell(row=row, column=16, value=float(student.total_amount) if student.total_amount else 0)
+            ws.cell(row=row, column=17, value=advance_in_range)
+            ws.cell(row=row, column=18, value=second_installment_in_range)
+            ws.cell(row=row, column=19, value=total_payment_in_range)
+            
+            row += 1
+        
+        # Auto-adjust column widths for the worksheet
+        for column in ws.columns:
+            max_length = 0
+            column = [cell for cell in column]
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+            adjusted_width = (max_length + 2)
+            ws.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
+        
+        # Save to buffer
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        
+        # Create the HttpResponse with Excel content
+        response = HttpResponse(
+            buffer.getvalue(),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = 'attachment; filename=student_details_report.xlsx'
+        return response
+    
+    # Get the currently logged-in user's CSR profile if it exists
+    csr = None
+    if hasattr(request.user, 'csrprofile'):
+        csr = request.user.csrprofile
+    
+    # Use a single shared template for both admin and CSR; data is already role-filtered above
+    template = 'invoice/report_students.html'
+    
+    # Render the template with context
+    context = {
+        'students': students,
+        'batches': batches,
+        'courses': courses,
+        'selected_batch': batch_id,
+        'selected_course': course_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'csr': csr,
+    }
+    
+    return render(request, template, context)
+
+@login_required
+@conditional('students', 'batches', 'courses', 'csrs')
+def report_students_ajax(request):
+    """AJAX endpoint for student details report with filters"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    # Get filter parameters
+    batch_id = request.GET.get('batch', '')
+    course_id = request.GET.get('course', '')
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    payment_status = request.GET.get('payment_status', '')
+    
+    # Base queryset (respect role permissions)
+    base_students = Student.objects.select_related('batch', 'created_by')
+    csr = None
+    if not request.user.is_superuser:
+        try:
+            csr = request.user.csr_profile
+        except CSRProfile.DoesNotExist:
+            csr = None
+
+    if request.user.is_superuser or (csr and csr.lead_role):
+        students = base_students
+    else:
+        students = base_students.filter(created_by=csr)
+    
+    # Apply filters if provided
+    if batch_id:
+        students = students.filter(batch_id=batch_id)
+    
+    if course_id:
+        students = students.filter(courses__id=course_id)
+    
+    # Apply date filtering - only show students who registered or made payments within the date range
+    start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+    end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    if start_date or end_date:
+        students = with_payments_in_range(students.filter(payment_activity(start_date, end_date)).distinct(), start_date, end_date)
+    
+    if payment_status:
+        students = students.filter(payment_status=payment_status)
+    
+    # Prepare student data for JSON response
+    student_list = []
+    for student in students:
+        courses_list = student.course_names
+        
+        # Payments within the date range, from the payment ledger
+        advance_in_range = float(getattr(student, 'advance_in_range', 0))
+        second_installment_in_range = float(getattr(student, 'second_installment_in_range', 0))
+        
+        total_payment_in_range = advance_in_range + second_installment_in_range
+        
+        student_list.append({
+            'id': student.id,
+            'name': student.name,
+            'courses': courses_list,
+            'payment_status': student.payment_status,
+            'creator_name': student.get_creator_name() if hasattr(student, 'get_creator_name') else 'N/A',
+            'phone_number': student.phone_number,
+            'guardian_name': student.guardian_name,
+            'batch_number': student.batch.batch_number if student.batch else 'N/A',
+            'created_at': student.created_at.strftime('%Y-%m-%d') if student.created_at else '',
+            'total_fees': float(student.total_fees) if student.total_fees else 0,
+            'discounted_price': float(student.discounted_price) if student.discounted_price else 0,
+            'advance_payment': float(student.advance_payment) if student.advance_payment else 0,
+            'second_installment': float(student.second_installment) if student.second_installment else 0,
+            'balance': float(student.balance) if student.balance is not None else 0,
+            'total_amount': float(student.total_amount) if student.total_amount else 0,
+            'advance_in_range': advance_in_range,
+            'second_installment_in_range': second_installment_in_range,
+            'total_payment_in_range': total_payment_in_range,
+        })
+    
+    # Calculate totals for payments within date range
+    total_advance_in_range = sum(student['advance_in_range'] for student in student_list)
+    total_second_installment_in_range = sum(student['second_installment_in_range'] for student in student_list)
+    total_payment_in_range = sum(student['total_payment_in_range'] for student in student_list)
+    
+    # Prepare response data
+    response_data = {
+        'students': student_list,
+        'student_count': len(student_list),
+        'total_advance_in_range': total_advance_in_range,
+        'total_second_installment_in_range': total_second_installment_in_range,
+        'total_payment_in_range': total_payment_in_range
+    }
+    
+    return JsonResponse(response_data)
+
+
+def build_revenue_workbook(batch_revenue, course_revenue):
+    """Build the revenue report Excel workbook and return it as bytes"""
+    # Imported here: openpyxl is slow to import and only needed for exports
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    
+    # Create a new workbook
+    wb = Workbook()
+    
+    # Create Batch Revenue Sheet
+    ws_batch = wb.active
+    ws_batch.title = "Revenue by Batch"
+    
+    # Write headers
+    headers = ['Batch', 'Total Revenue', 'Received Payment', 'Pending Payment', 'Student Count']
+    for col, header in enumerate(headers, 1):
+        ws_batch.cell(row=1, column=col, value=header)
+    
+    # Write batch data
+    row = 2
+    for item in batch_revenue:
+        ws_batch.cell(row=row, column=1, value=item['batch__batch_number'] or 'N/A')
+        ws_batch.cell(row=row, column=2, value=float(item['total_revenue'] or 0))
+        ws_batch.cell(row=row, column=3, value=float(item['received_payment'] or 0))
+        ws_batch.cell(row=row, column=4, value=float(item['pending_payment'] or 0))
+        ws_batch.cell(row=row, column=5, value=item['student_count'] or 0)
+        row += 1
+    
+    # Add totals row
+    ws_batch.cell(row=row, column=1, value='TOTAL')
+    ws_batch.cell(row=row, column=2, value=float(sum(item['total_revenue'] or 0 for item in batch_revenue)))
+    ws_batch.cell(row=row, column=3, value=float(sum(item['received_payment'] or 0 for item in batch_revenue)))
+    ws_batch.cell(row=row, column=4, value=float(sum(item['pending_payment'] or 0 for item in batch_revenue)))
+    ws_batch.cell(row=row, column=5, value=sum(item['student_count'] or 0 for item in batch_revenue))
+    
+    # Create Course Revenue Sheet
+    ws_course = wb.create_sheet(title="Revenue by Course")
+    
+    # Write headers
+    for col, header in enumerate(headers, 1):
+        ws_course.cell(row=1, column=col, value=header.replace('Batch', 'Course'))
+    
+    # Write course data
+    row = 2
+    for item in course_revenue:
+        ws_course.cell(row=row, column=1, value=item['courses__name'] or 'N/A')
+        ws_course.cell(row=row, column=2, value=float(item['total_revenue'] or 0))
+        ws_course.cell(row=row, column=3, value=float(item['received_payment'] or 0))
+        ws_course.cell(row=row, column=4, value=float(item['pending_payment'] or 0))
+        ws_course.cell(row=row, column=5, value=item['student_count'] or 0)
+        row += 1
+    
+    # Add totals row
+    ws_course.cell(row=row, column=1, value='TOTAL')
+    ws_course.cell(row=row, column=2, value=float(sum(item['total_revenue'] or 0 for item in course_revenue)))
+    ws_course.cell(row=row, column=3, value=float(sum(item['received_payment'] or 0 for item in course_revenue)))
+    ws_course.cell(row=row, column=4, value=float(sum(item['pending_payment'] or 0 for item in course_revenue)))
+    ws_course.cell(row=row, column=5, value=sum(item['student_count'] or 0 for item in course_revenue))
+    
+    # Auto-adjust column widths for both worksheets
+    for worksheet in [ws_batch, ws_course]:
+        for column in worksheet.columns:
+            max_length = 0
+            column = [cell for cell in column]
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+        adjusted_width = (max_length + 2)
+        worksheet.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
+    
+    # Save to buffer
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+@login_required
+def report_revenue(request):
+    """Generate revenue report by batch and course with filters"""
+    # Get filter parameters
+    batch_id = request.GET.get('batch')
+    course_id = request.GET.get('course')
+    start_date = request.GET.get('start_date')
+    end_date = request.GET.get('end_date')
+    export_format = request.GET.get('export')
+    
+    compare = [kind for kind in request.GET.getlist('compare') if kind in COMPARISONS]
+    
+    # Students in the user's scope, with the batch/course filters applied
+    students, scope = _revenue_scope(request.user, batch_id, course_id)
+    start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+    end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    
+    # Get all batches and courses for the filter dropdown
+    batches, courses = get_filter_options()
+    
+    # Generate revenue data using date-range-specific payments. Identical concurrent
+    # requests (same scope, filters and data version) share a single computation.
+    def build_report():
+        batch_revenue, course_revenue = calculate_date_range_revenue(students, start_date, end_date, compare)
+        workbook = build_revenue_workbook(batch_revenue, course_revenue) if export_format == 'excel' else None
+        return batch_revenue, course_revenue, workbook
+
+    batch_revenue, course_revenue, workbook = single_flight(
+        'report_revenue', build_report,
+        scope, batch_id or '', course_id or '', start_date or '', end_date or '', export_format == 'excel',
+        ','.join(compare),
+    )
+    
+    # Calculate totals for batch revenue
+    batch_total_revenue = sum(item['total_revenue'] or 0 for item in batch_revenue)
+    batch_received_payment = sum(item['received_payment'] or 0 for item in batch_revenue)
+    batch_pending_payment = sum(item['pending_payment'] or 0 for item in batch_revenue)
+    batch_student_count = sum(item['student_count'] or 0 for item in batch_revenue)
+    
+    # Calculate totals for course revenue
+    course_total_revenue = sum(item['total_revenue'] or 0 for item in course_revenue)
+    course_received_payment = sum(item['received_payment'] or 0 for item in course_revenue)
+    course_pending_payment = sum(item['pending_payment'] or 0 for item in course_revenue)
+    course_student_count = sum(item['student_count'] or 0 for item in course_revenue)
+    
+    # Check if we need to export
+    if export_format == 'excel':
+        # Create the HttpResponse with Excel content
+        response = HttpResponse(
+            workbook,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = 'attachment; filename=student_details_report.xlsx'
+        return response
+    
+    # Get the current CSR profile for the sidebar (if any)
+    try:
+        csr = request.user.csr_profile
+    except:
+        csr = None
+    
+    # Render the template with filters using a shared template for both admin and CSR
+    context = {
+        'batch_revenue': batch_revenue,
+        'course_revenue': course_revenue,
+        'batches': batches,
+        'courses': courses,
+        'selected_batch': batch_id,
+        'selected_course': course_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'csr': csr,
+        # Add calculated totals
+        'batch_total_revenue': batch_total_revenue,
+        'batch_received_payment': batch_received_payment,
+        'batch_pending_payment': batch_pending_payment,
+        'batch_student_count': batch_student_count,
+        'course_total_revenue': course_total_revenue,
+        'course_received_payment': course_received_payment,
+        'course_pending_payment': course_pending_payment,
+        'course_student_count': course_student_count,
+        # Comparison periods (with a bounded date range)
+        'comparisons': list(COMPARISONS.items()),
+        'selected_compare': compare[0] if compare else '',
+        'comparison_periods': _comparison_periods(start_date, end_date, compare),
+        'batch_comparison_totals': comparison_totals(batch_revenue),
+        'course_comparison_totals': comparison_totals(course_revenue),
+    }
+    
+    return render(request, 'invoice/report_revenue.html', context)
+
+
+@login_required
+@conditional('students', 'batches', 'courses')
+def report_revenue_ajax(request):
+    """AJAX endpoint for revenue report filtering"""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    # Get filter parameters
+    batch_id = request.GET.get('batch', '')
+    course_id = request.GET.get('course', '')
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    
+    compare = [kind for kind in request.GET.getlist('compare') if kind in COMPARISONS]
+    
+    start_date = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None
+    end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+    
+    # Generate revenue data using date-range-specific payments
+    if settings.REPORT_SNAPSHOT:
+        batch_revenue, course_revenue = snapshot_revenue(request.user, batch_id, course_id, start_date, end_date, compare)
+    else:
+        # Query students with filters and role restrictions
+        students, _ = _revenue_scope(request.user, batch_id, course_id)
+        batch_revenue, course_revenue = calculate_date_range_revenue(students, start_date, end_date, compare)
+    
+    # Calculate totals for batch revenue
+    batch_total_revenue = sum(item['total_revenue'] or 0 for item in batch_revenue)
+    batch_received_payment = sum(item['received_payment'] or 0 for item in batch_revenue)
+    batch_pending_payment = sum(item['pending_payment'] or 0 for item in batch_revenue)
+    batch_student_count = sum(item['student_count'] or 0 for item in batch_revenue)
+    
+    # Calculate totals for course revenue
+    course_total_revenue = sum(item['total_revenue'] or 0 for item in course_revenue)
+    course_received_payment = sum(item['received_payment'] or 0 for item in course_revenue)
+    course_pending_payment = sum(item['pending_payment'] or 0 for item in course_revenue)
+    course_student_count = sum(item['student_count'] or 0 for item in course_revenue)
+    
+    # Convert Decimal objects to float for JSON serialization
+    batch_revenue_list = []
+    for item in batch_revenue:
+        batch_revenue_list.append({
+            'batch__batch_number': item['batch__batch_number'],
+            'total_revenue': float(item['total_revenue']) if item['total_revenue'] else 0,
+            'received_payment': float(item['received_payment']) if item['received_payment'] else 0,
+            'pending_payment': float(item['pending_payment']) if item['pending_payment'] else 0,
+            'student_count': item['student_count']
+        })
+        if 'comparison' in item:
+            # Per comparison period: its metrics, <metric>_delta and <metric>_pct
+            batch_revenue_list[-1]['comparison'] = item['comparison']
+    
+    course_revenue_list = []
+    for item in course_revenue:
+        course_revenue_list.append({
+            'courses__name': item['courses__name'],
+            'total_revenue': float(item['total_revenue']) if item['total_revenue'] else 0,
+            'received_payment': float(item['received_payment']) if item['received_payment'] else 0,
+            'pending_payment': float(item['pending_payment']) if item['pending_payment'] else 0,
+            'student_count': item['student_count']
+        })
+        if 'comparison' in item:
+            # Per comparison period: its metrics, <metric>_delta and <metric>_pct
+            course_revenue_list[-1]['comparison'] = item['comparison']
+    
+    # Prepare response data
+    response_data = {
+        'batch_revenue': batch_revenue_list,
+        'course_revenue': course_revenue_list,
+        'batch_total_revenue': float(batch_total_revenue),
+        'batch_received_payment': float(batch_received_payment),
+        'batch_pending_payment': float(batch_pending_payment),
+        'batch_student_count': batch_student_count,
+        'course_total_revenue': float(course_total_revenue),
+        'course_received_payment': float(course_received_payment),
+        'course_pending_payment': float(course_pending_payment),
+        'course_student_count': course_student_count,
+        'comparison_periods': _comparison_periods(start_date, end_date, compare),
+        'batch_comparison_totals': comparison_totals(batch_revenue),
+        'course_comparison_totals': comparison_totals(course_revenue),
+    }
+    
+    return JsonResponse(response_data)
+
+
+def build_commission_report(start_date, end_date, commission_percent):
+    """Compute the commission report data (CSR cards plus per-CSR commissions in range)"""
+    # Get all CSRs for the cards display, with their student and completed (paid in full) counts
+    csrs = CSRProfile.objects.select_related('user').with_stats().order_by('user__first_name', 'user__last_name')
+    
+    # Initialize commission data
+    commission_data = []
+    total_commission = 0
+    total_admissions = 0
+    total_revenue = 0
+    total_payment_in_range = 0
+    
+    if start_date and end_date:
+        start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
+        
+        # Get students with completed payments (paid status) who registered or paid in range
+        # (paid in full at registration, or a payment in the ledger within the range)
+        completed_students = with_payments_in_range(
+            Student.objects.filter(payment_status='paid').filter(payment_activity(start_dt, end_dt)),
+            start_dt, end_dt,
+        ).select_related('created_by', 'batch')
+        
+        # Calculate commission for each CSR
+        for csr in csrs:
+            csr_students = completed_students.filter(created_by=csr)
+            
+            if csr_students.exists():
+                # Calculate total revenue and commission
+                csr_total_revenue = sum(student.discounted_price for student in csr_students)
+                csr_commission = (csr_total_revenue * commission_percent) / 100
+                csr_admissions = csr_students.count()
+                
+                # Calculate total payment received in range for this CSR's students
+                csr_total_payment_in_range = 0
+                
+                # Add individual commission amounts to each student
+                for student in csr_students:
+                    student.commission_amount = (student.discounted_price * commission_percent) / 100
+                    # Payment received in range, from the payment ledger
+                    csr_total_payment_in_range += student.advance_in_range + student.second_installment_in_range
+                
+                commission_data.append({
+                    'csr': csr,
+                    'total_revenue': csr_total_revenue,
+                    'commission': csr_commission,
+                    'admissions': csr_admissions,
+                    'students': list(csr_students),
+                    'total_payment_in_range': csr_total_payment_in_range
+                })
+                
+                total_commission += csr_commission
+                total_admissions += csr_admissions
+                total_revenue += csr_total_revenue
+                total_payment_in_range += csr_total_payment_in_range
+        
+        # Sort by commission amount (highest first)
+        commission_data.sort(key=lambda x: x['commission'], reverse=True)
+    
+    return {
+        'csrs': list(csrs),
+        'commission_data': commission_data,
+        'total_commission': total_commission,
+        'total_admissions': total_admissions,
+        'total_revenue': total_revenue,
+        'total_payment_in_range': total_payment_in_range,
+    }
+
+
+def commission_report(request):
+    """Commission report view for admin dashboard"""
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return redirect('login')
+    
+    # Get filter parameters
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    commission_percent = request.GET.get('commission_percent', 1)  # Default 1%
+    
+    try:
+        commission_percent = float(commission_percent)
+    except ValueError:
+        commission_percent = 1.0
+    
+    # Identical concurrent requests (same range, percentage and data version)
+    # share a single computation
+    try:
+        report = single_flight(
+            'commission_report',
+            lambda: build_commission_report(start_date, end_date, commission_percent),
+            start_date, end_date, commission_percent,
+        )
+    except ValueError as e:
+        # Invalid date format
+        messages.error(request, f"Invalid date format: {e}")
+        report = build_commission_report('', '', commission_percent)
+    except Exception as e:
+        # General error handling
+        messages.error(request, f"Error calculating commissions: {e}")
+        report = build_commission_report('', '', commission_percent)
+    csrs = report['csrs']
+    commission_data = report['commission_data']
+    total_commission = report['total_commission']
+    total_admissions = report['total_admissions']
+    total_revenue = report['total_revenue']
+    total_payment_in_range = report['total_payment_in_range']
+    
+    context = {
+        'csrs': csrs,
+        'commission_data': commission_data,
+        'total_commission': total_commission,
+        'total_admissions': total_admissions,
+        'total_revenue': total_revenue,
+        'total_payment_in_range': total_payment_in_range,
+        'commission_percent': commission_percent,
+        'start_date': start_date,
+        'end_date': end_date,
+        'has_filters': bool(start_date and end_date)
+    }
+    
+    return render(request, 'invoice/commission.html', context)
+
+
+@staff_member_required(login_url='login')
+def export_commission_csv(request):
+    """Export commission report as CSV.
+    - If csr_id is provided, export for that CSR only.
+    - Otherwise, export for all CSRs.
+    Uses paid-only students who registered or made a payment within the date range.
+    Last column contains CSR total commission for easy summarization per row.
+    """
+    # Validate filters
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    commission_percent = request.GET.get('commission_percent', '1')
+    csr_id = request.GET.get('csr_id')
+
+    try:
+        start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except Exception:
+        return HttpResponse('Invalid or missing start_date/end_date', status=400)
+
+    try:
+        commission_percent_val = float(commission_percent)
+    except Exception:
+        commission_percent_val = 1.0
+
+    # Base students: paid, and registered or paid in the date window (same as the report)
+    base_students = Student.objects.filter(
+        payment_status='paid'
+    ).filter(
+        payment_activity(start_dt, end_dt)
+    ).select_related('created_by', 'batch')
+
+    # Resolve CSRs to export
+    if csr_id:
+        csrs = CSRProfile.objects.filter(id=csr_id)
+        if not csrs.exists():
+            return HttpResponse('CSR not found', status=404)
+    else:
+        csrs = CSRProfile.objects.all().order_by('user__first_name', 'user__last_name')
+
+    # Prepare CSV
+    filename = 'commission_report_all.csv' if not csr_id else f'commission_report_csr_{csr_id}.csv'
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    writer = csv.writer(response)
+
+    # Headers
+    if csr_id:
+        writer.writerow([
+            'CSR', 'Student', 'Price', 'Commission', 'Registration Date', 'Due Date', 'CSR Total Commission'
+        ])
+    else:
+        writer.writerow([
+            'CSR', 'Student', 'Price', 'Commission', 'Registration Date', 'Due Date', 'CSR Total Commission'
+        ])
+
+    grand_total_commission = 0.0
+
+    for csr in csrs:
+        csr_students = base_students.filter(created_by=csr)
+        if not csr_students.exists():
+            continue
+
+        csr_total_revenue = sum(s.discounted_price for s in csr_students)
+        csr_total_commission = (csr_total_revenue * commission_percent_val) / 100
+        grand_total_commission += csr_total_commission
+
+        # Emit rows per student; last column always CSR total commission for quick pivoting
+        for s in csr_students:
+            commission_amount = (s.discounted_price * commission_percent_val) / 100
+            writer.writerow([
+                csr.get_full_name() if hasattr(csr, 'get_full_name') else getattr(csr, 'full_name', 'CSR'),
+                s.name,
+                int(s.discounted_price or 0),
+                int(commission_amount),
+                s.created_at.strftime('%Y-%m-%d') if s.created_at else '',
+                s.due_date.strftime('%Y-%m-%d') if s.due_date else '',
+                int(csr_total_commission),
+            ])
+
+        # Add a summary row for the CSR
+        writer.writerow([
+            csr.get_full_name() if hasattr(csr, 'get_full_name') else getattr(csr, 'full_name', 'CSR'),
+            'TOTAL',
+            int(csr_total_revenue),
+            int(csr_total_commission),
+            '',
+            '',
+            int(csr_total_commission),
+        ])
+
+    if not csr_id:
+        # Add grand total at end when exporting all CSRs
+        writer.writerow(['', 'GRAND TOTAL', '', int(grand_total_commission), '', '', int(grand_total_commission)])
+
+    return response
+
+
+# Receivables aging report: group dimension -> (key field, label field)
+AGING_GROUPS = {
+    'batch': ('batch_id', 'batch__batch_number'),
+    'csr': ('created_by_id', 'created_by_name'),
+    'course': ('courses__id', 'courses__name'),
+}
+AGING_PAGE_SIZE = 50
+
+
+def _receivables_for(user):
+    """Receivables the user may see: all for admins and lead CSRs, their own students for CSRs"""
+    students = Student.objects.receivables()
+    if user.is_superuser:
+        return students
+    try:
+        csr = user.csr_profile
+    except CSRProfile.DoesNotExist:
+        return students.none()
+    return students if csr.lead_role else students.filter(created_by=csr)
+
+
+def build_aging_report(students, group, today):
+    """Receivables per group and aging bucket, from one grouped query
+
+    Returns (rows, totals): each row has the group's key and label, its
+    buckets (students and amount, in AGING_BUCKETS order) and totals; rows
+    are sorted by outstanding amount. Grouped by course, a student enrolled
+    in several courses counts under each of them.
+    """
+    key_field, label_field = AGING_GROUPS[group]
+    counts = (
+        students.with_aging(today)
+        .values(key_field, label_field, 'aging')
+        .annotate(students=Count('id'), amount=Sum('balance'))
+        .order_by()
+    )
+
+    def empty(key, label):
+        return {
+            'key': key, 'label': label, 'students': 0, 'amount': 0,
+            'buckets': {bucket: {'key': bucket, 'label': label, 'students': 0, 'amount': 0} for bucket, label, _ in AGING_BUCKETS},
+        }
+
+    groups = {}
+    totals = empty('', 'Total')
+    for row in counts:
+        key = row[key_field]
+        entry = groups.setdefault(key, empty('' if key is None else key, row[label_field] or 'None'))
+        for target in (entry, totals):
+            target['buckets'][row['aging']]['students'] += row['students']
+            target['buckets'][row['aging']]['amount'] += row['amount']
+            target['students'] += row['students']
+            target['amount'] += row['amount']
+
+    rows = sorted(groups.values(), key=lambda entry: entry['amount'], reverse=True)
+    for entry in rows + [totals]:
+        entry['buckets'] = list(entry['buckets'].values())
+    return rows, totals
+
+
+@login_required
+def report_aging(request):
+    """Receivables aging report by batch, CSR or course"""
+    group = request.GET.get('group', 'batch')
+    if group not in AGING_GROUPS:
+        group = 'batch'
+    today = timezone.localdate()
+    rows, totals = build_aging_report(_receivables_for(request.user), group, today)
+
+    try:
+        csr = request.user.csr_profile
+    except CSRProfile.DoesNotExist:
+        csr = None
+
+    context = {
+        'rows': rows,
+        'totals': totals,
+        'group': group,
+        'groups': [('batch', 'Batch'), ('csr', 'CSR'), ('course', 'Course')],
+        'buckets': AGING_BUCKETS,
+        'today': today,
+        'csr': csr,
+    }
+    return render(request, 'invoice/report_aging.html', context)
+
+
+class _Echo:
+    """Write target for csv.writer that hands each row back instead of buffering it"""
+
+    def write(self, value):
+        return value
+
+
+def _parse_cursor(value):
+    """Parse a drill-down cursor "<due date or empty>_<id>"; None when missing or malformed"""
+    try:
+        due, pk = value.split('_')
+        return (datetime.strptime(due, '%Y-%m-%d').date() if due else None), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+@login_required
+def report_aging_students(request):
+    """Receivables of one aging report cell, oldest due date first, or all of them as CSV
+
+    Keyset-paginated on (due date, id) over the receivables index, so any
+    page costs the same; students without a due date come last.
+    """
+    today = timezone.localdate()
+    students = _receivables_for(request.user)
+
+    group = request.GET.get('group', '')
+    key = request.GET.get('key')
+    if group in AGING_GROUPS and key is not None:
+        key_field = AGING_GROUPS[group][0]
+        if key == '':
+            students = students.filter(**{f'{key_field}__isnull': True})
+        else:
+            # Every group is keyed by a primary key
+            try:
+                key = int(key)
+            except ValueError:
+                return HttpResponse('Invalid key', status=400)
+            students = students.filter(**{key_field: key})
+    bucket = request.GET.get('bucket', '')
+    labels = {bucket_key: label for bucket_key, label, _ in AGING_BUCKETS}
+    if bucket in labels:
+        students = students.in_aging_bucket(bucket, today)
+
+    students = students.order_by(F('second_installment_due_date').asc(nulls_last=True), 'id')
+    fields = ['id', 'name', 'phone_number', 'batch__batch_number', 'created_by_name', 'course_names',
+              'second_installment_due_date', 'balance']
+
+    if request.GET.get('export') == 'csv':
+        def lines():
+            writer = csv.writer(_Echo())
+            yield writer.writerow(['Student', 'Phone', 'Batch', 'CSR', 'Courses', 'Due Date', 'Days Overdue', 'Balance'])
+            for pk, name, phone, batch, csr_name, course_names, due, balance in (
+                students.values_list(*fields).iterator(chunk_size=2000)
+            ):
+                overdue = max((today - due).days, 0) if due else 0
+                yield writer.writerow([name, phone, batch, csr_name, ', '.join(course_names), due or '', overdue, balance])
+
+        response = StreamingHttpResponse(lines(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="receivables_{today:%Y%m%d}.csv"'
+        return response
+
+    cursor = _parse_cursor(request.GET.get('after'))
+    if cursor:
+        due, pk = cursor
+        if due is None:
+            students = students.filter(second_installment_due_date__isnull=True, id__gt=pk)
+        else:
+            students = students.filter(
+                Q(second_installment_due_date__gt=due) | Q(second_installment_due_date=due, id__gt=pk)
+                | Q(second_installment_due_date__isnull=True)
+            )
+    page = list(students.values(*fields)[:AGING_PAGE_SIZE + 1])
+    has_next = len(page) > AGING_PAGE_SIZE
+    page = page[:AGING_PAGE_SIZE]
+    for student in page:
+        due = student['second_installment_due_date']
+        student['days_overdue'] = max((today - due).days, 0) if due else 0
+
+    next_query = None
+    if has_next:
+        last = page[-1]
+        params = request.GET.copy()
+        params['after'] = f"{last['second_installment_due_date'] or ''}_{last['id']}"
+        next_query = params.urlencode()
+    first_query = request.GET.copy()
+    first_query.pop('after', None)
+
+    try:
+        csr = request.user.csr_profile
+    except CSRProfile.DoesNotExist:
+        csr = None
+
+    context = {
+        'students': page,
+        'next_query': next_query,
+        'first_query': first_query.urlencode(),
+        'is_first_page': cursor is None,
+        'bucket_label': labels.get(bucket, 'All'),
+        'group': group,
+        'today': today,
+        'csr': csr,
+    }
+    return render(request, 'invoice/report_aging_students.html', context)
@@ -0,0 +1,198 @@
+"""
+Periodic tasks, run by `manage.py run_scheduler`.
+
+Work that only needs to happen once a day or week (creating the week's
+feedback stubs, refreshing denormalized fields, warming dashboard caches) is
+declared next to the task itself, in the app's tasks.py:
+
+    @periodic(cron='1 0 * * 1', jitter=60)
+    @task('portal.create_feedback_stubs')
+    def create_feedback_stubs(week_start=None):
+        ...
+
+A schedule is either an interval (`every=timedelta(...)`) or a five-field
+cron expression (minute hour day-of-month month day-of-week, in
+settings.TIME_ZONE, supporting *, lists, ranges and /steps). `jitter` adds a
+random delay of up to that many seconds to every run, so tasks due at the
+same time do not all start at once.
+
+Only the scheduler instance holding the database lease runs tasks; the
+others wait to take over when it stops renewing it. Each run is recorded on
+the task's PeriodicTask row, which the admin shows.
+"""
+import random
+import time
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .jobs import _storable
+from .models import Lease, PeriodicTask
+
+
+SCHEDULES = {}
+
+LEASE_NAME = 'scheduler'
+
+
+class Cron:
+    """Five-field cron expression; day-of-week 0 (or 7) is Sunday"""
+
+    FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f'Cron expression "{expression}" must have 5 fields')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        ]
+        self.weekdays = {day % 7 for day in weekdays}
+        # As in cron: when both days are restricted, either may match
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for item in field.split(','):
+            span, _, step = item.partition('/')
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = (int(value) for value in span.split('-'))
+            else:
+                start = end = int(span)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f'Cron field "{field}" is outside {low}-{high}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """First matching minute after `moment`"""
+        candidate = timezone.localtime(moment).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        # Skips a whole month/day/hour at a time, so this ends well within the limit
+        for _ in range(10000):
+            if candidate.month not in self.months:
+                candidate = datetime(candidate.year + candidate.month // 12, candidate.month % 12 + 1, 1)
+            elif not self._day_matches(candidate):
+                candidate = datetime(candidate.year, candidate.month, candidate.day) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(candidate)
+        raise ValueError(f'Cron expression "{self.expression}" never matches')
+
+    def __str__(self):
+        return f'cron {self.expression}'
+
+
+class Interval:
+    def __init__(self, every):
+        self.every = every
+
+    def next_after(self, moment):
+        return moment + self.every
+
+    def __str__(self):
+        return f'every {self.every}'
+
+
+@dataclass
+class Schedule:
+    name: str
+    func: object
+    trigger: object
+    jitter: int = 0
+
+    def next_run(self, after):
+        """When to run next after `after`, jitter included"""
+        return self.trigger.next_after(after) + timedelta(seconds=random.uniform(0, self.jitter))
+
+
+def periodic(every=None, cron=None, jitter=0):
+    """Schedule the decorated task (registered with @task) to run `every` interval or on `cron`"""
+    if (every is None) == (cron is None):
+        raise ValueError('Give either every= or cron=')
+    trigger = Interval(every) if every is not None else Cron(cron)
+    def register(func):
+        name = func.task_name
+        SCHEDULES[name] = Schedule(name, func, trigger, jitter)
+        return func
+    return register
+
+
+def sync():
+    """Create/update the PeriodicTask rows of the registry; returns them by name"""
+    now = timezone.now()
+    rows = {row.name: row for row in PeriodicTask.objects.filter(name__in=SCHEDULES)}
+    for name, schedule in SCHEDULES.items():
+        row = rows.get(name)
+        if row is None:
+            rows[name] = PeriodicTask.objects.create(
+                name=name, schedule=str(schedule.trigger), next_run_at=schedule.next_run(now),
+            )
+        elif row.schedule != str(schedule.trigger) or row.next_run_at is None:
+            # A changed schedule takes effect now rather than after the old next run
+            row.schedule = str(schedule.trigger)
+            row.next_run_at = schedule.next_run(now)
+            row.save(update_fields=['schedule', 'next_run_at'])
+    return rows
+
+
+def due_tasks(now=None):
+    """The enabled scheduled tasks that are due, longest overdue first"""
+    return list(
+        PeriodicTask.objects.filter(name__in=SCHEDULES, enabled=True, next_run_at__lte=now or timezone.now())
+        .order_by('next_run_at')
+    )
+
+
+def run_task(row):
+    """Run one scheduled task in this process and record the outcome on `row`"""
+    schedule = SCHEDULES[row.name]
+    row.last_started_at = timezone.now()
+    started = time.monotonic()
+    try:
+        row.last_result = _storable(schedule.func())
+        row.last_status, row.last_error = 'ok', ''
+    except Exception:
+        row.last_status, row.last_error = 'error', traceback.format_exc()
+    row.last_duration = time.monotonic() - started
+    row.run_count += 1
+    # From now rather than from the due time: a late run does not cause a burst of catch-up runs
+    row.next_run_at = schedule.next_run(timezone.now())
+    row.save(update_fields=[
+        'last_started_at', 'last_duration', 'last_status', 'last_result', 'last_error', 'run_count', 'next_run_at',
+    ])
+    return row.last_status
+
+
+def acquire_lease(holder, ttl, name=LEASE_NAME):
+    """Take or renew the lease `name` for `ttl`; False while another holder's lease is unexpired"""
+    now = timezone.now()
+    Lease.objects.get_or_create(name=name, defaults={'expires_at': now})
+    # One conditional UPDATE, so two instances can never both get the lease
+    return Lease.objects.filter(Q(holder=holder) | Q(expires_at__lte=now), name=name).update(
+        holder=holder, expires_at=now + ttl,
+    ) == 1
+
+
+def release_lease(holder, name=LEASE_NAME):
+    """Give up the lease so a standby instance can take over right away"""
+    Lease.objects.filter(name=name, holder=holder).update(holder='', expires_at=timezone.now())
@@ -0,0 +1,64 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate
+from .models import Batch, Course, CSRProfile, InvoiceSettings, Payment, Student
+
+
+# Model -> cache domain bumped whenever a row is written or deleted
+DOMAIN_MODELS = {
+    Student: 'students',
+    # The revenue figures are built from the payment ledger
+    Payment: 'students',
+    Batch: 'batches',
+    Course: 'courses',
+    CSRProfile: 'csrs',
+    InvoiceSettings: 'invoice_settings',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_model_domain(sender, **kwargs):
+    """Invalidate cached fragments that depend on the written model."""
+    domain = DOMAIN_MODELS.get(sender)
+    if domain:
+        invalidate(domain)
+
+
+@receiver(m2m_changed, sender=Student.courses.through)
+def sync_student_courses(sender, instance, action, reverse, pk_set, **kwargs):
+    """Course enrolment changes: refresh the students' course_names/course_count.
+
+    This also invalidates the 'students' fragments (per-course student counts).
+    """
+    if action == 'pre_clear' and reverse:
+        # post_clear has no pk_set: remember which students the course had
+        instance._cleared_student_ids = list(instance.students.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        ids = instance.__dict__.pop('_cleared_student_ids', []) if action == 'post_clear' else pk_set
+        Student.objects.filter(pk__in=ids).refresh_course_cache()
+        return
+    course_names = Student.objects.course_cache_values([instance.pk])[instance.pk]
+    Student.objects.filter(pk=instance.pk).update(
+        course_names=course_names, course_count=len(course_names), updated_at=timezone.now(),
+    )
+    # Keep the instance in step, so a later save() does not write stale names back
+    instance.course_names = course_names
+    instance.course_count = len(course_names)
+    invalidate('students')
+
+
+@receiver(pre_delete, sender=Course)
+def remember_course_students(sender, instance, **kwargs):
+    """Deleting a course removes its through rows without m2m_changed."""
+    instance._enrolled_student_ids = list(instance.students.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Course)
+def refresh_deleted_course_students(sender, instance, **kwargs):
+    ids = instance.__dict__.pop('_enrolled_student_ids', [])
+    Student.objects.filter(pk__in=ids).refresh_course_cache()
@@ -0,0 +1,77 @@
+"""
+Background tasks of the pos app, run by `manage.py run_worker` (see pos/jobs.py).
+"""
+import base64
+import dataclasses
+import io
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .cache import cached, is_shared
+from .dataexport import DEFAULT_LABELS, export_data
+from .importer import ImportFormatError, import_students
+from .jobs import task
+from .models import Batch, CSRProfile, Job, Student
+from .scheduler import periodic
+
+
+@task('pos.import_students')
+def import_students_task(filename, content, csr_id, batch_id=None, dry_run=False):
+    """Import an uploaded roster; `content` is the file, base64-encoded
+
+    Each chunk commits on its own: enqueue with max_attempts=1, a second run
+    would report the students of the committed chunks as already existing.
+    """
+    csr = CSRProfile.objects.get(pk=csr_id)
+    batch = Batch.objects.get(pk=batch_id) if batch_id else None
+    try:
+        result = import_students(io.BytesIO(base64.b64decode(content)), filename, csr, batch=batch, dry_run=dry_run)
+    except ImportFormatError as e:
+        # The file itself is unusable: report it instead of retrying
+        return {'error': str(e)}
+    return {**dataclasses.asdict(result), 'skipped': result.skipped}
+
+
+@task('pos.export_data')
+def export_data_task(directory, labels=DEFAULT_LABELS, workers=4):
+    """Export the database to `directory` on the worker host; returns the manifest"""
+    return export_data(directory, labels=labels, workers=workers)
+
+
+@periodic(cron='30 2 * * *', jitter=600)
+@task('pos.refresh_course_cache')
+def refresh_course_cache_task():
+    """Recompute every student's course_names/course_count"""
+    return Student.objects.all().refresh_course_cache()
+
+
+@periodic(every=timedelta(minutes=10), jitter=60)
+@task('pos.warm_dashboards')
+def warm_dashboards():
+    """Build the shared dashboard fragments that are missing from the cache
+
+    A fragment is only rebuilt after its data changed, so the first page load
+    after an edit does not pay for it.
+    """
+    if not is_shared():
+        # Each web process has its own local-memory cache: nothing to warm from here
+        return {'skipped': 'process-local cache'}
+    # The views pull in the whole web stack; only import them when the task runs
+    from . import reports, views
+
+    cached('admin_dashboard', views._build_admin_dashboard_context)
+    cached('batch_stats', views._build_batch_stats)
+    for is_lead in (True, False):
+        cached('csr_dashboard', lambda is_lead=is_lead: views._build_csr_dashboard_shared_stats(is_lead), 'lead' if is_lead else 'regular')
+    reports.get_filter_options()
+    return ['admin_dashboard', 'batch_stats', 'csr_dashboard', 'filter_options']
+
+
+@periodic(cron='0 3 * * *', jitter=600)
+@task('pos.prune_jobs')
+def prune_jobs(days=30):
+    """Delete finished jobs older than `days`; returns how many"""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Job.objects.filter(status__in=['done', 'failed'], finished_at__lt=cutoff).delete()
+    return deleted
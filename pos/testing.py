@@ -0,0 +1,265 @@
+"""
+Helpers for the query-budget regression tests.
+
+Every pos and portal view is rendered against a small and a large dataset and
+the number of SQL queries is compared against a declared per-view budget.
+A view must stay within its budget at both sizes and must not issue more
+queries on the large dataset than on the small one (i.e. no N+1 patterns).
+"""
+import re
+from collections import Counter
+from datetime import timedelta, time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import DOMAINS, invalidate
+from .models import Batch, Course, CSRProfile, InvoiceSettings, Job, Payment, Student, StudentInvoice
+from .utils import invoice_settings_resolver
+
+
+SMALL_DATASET = 10
+LARGE_DATASET = 500
+
+_LITERAL_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def query_signature(sql):
+    """Normalize a SQL statement so repeated queries with different literals collapse together."""
+    for pattern, replacement in _LITERAL_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def statements(queries):
+    """The captured queries, with the chunks of one bulk INSERT counted once
+
+    bulk_create() splits its rows into several statements when they exceed
+    the backend's parameter limit (999 on SQLite): consecutive INSERTs with
+    the same signature are one bulk write, not an N+1.
+    """
+    counted = []
+    previous = None
+    for query in queries:
+        # The table and columns; the chunks differ in their number of rows
+        target = query_signature(query['sql']).split(' VALUES ')[0]
+        if not (target == previous and target.startswith('INSERT')):
+            counted.append(query)
+        previous = target
+    return counted
+
+
+def budget_key(spec):
+    """Readable identifier for a budget entry: url name, args, role and query string."""
+    key = spec['name']
+    if spec.get('args'):
+        key = f"{key}({','.join(str(arg) for arg in spec['args'])})"
+    key = f"{key}[{spec['role']}]"
+    if spec.get('query'):
+        key = f"{key}?{spec['query']}"
+    return key
+
+
+def format_signatures(queries, limit=10):
+    """Return the most frequent query signatures as a readable report."""
+    counts = Counter(query_signature(q['sql']) for q in queries)
+    lines = []
+    for sql, count in counts.most_common(limit):
+        lines.append(f"  {count:>4} x {sql[:300]}")
+    return '\n'.join(lines)
+
+
+class QueryBudgetDataset:
+    """Builds a representative dataset that can be grown to a target number of students."""
+
+    def __init__(self):
+        self.admin = User.objects.create_superuser(username='qb_admin', password='x', email='qb_admin@example.com')
+
+        lead_user = User.objects.create_user(username='qb_lead', password='x')
+        self.lead_csr = CSRProfile.objects.create(user=lead_user, full_name='Lead CSR', lead_role=True)
+        csr_user = User.objects.create_user(username='qb_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=csr_user, full_name='Regular CSR')
+        InvoiceSettings.objects.create(csr=self.lead_csr)
+        InvoiceSettings.objects.create(csr=self.csr)
+        self.job = Job.objects.create(task='pos.refresh_course_cache', created_by=csr_user)
+
+        self.courses = [
+            Course.objects.create(name='Web Development', trainer_name='T1', price=30000, duration='weekend,weekdays'),
+            Course.objects.create(name='Graphic Design', trainer_name='T2', price=20000, duration='weekdays'),
+            Course.objects.create(name='Digital Marketing', trainer_name='T3', price=15000, duration='1_month'),
+        ]
+        self.batches = [
+            Batch.objects.create(batch_number='QB-1', created_by=self.lead_csr),
+            Batch.objects.create(batch_number='QB-2', created_by=self.lead_csr, status='inactive'),
+        ]
+
+        # Portal side: one trainer teaching every course in the first batch
+        from portal.models import Trainer, TrainerCourse, Lecture, TrainerWeeklyFeedback
+
+        trainer_user = User.objects.create_user(username='qb_trainer', password='x')
+        self.trainer = Trainer.objects.create(user=trainer_user, name='QB Trainer')
+        self.trainer_courses = [
+            TrainerCourse.objects.create(trainer=self.trainer, course=course, batch=self.batches[0], schedule='weekend')
+            for course in self.courses
+        ]
+        today = timezone.now().date()
+        self.lectures = []
+        for tc in self.trainer_courses:
+            for number in range(1, 4):
+                self.lectures.append(Lecture.objects.create(
+                    trainer_course=tc,
+                    lecture_number=number,
+                    date=today - timedelta(days=7 * (4 - number)),
+                    start_time=time(10, 0),
+                    end_time=time(11, 30),
+                ))
+            TrainerWeeklyFeedback.objects.create(
+                trainer_course=tc,
+                trainer=self.trainer,
+                week_start=today - timedelta(days=today.weekday()),
+                week_end=today - timedelta(days=today.weekday()) + timedelta(days=6),
+            )
+        self.student_count = 0
+
+    def grow_to(self, total):
+        """Bulk insert students (with courses, invoices and attendance) until `total` exist."""
+        from portal.models import Attendance
+
+        start = self.student_count
+        if total <= start:
+            return
+        today = timezone.now().date()
+        students = []
+        for index in range(start, total):
+            csr = self.lead_csr if index % 2 else self.csr
+            paid = index % 3 == 0
+            students.append(Student(
+                name=f'Student {index}',
+                guardian_name=f'Guardian {index}',
+                phone_number=f'0300{index:07d}',
+                cnic=f'35202{index:08d}',
+                batch=self.batches[index % 2],
+                total_fees=30000,
+                discounted_price=30000,
+                advance_payment=10000,
+                second_installment=20000,
+                balance=0 if paid else 20000,
+                total_amount=30000 if paid else 10000,
+                payment_status='paid' if paid else 'pending',
+                second_installment_due_date=today + timedelta(days=30),
+                due_date=today if paid else None,
+                schedule='weekend',
+                created_by=csr,
+                created_by_name=csr.full_name,
+            ))
+        students = Student.objects.bulk_create(students)
+        Payment.objects.record_advances(students)
+        Payment.objects.record_installments([student.id for student in students if student.payment_status == 'paid'])
+
+        through = Student.courses.through
+        links = []
+        invoices = []
+        attendances = []
+        for index, student in enumerate(students, start=start):
+            course = self.courses[index % len(self.courses)]
+            links.append(through(student_id=student.id, course_id=course.id))
+            invoices.append(StudentInvoice(student=student, present_invoice_no=1000 + index))
+            if student.batch_id == self.batches[0].id:
+                for lecture in self.lectures:
+                    if lecture.trainer_course.course_id == course.id:
+                        attendances.append(Attendance(
+                            lecture=lecture,
+                            student=student,
+                            status='present' if index % 4 else 'absent',
+                            marked_by=self.trainer,
+                        ))
+        through.objects.bulk_create(links)
+        StudentInvoice.objects.bulk_create(invoices)
+        Attendance.objects.bulk_create(attendances)
+        # bulk_create() skips the model signals that normally invalidate cached fragments
+        invalidate(*DOMAINS)
+        self.student_count = total
+        self.first_student = Student.objects.order_by('id').first()
+
+    def user_for(self, role):
+        return {
+            'admin': self.admin,
+            'lead': self.lead_csr.user,
+            'csr': self.csr.user,
+            'trainer': self.trainer.user,
+        }[role]
+
+    def url_args(self, spec):
+        """Resolve the placeholder arguments used in a budget entry; other values pass through as-is."""
+        resolved = {
+            'student': self.first_student.id,
+            'csr_student': Student.objects.filter(created_by=self.csr).order_by('id').values_list('id', flat=True).first(),
+            'pending_student': Student.objects.filter(created_by=self.csr, payment_status='pending').order_by('id').values_list('id', flat=True).first(),
+            'batch': self.batches[0].id,
+            'course': self.courses[0].id,
+            'trainer': self.trainer.id,
+            'trainer_course': self.trainer_courses[0].id,
+            'lecture': self.lectures[-1].id,
+            'job': self.job.id,
+        }
+        return [resolved.get(name, name) for name in spec.get('args', [])]
+
+
+class QueryBudgetTestCase(TestCase):
+    """Base class: subclasses declare BUDGETS, a list of dicts with
+    name (URL name), role, budget and optionally args and query."""
+
+    BUDGETS = []
+    small = SMALL_DATASET
+    large = LARGE_DATASET
+
+    def setUp(self):
+        # Budgets are measured against a cold cache
+        cache.clear()
+
+    def measure(self, dataset, spec):
+        url = reverse(spec['name'], args=dataset.url_args(spec))
+        if spec.get('query'):
+            url = f"{url}?{spec['query']}"
+        self.client.force_login(dataset.user_for(spec['role']))
+        # The resolver memo outlives requests; measure every request without it
+        invoice_settings_resolver.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 500, f"{spec['name']} returned {response.status_code}")
+        return statements(ctx.captured_queries)
+
+    def test_query_budgets(self):
+        if not self.BUDGETS:
+            self.skipTest('No budgets declared')
+        dataset = QueryBudgetDataset()
+        dataset.grow_to(self.small)
+        small_queries = {budget_key(spec): self.measure(dataset, spec) for spec in self.BUDGETS}
+        dataset.grow_to(self.large)
+
+        failures = []
+        for spec in self.BUDGETS:
+            key = budget_key(spec)
+            small = small_queries[key]
+            large = self.measure(dataset, spec)
+            budget = spec['budget']
+            if len(small) > budget:
+                failures.append(f"{key}: {len(small)} queries at {self.small} students (budget {budget})\n{format_signatures(small)}")
+            if len(large) > budget:
+                failures.append(f"{key}: {len(large)} queries at {self.large} students (budget {budget})\n{format_signatures(large)}")
+            elif len(large) > len(small):
+                failures.append(
+                    f"{key}: query count grows with data size ({len(small)} -> {len(large)})\n{format_signatures(large)}"
+                )
+        if failures:
+            self.fail('Query budget exceeded:\n' + '\n\n'.join(failures))
@@ -0,0 +1,1481 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+from decimal import Decimal
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import cached, get_stats, single_flight
+from .models import Batch, Course, CSRProfile, InvoiceSettings, InvoiceSnapshot, Job, Payment, Student, StudentInvoice
+from .testing import QueryBudgetTestCase
+from .utils import invoice_settings_resolver
+
+
+# ETags are only emitted with a cache shared between processes
+SHARED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'pos_test_cache'),
+    }
+}
+
+
+class PosQueryBudgetTests(QueryBudgetTestCase):
+    """Query budgets for the pos views (see pos/testing.py)."""
+
+    BUDGETS = [
+        {'name': 'admin_dashboard', 'role': 'admin', 'budget': 16},
+        {'name': 'dashboard_widget', 'role': 'admin', 'budget': 5, 'args': ['monthly-revenue']},
+        {'name': 'dashboard_widget', 'role': 'admin', 'budget': 5, 'args': ['course-distribution']},
+        {'name': 'dashboard_widget', 'role': 'admin', 'budget': 5, 'args': ['csr-performance']},
+        {'name': 'dashboard_widget', 'role': 'admin', 'budget': 5, 'args': ['batch-stats']},
+        {'name': 'commission_report', 'role': 'admin', 'budget': 6},
+        {'name': 'commission_report', 'role': 'admin', 'budget': 10, 'query': 'start_date=2000-01-01&end_date=2100-01-01'},
+        {'name': 'export_commission_csv', 'role': 'admin', 'budget': 9, 'query': 'start_date=2000-01-01&end_date=2100-01-01'},
+        {'name': 'csr_management', 'role': 'admin', 'budget': 9},
+        {'name': 'course_management', 'role': 'admin', 'budget': 7},
+        {'name': 'admin_batch_management', 'role': 'admin', 'budget': 10},
+        {'name': 'batch_management', 'role': 'admin', 'budget': 6},
+        {'name': 'admin_settings', 'role': 'admin', 'budget': 7},
+        {'name': 'report_students', 'role': 'admin', 'budget': 10},
+        {'name': 'report_students', 'role': 'admin', 'budget': 6, 'query': 'export=excel'},
+        {'name': 'report_students_ajax', 'role': 'admin', 'budget': 6},
+        {'name': 'report_students_csr', 'role': 'csr', 'budget': 11},
+        {'name': 'report_revenue', 'role': 'admin', 'budget': 9},
+        {'name': 'report_revenue', 'role': 'admin', 'budget': 6, 'query': 'export=excel'},
+        {'name': 'report_revenue_csr', 'role': 'csr', 'budget': 10},
+        {'name': 'report_revenue_csr', 'role': 'lead', 'budget': 8},
+        {'name': 'report_revenue_ajax', 'role': 'lead', 'budget': 8, 'query': 'start_date=2000-01-01&end_date=2100-01-01'},
+        {'name': 'report_aging', 'role': 'admin', 'budget': 5},
+        {'name': 'report_aging_students', 'role': 'admin', 'budget': 5},
+        {'name': 'report_aging_students', 'role': 'csr', 'budget': 4, 'query': 'export=csv'},
+        {'name': 'get_batch_stats', 'role': 'admin', 'budget': 3},
+        {'name': 'course_management_csr', 'role': 'lead', 'budget': 8},
+        {'name': 'csr_dashboard', 'role': 'lead', 'budget': 27},
+        {'name': 'csr_dashboard', 'role': 'csr', 'budget': 24},
+        {'name': 'csr_batch_management', 'role': 'lead', 'budget': 12},
+        {'name': 'student_management', 'role': 'lead', 'budget': 11},
+        {'name': 'student_management', 'role': 'csr', 'budget': 11},
+        {'name': 'generate_invoice', 'role': 'csr', 'budget': 17, 'args': ['csr_student']},
+        {'name': 'generate_pending_invoice', 'role': 'csr', 'budget': 20, 'args': ['pending_student']},
+        {'name': 'batch_invoices', 'role': 'lead', 'budget': 11, 'args': ['batch']},
+        {'name': 'batch_invoices', 'role': 'csr', 'budget': 11, 'args': ['batch'], 'query': 'payment_status=pending'},
+        {'name': 'edit_student', 'role': 'csr', 'budget': 11, 'args': ['csr_student']},
+        {'name': 'invoice_settings', 'role': 'lead', 'budget': 7},
+        {'name': 'csr_settings', 'role': 'csr', 'budget': 7},
+        {'name': 'change_password', 'role': 'csr', 'budget': 6},
+        {'name': 'student_import', 'role': 'csr', 'budget': 6},
+        {'name': 'job_status', 'role': 'csr', 'budget': 3, 'args': ['job']},
+    ]
+
+
+class CacheInvalidationTests(TestCase):
+    """Cached fragments are rebuilt once a model signal bumps their domain version."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fragment_rebuilt_after_write(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return Course.objects.count()
+
+        self.assertEqual(cached('filter_options', build), 0)
+        self.assertEqual(cached('filter_options', build), 0)
+        self.assertEqual(len(builds), 1)
+
+        Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        self.assertEqual(cached('filter_options', build), 1)
+        self.assertEqual(len(builds), 2)
+
+        stats = {row['name']: row for row in get_stats()}
+        self.assertEqual(stats['filter_options']['hits'], 1)
+        self.assertEqual(stats['filter_options']['misses'], 2)
+
+    def test_fragment_rebuilt_after_commit(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return Course.objects.count()
+
+        cached('filter_options', build)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+                # A request in this window would cache what it read before the commit
+                cached('filter_options', build)
+                cached('filter_options', build)
+                self.assertEqual(len(builds), 2)
+        self.assertEqual(cached('filter_options', build), 1)
+        self.assertEqual(len(builds), 3)
+
+    def test_cache_stats_admin_page(self):
+        admin = User.objects.create_superuser(username='cache_admin', password='x', email='cache_admin@example.com')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('cache_stats'))
+        self.assertContains(response, 'filter_options')
+        response = self.client.post(reverse('cache_stats'))
+        self.assertRedirects(response, reverse('cache_stats'))
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Identical concurrent report requests share one computation."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_requests_compute_once(self):
+        calls = []
+        results = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'total': 42}
+
+        def request():
+            results.append(single_flight('report_revenue', build, 'all', '', '', '', '', False))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'total': 42}] * 5)
+
+    def test_failed_computation_releases_lock(self):
+        def fail():
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            single_flight('commission_report', fail, '2024-01-01', '2024-01-31', 1.0)
+        self.assertEqual(single_flight('commission_report', lambda: 'ok', '2024-01-01', '2024-01-31', 1.0), 'ok')
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class DashboardWidgetTests(TestCase):
+    """Dashboard chart widgets are revalidated with ETags."""
+
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser(username='widget_admin', password='x', email='widget_admin@example.com')
+        self.client.force_login(admin)
+        self.url = reverse('dashboard_widget', args=['course-distribution'])
+
+    def test_not_modified_until_data_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'labels': [], 'data': []})
+        etag = response['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['labels'], ['Python'])
+
+    def test_unknown_widget(self):
+        response = self.client.get(reverse('dashboard_widget', args=['nope']))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class ConditionalGetTests(TestCase):
+    """Polled JSON endpoints answer 304 without querying while their data is unchanged."""
+
+    def setUp(self):
+        cache.clear()
+        admin = User.objects.create_superuser(username='etag_admin', password='x', email='etag_admin@example.com')
+        self.client.force_login(admin)
+
+    def test_report_revenue_ajax_not_modified(self):
+        url = reverse('report_revenue_ajax')
+        response = self.client.get(url, {'batch': ''})
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # Only the session and user lookups of login_required remain
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'batch': ''}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Different filters and changed data both produce a new validator
+        response = self.client.get(url, {'batch': '1'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        response = self.client.get(url, {'batch': ''}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_validator_is_per_user(self):
+        url = reverse('report_students_ajax')
+        etag = self.client.get(url)['ETag']
+        other = User.objects.create_superuser(username='etag_other', password='x', email='etag_other@example.com')
+        self.client.force_login(other)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_validator_with_process_local_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with self.settings(CACHES=locmem):
+            for url in (reverse('report_revenue_ajax'), reverse('dashboard_widget', args=['batch-stats'])):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('ETag'))
+                response = self.client.get(url, HTTP_IF_NONE_MATCH='"stale"')
+                self.assertEqual(response.status_code, 200)
+
+
+class InvoiceSerialAllocationTests(TransactionTestCase):
+    """Serial numbers reserved concurrently are unique and gap-free."""
+
+    THREADS = 8
+    RESERVATIONS_PER_THREAD = 25
+
+    def setUp(self):
+        user = User.objects.create_user(username='serial_csr', password='x')
+        csr = CSRProfile.objects.create(user=user, full_name='Serial CSR')
+        self.settings = InvoiceSettings.objects.create(csr=csr, current_serial_number=1000)
+
+    def test_block_reservation(self):
+        self.assertEqual(list(self.settings.reserve_serial_numbers(3)), [1001, 1002, 1003])
+        self.assertEqual(list(self.settings.reserve_serial_numbers()), [1004])
+        self.settings.refresh_from_db()
+        self.assertEqual(self.settings.current_serial_number, 1004)
+
+    def test_stale_invoice_keeps_stored_number(self):
+        from .utils import assign_invoice_numbers
+
+        batch = Batch.objects.create(batch_number='SN-1', created_by=self.settings.csr)
+        student = Student.objects.create(
+            name='Serial', guardian_name='G', phone_number='03001234567', cnic='35202-1234567-1',
+            batch=batch, total_fees=1000, discounted_price=1000, created_by=self.settings.csr,
+        )
+        first = StudentInvoice.objects.create(student=student)
+        stale = StudentInvoice.objects.get(pk=first.pk)
+        self.assertEqual(first.assign_number(self.settings), 1001)
+        # Read before the number was stored, as by a concurrent first print
+        self.assertEqual(stale.assign_number(self.settings), 1001)
+
+        student = Student.objects.select_related('invoice_numbers').get(pk=student.pk)
+        first.assign_number(self.settings, pending=True)
+        invoices, _ = assign_invoice_numbers([student], is_pending=True)
+        self.assertEqual(invoices[student.id].pending_invoice_no, 1002)
+        self.assertEqual(StudentInvoice.objects.get(pk=first.pk).pending_invoice_no, 1002)
+        self.settings.refresh_from_db()
+        self.assertEqual(self.settings.current_serial_number, 1002)
+
+    def test_concurrent_reservations_are_unique(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('In-memory SQLite cannot be written from several connections')
+        reserved = []
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def worker():
+            settings = InvoiceSettings.objects.get(pk=self.settings.pk)
+            try:
+                start.wait()
+                for index in range(self.RESERVATIONS_PER_THREAD):
+                    reserved.extend(settings.reserve_serial_numbers(1 + index % 2))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(reserved), len(set(reserved)))
+        self.settings.refresh_from_db()
+        self.assertEqual(sorted(reserved), list(range(1001, self.settings.current_serial_number + 1)))
+
+
+class BatchInvoiceTests(TestCase):
+    """Printing a whole batch numbers every new invoice from one reservation."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='batch_lead', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Batch Lead', lead_role=True)
+        self.settings = InvoiceSettings.objects.create(csr=self.csr, current_serial_number=500)
+        self.batch = Batch.objects.create(batch_number='BI-1', created_by=self.csr)
+        for index in range(5):
+            Student.objects.create(
+                name=f'Student {index}', phone_number='03000000000', batch=self.batch,
+                total_fees=1000, discounted_price=1000, created_by=self.csr,
+            )
+        self.client.force_login(user)
+
+    def test_missing_numbers_reserved_once(self):
+        url = reverse('batch_invoices', args=[self.batch.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['invoices']), 5)
+        numbers = sorted(StudentInvoice.objects.values_list('present_invoice_no', flat=True))
+        self.assertEqual(numbers, [501, 502, 503, 504, 505])
+
+        # Reprinting keeps the numbers and reserves nothing new
+        self.client.get(url)
+        self.settings.refresh_from_db()
+        self.assertEqual(self.settings.current_serial_number, 505)
+
+    def test_payment_status_filter(self):
+        Student.objects.filter(name='Student 0').update(payment_status='paid')
+        response = self.client.get(reverse('batch_invoices', args=[self.batch.id]), {'payment_status': 'paid'})
+        self.assertEqual([invoice['student'].name for invoice in response.context['invoices']], ['Student 0'])
+
+    def test_issued_invoices_are_stored(self):
+        url = reverse('batch_invoices', args=[self.batch.id])
+        self.settings.bank_name = 'First Bank'
+        self.settings.save(update_fields=['bank_name'])
+        self.client.get(url)
+        self.assertEqual(InvoiceSnapshot.objects.filter(invoice_type='present').count(), 5)
+
+        # Batch and single reprints serve the invoices as issued
+        self.settings.bank_name = 'Second Bank'
+        self.settings.save(update_fields=['bank_name'])
+        batch_print = self.client.get(url)
+        self.assertContains(batch_print, 'First Bank')
+        self.assertNotContains(batch_print, 'Second Bank')
+        student = Student.objects.get(name='Student 0')
+        single = self.client.get(reverse('generate_invoice', args=[student.id]))
+        self.assertContains(single, 'First Bank')
+        self.assertContains(single, str(student.invoice_numbers.present_invoice_no))
+        self.assertEqual(InvoiceSnapshot.objects.count(), 5)
+
+    def test_pending_print_skips_paid_students(self):
+        Student.objects.filter(name='Student 0').update(payment_status='paid', balance=0)
+        Student.objects.exclude(name='Student 0').update(balance=600)
+        response = self.client.get(reverse('batch_invoices', args=[self.batch.id]), {'pending': 'true', 'receipt_type': 'BBT'})
+        self.assertEqual(len(response.context['invoices']), 4)
+        self.assertFalse(StudentInvoice.objects.filter(student__name='Student 0', pending_invoice_no__gt=0).exists())
+
+        response = self.client.get(reverse('batch_invoices', args=[self.batch.id]), {'receipt_type': 'BBT'})
+        self.assertContains(response, '?receipt_type=BBT&amp;payment_status=paid')
+
+
+class InvoiceSnapshotTests(TestCase):
+    """Issued invoices are stored and reprinted byte-for-byte until regenerated."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='snap_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Snap CSR')
+        self.settings = InvoiceSettings.objects.create(csr=self.csr, bank_name='First Bank')
+        batch = Batch.objects.create(batch_number='SN-1', created_by=self.csr)
+        self.student = Student.objects.create(
+            name='Snap Student', phone_number='03000000000', batch=batch,
+            total_fees=1000, discounted_price=1000, advance_payment=400, second_installment=600,
+            created_by=self.csr,
+        )
+        self.client.force_login(user)
+        self.url = reverse('generate_invoice', args=[self.student.id])
+
+    def test_reprint_serves_issued_invoice(self):
+        first = self.client.get(self.url)
+        self.assertContains(first, 'First Bank')
+        snapshot = InvoiceSnapshot.objects.get(student=self.student, invoice_type='present')
+        self.assertEqual(snapshot.amount, 400)
+
+        # Later edits do not change an issued invoice
+        self.settings.bank_name = 'Second Bank'
+        self.settings.save(update_fields=['bank_name'])
+        with self.assertNumQueries(5):
+            reprint = self.client.get(self.url)
+        self.assertEqual(reprint.content, first.content)
+
+        # Regenerating re-renders with current data and keeps the invoice number
+        regenerated = self.client.get(self.url, {'regenerate': '1'})
+        self.assertContains(regenerated, 'Second Bank')
+        snapshot.refresh_from_db()
+        self.assertIsNotNone(snapshot.regenerated_at)
+        self.assertEqual(InvoiceSnapshot.objects.count(), 1)
+
+    def test_gzip_clients_receive_stored_bytes(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        snapshot = InvoiceSnapshot.objects.get(student=self.student)
+        self.assertEqual(response.content, bytes(snapshot.html))
+
+
+class InvoiceSettingsResolverTests(TestCase):
+    """Invoice settings are memoized per CSR and dropped when settings or CSRs change."""
+
+    def setUp(self):
+        cache.clear()
+        invoice_settings_resolver.clear()
+        lead_user = User.objects.create_user(username='resolver_lead', password='x')
+        self.lead = CSRProfile.objects.create(user=lead_user, full_name='Resolver Lead', lead_role=True)
+        self.lead_settings = InvoiceSettings.objects.create(csr=self.lead, bank_name='Lead Bank')
+        user = User.objects.create_user(username='resolver_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Resolver CSR')
+        self.csr_settings = InvoiceSettings.objects.create(csr=self.csr, bank_name='CSR Bank')
+        other_user = User.objects.create_user(username='resolver_other', password='x')
+        self.other = CSRProfile.objects.create(user=other_user, full_name='Resolver Other')
+
+    def test_memoizes_until_settings_change(self):
+        self.assertEqual(invoice_settings_resolver.resolve(self.csr.id).bank_name, 'CSR Bank')
+        with self.assertNumQueries(0):
+            invoice_settings_resolver.resolve(self.csr.id)
+
+        self.csr_settings.bank_name = 'New Bank'
+        self.csr_settings.save(update_fields=['bank_name'])
+        self.assertEqual(invoice_settings_resolver.resolve(self.csr.id).bank_name, 'New Bank')
+
+    def test_resolve_many_falls_back_to_lead_in_one_query(self):
+        with self.assertNumQueries(1):
+            resolved = invoice_settings_resolver.resolve_many([self.csr.id, self.other.id, None])
+        self.assertEqual(resolved[self.csr.id], self.csr_settings)
+        self.assertEqual(resolved[self.other.id], self.lead_settings)
+        self.assertEqual(resolved[None], self.lead_settings)
+
+    def test_concurrent_clear_keeps_resolved_settings(self):
+        class ClearedAfterFill(dict):
+            # Another thread sees a settings change right after this one memoized a CSR
+            def __setitem__(self, key, value):
+                super().__setitem__(key, value)
+                invoice_settings_resolver.clear()
+
+        invoice_settings_resolver.resolve_many([])
+        invoice_settings_resolver._by_csr = ClearedAfterFill()
+        resolved = invoice_settings_resolver.resolve_many([self.csr.id])
+        self.assertEqual(resolved[self.csr.id], self.csr_settings)
+
+
+class StudentPaymentTransitionTests(TestCase):
+    """Payment status transitions need no re-fetch and have a set-based form."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='transition_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Transition CSR')
+        self.batch = Batch.objects.create(batch_number='TR-1', created_by=self.csr)
+        self.students = [
+            Student.objects.create(
+                name=f'Transition {i}', phone_number='03000000000', batch=self.batch,
+                total_fees=1000, discounted_price=1000, advance_payment=400, second_installment=600,
+                created_by=self.csr,
+            )
+            for i in range(3)
+        ]
+        self.client.force_login(user)
+
+    def test_save_uses_loaded_status(self):
+        student = Student.objects.get(pk=self.students[0].pk)
+        student.payment_status = 'paid'
+        with self.assertNumQueries(1):
+            student.save()
+        self.assertEqual((student.balance, student.total_amount), (0, 1000))
+
+        # The saved status becomes the new baseline
+        student.payment_status = 'pending'
+        student.save(update_fields=['payment_status'])
+        student.refresh_from_db()
+        self.assertEqual((student.balance, student.total_amount), (600, 400))
+
+    def test_mark_paid_and_pending(self):
+        ids = [student.pk for student in self.students]
+        self.assertEqual(Student.objects.mark_paid(ids[:2]), 2)
+        self.assertEqual(Student.objects.mark_paid(ids), 1)
+        self.assertEqual(
+            set(Student.objects.values_list('payment_status', 'balance', 'total_amount')),
+            {('paid', 0, 1000)},
+        )
+        self.assertEqual(Student.objects.mark_pending(ids[:1]), 1)
+        self.assertEqual(
+            Student.objects.values_list('balance', 'total_amount').get(pk=ids[0]),
+            (600, 400),
+        )
+
+    def test_update_payment_status_view(self):
+        student = self.students[0]
+        url = reverse('update_payment_status', args=[student.id])
+        response = self.client.post(url, '{"payment_status": "paid"}', content_type='application/json')
+        self.assertEqual(response.json(), {'success': True, 'balance': 0, 'payment_status': 'paid'})
+        student.refresh_from_db()
+        self.assertEqual(student.total_amount, 1000)
+
+
+class CollectPaymentsTests(TestCase):
+    """Many students are marked paid, and optionally numbered, in one request."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='collect_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Collect CSR')
+        self.settings = InvoiceSettings.objects.create(csr=self.csr, current_serial_number=500)
+        batch = Batch.objects.create(batch_number='CP-1', created_by=self.csr)
+        self.students = [
+            Student.objects.create(
+                name=f'Collect {i}', phone_number='03000000000', batch=batch,
+                total_fees=1000, discounted_price=1000, advance_payment=400, second_installment=600,
+                created_by=self.csr,
+            )
+            for i in range(5)
+        ]
+        other_user = User.objects.create_user(username='collect_other', password='x')
+        other = CSRProfile.objects.create(user=other_user, full_name='Other CSR')
+        self.foreign = Student.objects.create(
+            name='Foreign', phone_number='03000000000', batch=batch,
+            total_fees=1000, advance_payment=400, second_installment=600, created_by=other,
+        )
+        self.client.force_login(user)
+        self.url = reverse('collect_payments')
+
+    def post(self, **data):
+        return self.client.post(self.url, json.dumps(data), content_type='application/json')
+
+    def test_collects_and_allocates_numbers(self):
+        ids = [student.id for student in self.students]
+        response = self.post(student_ids=ids, payment_method='bank', payment_date='2026-01-15', allocate_invoices=True)
+        data = response.json()
+        self.assertEqual(data['updated'], 5)
+        self.assertEqual({s['balance'] for s in data['students']}, {0})
+        self.assertEqual(sorted(s['pending_invoice_no'] for s in data['students']), list(range(501, 506)))
+        self.assertEqual(
+            set(Student.objects.filter(id__in=ids).values_list('payment_status', 'payment_method', 'total_amount')),
+            {('paid', 'bank', 1000)},
+        )
+        self.settings.refresh_from_db()
+        self.assertEqual(self.settings.current_serial_number, 505)
+
+        # Repeating the request changes nothing and keeps the numbers
+        again = self.post(student_ids=ids, allocate_invoices=True).json()
+        self.assertEqual(again['updated'], 0)
+        self.assertEqual(again['students'], data['students'])
+
+    def test_rejects_students_of_other_csrs(self):
+        response = self.post(student_ids=[self.students[0].id, self.foreign.id])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing'], [self.foreign.id])
+        self.assertFalse(Student.objects.filter(payment_status='paid').exists())
+
+    def test_fixed_query_count(self):
+        with self.assertNumQueries(16):
+            self.post(student_ids=[student.id for student in self.students], allocate_invoices=True)
+
+
+class StudentImportTests(TestCase):
+    """Rosters are imported in chunks, with per-row errors."""
+
+    HEADER = 'name,guardian_name,phone_number,cnic,courses,batch,discount,advance_payment\n'
+
+    def setUp(self):
+        user = User.objects.create_user(username='import_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Import CSR')
+        self.batch = Batch.objects.create(batch_number='IM-1', created_by=self.csr)
+        self.python = Course.objects.create(name='Python', trainer_name='T', price=10000, duration='weekend')
+        self.excel = Course.objects.create(name='Excel', trainer_name='T', price=5000, duration='weekend')
+        Student.objects.create(
+            name='Existing', phone_number='03001111111', cnic='35202-0000000-1', batch=self.batch,
+            total_fees=0, created_by=self.csr,
+        )
+        self.client.force_login(user)
+
+    def upload(self, rows, **data):
+        csv_file = SimpleUploadedFile('roster.csv', (self.HEADER + rows).encode())
+        return self.client.post(reverse('student_import'), {'file': csv_file, **data})
+
+    def test_imports_valid_rows_and_reports_the_rest(self):
+        rows = ''.join([
+            f'Student {i},Guardian,0300{i:07d},35202-{i:07d}-9,Python;Excel,IM-1,10,5000\n' for i in range(25)
+        ]) + (
+            'Duplicate,G,03009999999,35202-0000000-1,Python,IM-1,0,0\n'
+            'Bad Course,G,03009999998,35202-9999999-8,Cooking,IM-1,0,0\n'
+            'Bad Phone,G,12,35202-9999999-7,Python,IM-1,0,0\n'
+        )
+        response = self.upload(rows)
+        result = response.context['result']
+        self.assertEqual((result.created, result.rows), (25, 28))
+        self.assertEqual([line for line, _ in result.errors], [27, 28, 29])
+
+        student = Student.objects.get(name='Student 3')
+        self.assertEqual(
+            (student.total_fees, student.discounted_price, student.second_installment, student.balance, student.total_amount),
+            (15000, 13500, 8500, 8500, 5000),
+        )
+        self.assertEqual(student.created_by_name, 'Import CSR')
+        self.assertEqual(set(student.courses.values_list('name', flat=True)), {'Python', 'Excel'})
+        self.assertEqual((student.course_names, student.course_count), (['Python', 'Excel'], 2))
+        self.assertEqual(Student.courses.through.objects.count(), 50)
+
+    def test_chunked_writes_and_dry_run(self):
+        rows = ''.join(f'S{i},G,0301{i:07d},35203-{i:07d}-1,Python,,0,10000\n' for i in range(7))
+        path = os.path.join(tempfile.mkdtemp(), 'roster.csv')
+        with open(path, 'w') as f:
+            f.write(self.HEADER + rows)
+
+        call_command('import_students', path, csr='import_csr', batch='IM-1', dry_run=True, stdout=io.StringIO())
+        self.assertEqual(Student.objects.count(), 1)
+
+        # 3 queries per chunk of 3 (students, course links, advance payments) after the catalog reads
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('import_students', path, csr='import_csr', batch='IM-1', chunk_size=3, stdout=io.StringIO())
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 9)
+        self.assertEqual(Student.objects.filter(batch=self.batch, payment_status='paid').count(), 7)
+
+
+class MaintenanceCommandTests(TestCase):
+    """The maintenance commands update in chunks and are no-ops when rerun."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='maint_csr', password='x')
+        csr = CSRProfile.objects.create(user=user, full_name='Maint CSR')
+        batch = Batch.objects.create(batch_number='MT-1', created_by=csr)
+        for i in range(5):
+            Student.objects.create(
+                name=f'Maint {i}', phone_number='03000000000', batch=batch,
+                total_fees=1000, discounted_price=1000, advance_payment=1000 if i < 2 else 400,
+                second_installment=0 if i < 2 else 600, invoice_number=f'P{100 + i}' if i % 2 else str(100 + i),
+                due_date=timezone.now().date() if i == 4 else None, created_by=csr,
+            )
+        Student.objects.update(balance=1)
+
+    def run_command(self, name, **options):
+        out = io.StringIO()
+        call_command(name, chunk_size=2, stdout=out, **options)
+        return out.getvalue()
+
+    def test_commands_are_set_based_and_rerunnable(self):
+        self.assertIn('Would update 5', self.run_command('update_balance', dry_run=True))
+        self.assertEqual(Student.objects.filter(balance=1).count(), 5)
+        self.run_command('update_balance')
+        self.assertEqual(
+            sorted(Student.objects.values_list('balance', flat=True)), [0, 0, 600, 600, 600]
+        )
+        self.assertIn('for 0 students', self.run_command('update_balance'))
+
+        self.run_command('update_due_dates')
+        self.assertEqual(Student.objects.filter(due_date__isnull=False).count(), 3)
+        self.assertIn('for 0 students', self.run_command('update_due_dates'))
+
+        self.run_command('transfer_due_dates')
+        self.assertFalse(Student.objects.filter(due_date__isnull=False).exists())
+        self.assertEqual(Student.objects.filter(second_installment_due_date__isnull=False).count(), 3)
+
+        self.run_command('migrate_student_invoices')
+        self.assertEqual(
+            sorted(StudentInvoice.objects.values_list('present_invoice_no', 'pending_invoice_no')),
+            [(0, 101), (0, 103), (100, 0), (102, 0), (104, 0)],
+        )
+        self.assertIn('Created 0 invoice records', self.run_command('migrate_student_invoices'))
+
+    def test_invoice_records_created_meanwhile_are_not_counted(self):
+        bulk_create = StudentInvoice.objects.bulk_create
+
+        def after_invoice_view(invoices, **kwargs):
+            # An invoice view creates the first student's record while the command runs
+            StudentInvoice.objects.get_or_create(student_id=invoices[0].student_id)
+            return bulk_create(invoices, **kwargs)
+
+        with mock.patch.object(StudentInvoice.objects, 'bulk_create', after_invoice_view):
+            out = self.run_command('migrate_student_invoices')
+        self.assertIn('Created 2 invoice records, skipped 3 existing records', out)
+        self.assertEqual(StudentInvoice.objects.count(), 5)
+
+
+class DataExportTests(TestCase):
+    """export_data / load_data round-trip every exported table."""
+
+    def test_round_trip(self):
+        user = User.objects.create_user(username='export_csr', password='x')
+        csr = CSRProfile.objects.create(user=user, full_name='Export CSR')
+        batch = Batch.objects.create(batch_number='EX-1', created_by=csr)
+        course = Course.objects.create(name='Python', trainer_name='T', price='1234.50', duration='weekend')
+        student = Student.objects.create(
+            name='Export Student', phone_number='03000000000', batch=batch, discount='12.50',
+            total_fees=1000, advance_payment=400, second_installment=600, created_by=csr,
+        )
+        student.courses.add(course)
+        InvoiceSnapshot.store(student, 'present', '<p>invoice</p>', invoice_number='1001', amount=400)
+        from django.contrib.admin.models import ADDITION, LogEntry
+        from django.contrib.auth.models import Group
+
+        user.groups.add(Group.objects.create(name='CSRs'))
+        LogEntry.objects.log_action(user.pk, None, student.pk, 'Export Student', ADDITION)
+
+        directory = tempfile.mkdtemp()
+        out = io.StringIO()
+        call_command('export_data', output=directory, workers=1, stdout=out)
+        manifest = json.load(open(os.path.join(directory, 'manifest.json')))
+        self.assertLess(manifest['models'].index('pos.batch'), manifest['models'].index('pos.student'))
+        self.assertEqual(manifest['counts']['pos.student_courses'], 1)
+
+        call_command('load_data', directory, replace=True, stdout=out)
+        loaded = Student.objects.get(pk=student.pk)
+        self.assertEqual(loaded.discount, Decimal('12.50'))
+        self.assertEqual(loaded.created_at, student.created_at)
+        self.assertEqual(list(loaded.courses.values_list('price', flat=True)), [Decimal('1234.50')])
+        self.assertEqual(InvoiceSnapshot.objects.get().get_html(), '<p>invoice</p>')
+        self.assertEqual(User.objects.get().username, 'export_csr')
+        self.assertEqual(list(User.objects.get().groups.values_list('name', flat=True)), ['CSRs'])
+        self.assertEqual(LogEntry.objects.get().user_id, user.pk)
+
+    def test_replace_refused_while_unexported_rows_reference_it(self):
+        from django.contrib.admin.models import ADDITION, LogEntry
+        from django.core.management.base import CommandError
+
+        user = User.objects.create_user(username='export_admin', password='x')
+        LogEntry.objects.log_action(user.pk, None, '1', 'Something', ADDITION)
+        directory = tempfile.mkdtemp()
+        call_command('export_data', 'auth.user', 'pos', output=directory, workers=1, stdout=io.StringIO())
+
+        with self.assertRaisesMessage(CommandError, 'admin.logentry.user'):
+            call_command('load_data', directory, replace=True, stdout=io.StringIO())
+        self.assertTrue(User.objects.filter(username='export_admin').exists())
+
+
+class CourseScheduleTests(TestCase):
+    """Schedule columns derived from Course.duration."""
+
+    def test_save_derives_schedule_fields(self):
+        course = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend, 1_month')
+        self.assertEqual(
+            (course.is_weekend, course.is_weekdays, course.is_one_month, course.lectures_required, course.slot_minutes),
+            (True, False, True, 12, 60),
+        )
+        course.duration = 'weekdays'
+        course.save(update_fields=['duration'])
+        course.refresh_from_db()
+        self.assertEqual(
+            (course.is_weekend, course.is_weekdays, course.is_one_month, course.lectures_required, course.slot_minutes),
+            (False, True, False, 24, 90),
+        )
+        self.assertQuerysetEqual(Course.objects.filter(is_one_month=True), [])
+
+    def test_migration_backfills_existing_rows(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        course = Course.objects.create(name='Design', trainer_name='T', price=1000, duration='1_month')
+        Course.objects.filter(pk=course.pk).update(is_one_month=False, lectures_required=24, slot_minutes=90)
+        migration = import_module('pos.migrations.0022_course_schedule_fields')
+        migration.derive_schedule_fields(apps, None)
+        course.refresh_from_db()
+        self.assertEqual((course.is_one_month, course.lectures_required, course.slot_minutes), (True, 12, 60))
+
+
+class StudentCourseNamesTests(TestCase):
+    """Student.course_names/course_count follow enrolment changes and course renames."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='names_csr', password='x')
+        csr = CSRProfile.objects.create(user=user, full_name='Names CSR')
+        batch = Batch.objects.create(batch_number='CN-1', created_by=csr)
+        self.python = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        self.excel = Course.objects.create(name='Excel', trainer_name='T', price=1000, duration='weekend')
+        self.student = Student.objects.create(name='S', phone_number='03000000000', batch=batch, total_fees=0)
+
+    def cached(self):
+        return Student.objects.values_list('course_names', 'course_count').get(pk=self.student.pk)
+
+    def test_follows_enrolment_changes(self):
+        self.student.courses.add(self.python, self.excel)
+        self.assertEqual(self.cached(), (['Python', 'Excel'], 2))
+        # The in-memory instance is kept in step: saving it does not write stale names back
+        self.student.save()
+        self.assertEqual(self.cached(), (['Python', 'Excel'], 2))
+
+        self.python.students.remove(self.student)
+        self.assertEqual(self.cached(), (['Excel'], 1))
+        self.excel.students.clear()
+        self.assertEqual(self.cached(), ([], 0))
+
+    def test_follows_course_rename_and_delete(self):
+        self.student.courses.set([self.python, self.excel])
+        course = Course.objects.get(pk=self.python.pk)
+        course.name = 'Python Basics'
+        course.save()
+        self.assertEqual(self.cached(), (['Python Basics', 'Excel'], 2))
+
+        Course.objects.get(pk=self.excel.pk).delete()
+        self.assertEqual(self.cached(), (['Python Basics'], 1))
+
+    def test_listing_reads_the_cache(self):
+        self.student.courses.add(self.python)
+        Student.objects.filter(pk=self.student.pk).update(course_names=['Cached Name'])
+        self.client.force_login(User.objects.create_superuser('names_admin', password='x'))
+        response = self.client.get(reverse('report_students_ajax'))
+        self.assertEqual(response.json()['students'][0]['courses'], ['Cached Name'])
+
+
+class CreatorNameTests(TestCase):
+    """get_creator_name() is read-only; created_by_name is never left empty."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='creator_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Creator CSR')
+        self.batch = Batch.objects.create(batch_number='CR-1', created_by=self.csr)
+
+    def student(self, **fields):
+        return Student(name='S', phone_number='03000000000', batch=self.batch, total_fees=0, **fields)
+
+    def test_database_fills_empty_names(self):
+        Student.objects.bulk_create([self.student(created_by=self.csr), self.student()])
+        self.assertEqual(
+            sorted(Student.objects.values_list('created_by_name', flat=True)), ['Creator CSR', 'Unknown']
+        )
+        Student.objects.update(created_by_name='')
+        self.assertFalse(Student.objects.filter(created_by_name='').exists())
+
+    def test_accessor_is_read_only(self):
+        Student.objects.bulk_create([self.student(created_by=self.csr, created_by_name='Stored Name')])
+        student = Student.objects.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(student.get_creator_name(), 'Stored Name')
+        student = Student.objects.select_related('created_by').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(student.get_creator_name(), 'Creator CSR')
+
+    def test_backfill_command(self):
+        from importlib import import_module
+
+        migration = import_module('pos.migrations.0024_student_creator_name_trigger')
+        # Rows written before the trigger existed
+        migration.run_for_vendor({'sqlite': migration.SQLITE_REMOVE})(None, connection.schema_editor())
+        try:
+            Student.objects.bulk_create([self.student(created_by=self.csr), self.student()])
+            self.assertEqual(Student.objects.filter(created_by_name='').count(), 2)
+        finally:
+            migration.run_for_vendor({'sqlite': migration.SQLITE_INSTALL})(None, connection.schema_editor())
+
+        call_command('backfill_creator_names', stdout=io.StringIO())
+        self.assertEqual(
+            sorted(Student.objects.values_list('created_by_name', flat=True)), ['Creator CSR', 'Unknown']
+        )
+
+
+class WithStatsTests(TestCase):
+    """with_stats() annotations match the per-object counts they replace."""
+
+    def setUp(self):
+        from portal.models import Trainer, TrainerCourse
+
+        self.csr = CSRProfile.objects.create(user=User.objects.create_user('stats_csr', password='x'), full_name='Stats CSR')
+        self.batch = Batch.objects.create(batch_number='ST-1', created_by=self.csr)
+        Batch.objects.create(batch_number='ST-2')
+        python = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        excel = Course.objects.create(name='Excel', trainer_name='T', price=1000, duration='weekend')
+        for i, paid in enumerate([True, False, False]):
+            student = Student.objects.create(
+                name=f'S{i}', phone_number='03000000000', batch=self.batch, total_fees=1000,
+                discounted_price=1000, advance_payment=1000 if paid else 400,
+                second_installment=0 if paid else 600, payment_status='paid' if paid else 'pending', created_by=self.csr,
+            )
+            student.courses.set([python, excel] if i else [python])
+            # Numbered by a single or a batch print; pending invoices for the unpaid ones but one
+            StudentInvoice.objects.create(student=student, present_invoice_no=100 + i, pending_invoice_no=200 + i if i == 1 else 0)
+        self.trainer = Trainer.objects.create(user=User.objects.create_user('stats_trainer', password='x'), name='Trainer')
+        TrainerCourse.objects.create(trainer=self.trainer, course=python)
+        TrainerCourse.objects.create(trainer=self.trainer, course=excel, batch=self.batch)
+
+    def test_annotations_match_properties(self):
+        from portal.models import Trainer
+
+        with self.assertNumQueries(1):
+            batches = {batch.batch_number: batch for batch in Batch.objects.with_stats()}
+            self.assertEqual((batches['ST-1'].student_count, batches['ST-2'].student_count), (3, 0))
+            self.assertEqual((batches['ST-1'].received_payment, batches['ST-1'].pending_payment), (1800, 1200))
+        self.assertEqual(Batch.objects.get(batch_number='ST-1').student_count, 3)
+
+        with self.assertNumQueries(1):
+            csr = CSRProfile.objects.with_stats().get()
+            self.assertEqual((csr.student_count, csr.num_paid_students, csr.invoice_count), (3, 1, 4))
+        csr = CSRProfile.objects.get()
+        self.assertEqual((csr.student_count, csr.invoice_count), (3, 4))
+
+        with self.assertNumQueries(1):
+            trainer = Trainer.objects.with_stats().get()
+            # Python has 3 students and Excel 2: counted per assignment
+            self.assertEqual((trainer.assigned_courses_count, trainer.total_students), (2, 5))
+        trainer = Trainer.objects.get()
+        self.assertEqual((trainer.assigned_courses_count, trainer.total_students), (2, 5))
+
+
+class JobQueueTests(TestCase):
+    """Jobs are claimed by priority, retried with backoff and their results stored."""
+
+    def setUp(self):
+        from . import jobs
+
+        self.jobs = jobs
+        self.calls = []
+
+        @jobs.task('tests.flaky')
+        def flaky(fail=True):
+            self.calls.append(fail)
+            if fail:
+                raise ValueError('boom')
+            return {'ok': True}
+        self.addCleanup(jobs.TASKS.pop, 'tests.flaky')
+
+    def test_claims_due_jobs_by_priority(self):
+        low = self.jobs.enqueue('tests.flaky', fail=False)
+        high = self.jobs.enqueue('tests.flaky', priority=5, fail=False)
+        self.jobs.enqueue('tests.flaky', priority=9, run_at=timezone.now() + timezone.timedelta(hours=1))
+
+        claimed = self.jobs.claim('w1', limit=5)
+        self.assertEqual([job.pk for job in claimed], [high.pk, low.pk])
+        self.assertEqual([(job.status, job.attempts, job.locked_by) for job in claimed], [('running', 1, 'w1')] * 2)
+        self.assertEqual(self.jobs.claim('w2', limit=5), [])
+
+        self.assertEqual(self.jobs.run(claimed[0]), 'done')
+        self.assertEqual(Job.objects.get(pk=high.pk).result, {'ok': True})
+
+    def test_retries_with_backoff_then_fails(self):
+        job = self.jobs.enqueue('tests.flaky', max_attempts=2)
+        self.assertEqual(self.jobs.run(self.jobs.claim('w1')[0]), 'queued')
+        job.refresh_from_db()
+        self.assertIn('ValueError: boom', job.error)
+        self.assertGreater(job.run_at, timezone.now() + timezone.timedelta(seconds=25))
+        self.assertEqual(self.jobs.claim('w1'), [])
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(self.jobs.run(self.jobs.claim('w1')[0]), 'failed')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_releases_jobs_of_stopped_workers(self):
+        job = self.jobs.enqueue('tests.flaky')
+        self.jobs.claim('w1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timezone.timedelta(hours=2))
+        self.assertEqual(self.jobs.release_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'queued')
+
+    def test_background_import(self):
+        user = User.objects.create_user(username='job_csr', password='x')
+        csr = CSRProfile.objects.create(user=user, full_name='Job CSR')
+        Batch.objects.create(batch_number='JB-1', created_by=csr)
+        Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        self.client.force_login(user)
+        roster = SimpleUploadedFile(
+            'roster.csv', StudentImportTests.HEADER.encode() + b'Queued,G,03001234567,35202-1234567-1,Python,JB-1,0,0\n'
+        )
+        response = self.client.post(reverse('student_import'), {'file': roster, 'background': '1'})
+        job = response.context['job']
+        self.assertFalse(Student.objects.exists())
+
+        from . import tasks  # registers the pos tasks, as run_worker does
+        self.assertEqual(self.jobs.run(self.jobs.claim('w1')[0]), 'done')
+        self.assertEqual(Student.objects.get().name, 'Queued')
+        status = self.client.get(reverse('job_status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['result']['created']), ('done', 1))
+
+    def test_failed_import_is_not_retried(self):
+        import functools
+
+        from . import tasks
+        from .importer import StudentImporter, import_students
+
+        user = User.objects.create_user(username='job_csr', password='x')
+        csr = CSRProfile.objects.create(user=user, full_name='Job CSR')
+        Batch.objects.create(batch_number='JB-1', created_by=csr)
+        Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        self.client.force_login(user)
+        content = StudentImportTests.HEADER.encode() + (
+            b'First,G,03001234567,35202-1234567-1,Python,JB-1,0,0\n'
+            b'Second,G,03001234568,35202-1234567-2,Python,JB-1,0,0\n'
+        )
+
+        def upload():
+            response = self.client.post(reverse('student_import'), {
+                'file': SimpleUploadedFile('roster.csv', content), 'background': '1',
+            })
+            return response.context['job']
+
+        write = StudentImporter.write
+
+        def fail_second_chunk(importer, chunk):
+            if Student.objects.exists():
+                raise RuntimeError('connection lost')
+            return write(importer, chunk)
+
+        job = upload()
+        self.assertEqual(job.max_attempts, 1)
+        with mock.patch.object(tasks, 'import_students', functools.partial(import_students, chunk_size=1)), \
+                mock.patch.object(StudentImporter, 'write', fail_second_chunk):
+            self.assertEqual(self.jobs.run(self.jobs.claim('w1')[0]), 'failed')
+        self.assertEqual(list(Student.objects.values_list('name', flat=True)), ['First'])
+
+        # A worker that stopped mid-import does not hand the job to another one
+        stopped = upload()
+        self.jobs.claim('w1')
+        Job.objects.filter(pk=stopped.pk).update(locked_at=timezone.now() - timezone.timedelta(hours=2))
+        self.assertEqual(self.jobs.release_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=stopped.pk).status, 'failed')
+
+        # Uploading the file again imports the rest without duplicating the committed chunk
+        retry = upload()
+        self.assertEqual(self.jobs.run(self.jobs.claim('w1')[0]), 'done')
+        result = Job.objects.get(pk=retry.pk).result
+        self.assertEqual((result['created'], result['skipped']), (1, 1))
+        self.assertEqual(sorted(Student.objects.values_list('name', flat=True)), ['First', 'Second'])
+
+
+class RunWorkerTests(TransactionTestCase):
+    """run_worker --burst runs the queued jobs on its pool and exits."""
+
+    def test_burst(self):
+        from . import jobs
+
+        done = [jobs.enqueue('pos.refresh_course_cache') for _ in range(3)]
+        out = io.StringIO()
+        # Threads sharing in-memory SQLite fail on table locks instead of waiting for them
+        concurrency = 1 if connection.vendor == 'sqlite' and connection.is_in_memory_db() else 2
+        call_command('run_worker', concurrency=concurrency, burst=True, poll_interval=0.01, stdout=out)
+        self.assertEqual(set(Job.objects.filter(pk__in=[job.pk for job in done]).values_list('status', flat=True)), {'done'})
+        self.assertIn('pos.refresh_course_cache: done', out.getvalue())
+
+
+class SchedulerTests(TestCase):
+    """Periodic tasks run from the registry, on schedule, by the lease holder only."""
+
+    def setUp(self):
+        from . import jobs, scheduler
+
+        self.scheduler = scheduler
+
+        @scheduler.periodic(every=timezone.timedelta(hours=1))
+        @jobs.task('tests.hourly')
+        def hourly():
+            return {'ran': True}
+
+        @scheduler.periodic(cron='0 4 * * *')
+        @jobs.task('tests.broken')
+        def broken():
+            raise RuntimeError('nope')
+
+        for name in ('tests.hourly', 'tests.broken'):
+            self.addCleanup(jobs.TASKS.pop, name)
+            self.addCleanup(scheduler.SCHEDULES.pop, name)
+
+    def at(self, *args):
+        return timezone.make_aware(timezone.datetime(*args))
+
+    def test_cron_next_after(self):
+        Cron = self.scheduler.Cron
+        # 2026-10-21 is a Wednesday
+        self.assertEqual(Cron('1 0 * * 1').next_after(self.at(2026, 10, 21, 12, 0)), self.at(2026, 10, 26, 0, 1))
+        self.assertEqual(Cron('*/15 * * * *').next_after(self.at(2026, 10, 21, 10, 7, 30)), self.at(2026, 10, 21, 10, 15))
+        self.assertEqual(Cron('0 0 1 1 *').next_after(self.at(2026, 10, 21)), self.at(2027, 1, 1))
+        # Day of month and day of week both restricted: either matches (Friday the 2nd here)
+        self.assertEqual(Cron('0 9 1 * 5').next_after(self.at(2026, 10, 1, 10, 0)), self.at(2026, 10, 2, 9, 0))
+        for invalid in ('* * * *', '60 * * * *', '0 0 31 2 *'):
+            with self.assertRaises(ValueError):
+                Cron(invalid).next_after(self.at(2026, 10, 21))
+
+    def test_lease(self):
+        ttl = timezone.timedelta(minutes=5)
+        self.assertTrue(self.scheduler.acquire_lease('a', ttl))
+        self.assertFalse(self.scheduler.acquire_lease('b', ttl))
+        self.assertTrue(self.scheduler.acquire_lease('a', ttl))
+        self.scheduler.release_lease('a')
+        self.assertTrue(self.scheduler.acquire_lease('b', ttl))
+
+    def test_run_scheduler_once(self):
+        from .models import PeriodicTask
+
+        call_command('run_scheduler', once=True, stdout=io.StringIO())
+        self.assertIn('portal.create_feedback_stubs', self.scheduler.SCHEDULES)
+        # Nothing was due yet: new tasks first run one interval (or cron match) from now
+        self.assertFalse(PeriodicTask.objects.exclude(last_status='').exists())
+
+        PeriodicTask.objects.filter(name__in=['tests.hourly', 'tests.broken']).update(next_run_at=timezone.now())
+        out = io.StringIO()
+        call_command('run_scheduler', once=True, stdout=out)
+        hourly, broken = PeriodicTask.objects.get(name='tests.hourly'), PeriodicTask.objects.get(name='tests.broken')
+        self.assertEqual((hourly.last_status, hourly.last_result, hourly.run_count), ('ok', {'ran': True}, 1))
+        self.assertGreater(hourly.next_run_at, timezone.now() + timezone.timedelta(minutes=59))
+        self.assertEqual(broken.last_status, 'error')
+        self.assertIn('RuntimeError: nope', broken.last_error)
+        self.assertEqual(broken.next_run_at.hour, 4)
+        self.assertIn('tests.hourly: ok', out.getvalue())
+
+        # Paused, or another scheduler holding the lease: nothing runs
+        PeriodicTask.objects.filter(name='tests.hourly').update(next_run_at=timezone.now(), enabled=False)
+        PeriodicTask.objects.filter(name='tests.broken').update(next_run_at=timezone.now())
+        self.scheduler.acquire_lease('elsewhere', timezone.timedelta(minutes=5))
+        call_command('run_scheduler', once=True, stdout=io.StringIO())
+        self.assertEqual(PeriodicTask.objects.get(name='tests.broken').run_count, 1)
+        self.scheduler.release_lease('elsewhere')
+        call_command('run_scheduler', once=True, stdout=io.StringIO())
+        self.assertEqual(PeriodicTask.objects.get(name='tests.broken').run_count, 2)
+        self.assertEqual(PeriodicTask.objects.get(name='tests.hourly').run_count, 1)
+
+
+class AgingReportTests(TestCase):
+    """The aging report buckets pending balances by days overdue; drill-down pages by keyset."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('aging_admin', password='x')
+        self.csr = CSRProfile.objects.create(user=User.objects.create_user('aging_csr', password='x'), full_name='Aging CSR')
+        self.batch = Batch.objects.create(batch_number='AG-1', created_by=self.csr)
+        other = Batch.objects.create(batch_number='AG-2')
+        python = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        today = timezone.localdate()
+        # (days overdue or None for no due date, batch, status)
+        for i, (overdue, batch, status) in enumerate([
+            (0, self.batch, 'pending'), (None, self.batch, 'pending'), (1, self.batch, 'pending'),
+            (30, self.batch, 'pending'), (31, other, 'pending'), (91, other, 'pending'), (200, self.batch, 'paid'),
+        ]):
+            student = Student.objects.create(
+                name=f'A{i}', phone_number='03000000000', batch=batch, total_fees=1000, discounted_price=1000,
+                advance_payment=400, second_installment=600, payment_status=status, created_by=self.csr,
+                second_installment_due_date=None if overdue is None else today - timezone.timedelta(days=overdue),
+            )
+            student.courses.set([python])
+        self.client.force_login(self.user)
+
+    def test_buckets_by_batch(self):
+        response = self.client.get(reverse('report_aging'))
+        totals = response.context['totals']
+        self.assertEqual(
+            [(cell['key'], cell['students'], cell['amount']) for cell in totals['buckets']],
+            [('current', 2, 1200), ('1-30', 2, 1200), ('31-60', 1, 600), ('61-90', 0, 0), ('90+', 1, 600)],
+        )
+        rows = {row['label']: row for row in response.context['rows']}
+        self.assertEqual((rows['AG-1']['students'], rows['AG-2']['amount']), (4, 1200))
+
+        csr_rows = self.client.get(reverse('report_aging'), {'group': 'csr'}).context['rows']
+        self.assertEqual([(row['label'], row['students']) for row in csr_rows], [('Aging CSR', 6)])
+
+    def test_drill_down_pages_and_csv(self):
+        from . import reports
+
+        url = reverse('report_aging_students')
+        names, query = [], {'group': 'batch', 'key': self.batch.id}
+        with mock.patch.object(reports, 'AGING_PAGE_SIZE', 2):
+            while True:
+                response = self.client.get(url, query)
+                names += [student['name'] for student in response.context['students']]
+                if not response.context['next_query']:
+                    break
+                query = QueryDict(response.context['next_query'])
+        # Oldest due date first, no due date last
+        self.assertEqual(names, ['A3', 'A2', 'A0', 'A1'])
+
+        bucket = self.client.get(url, {'bucket': '1-30'}).context['students']
+        self.assertEqual([(student['name'], student['days_overdue']) for student in bucket], [('A3', 30), ('A2', 1)])
+
+        response = self.client.get(url, {'bucket': '90+', 'export': 'csv'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[1][0::6], ['A5', '91'])
+        self.assertEqual(len(rows), 2)
+
+    def test_malformed_key(self):
+        response = self.client.get(reverse('report_aging_students'), {'group': 'batch', 'key': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_csr_sees_own_students(self):
+        CSRProfile.objects.create(user=User.objects.create_user('other_csr', password='x'), full_name='Other CSR')
+        self.client.force_login(User.objects.get(username='other_csr'))
+        self.assertEqual(self.client.get(reverse('report_aging')).context['rows'], [])
+        self.assertEqual(self.client.get(reverse('report_aging_students')).context['students'], [])
+
+
+class RevenueComparisonTests(TestCase):
+    """Revenue comparison periods come from the same grouped query as the main period."""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('revenue_admin', password='x')
+        python = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        excel = Course.objects.create(name='Excel', trainer_name='T', price=1000, duration='weekend')
+        batch = Batch.objects.create(batch_number='RV-1')
+        at = lambda *args: timezone.make_aware(timezone.datetime(*args))
+        # (registered, second installment paid on, courses)
+        for i, (created, paid, courses) in enumerate([
+            (at(2026, 3, 5), None, [python]),
+            (at(2026, 3, 20), timezone.datetime(2026, 3, 25).date(), [python, excel]),
+            (at(2026, 1, 10), timezone.datetime(2026, 2, 15).date(), [excel]),
+            (at(2025, 3, 10), None, [python]),
+        ]):
+            student = Student.objects.create(
+                name=f'R{i}', phone_number='03000000000', batch=batch, total_fees=1000, discounted_price=1000,
+                advance_payment=400, second_installment=600, created_at=created, due_date=paid,
+            )
+            student.courses.set(courses)
+            Payment.objects.record_advances([student])
+            if paid:
+                Payment.objects.record_installments([student.id], paid_at=timezone.make_aware(timezone.datetime(paid.year, paid.month, paid.day, 12)))
+        self.client.force_login(self.user)
+
+    def test_comparison_periods(self):
+        from .reports import comparison_period
+
+        march = (timezone.datetime(2026, 3, 1).date(), timezone.datetime(2026, 3, 31).date())
+        self.assertEqual([day.isoformat() for day in comparison_period('previous', *march)], ['2026-01-29', '2026-02-28'])
+        leap_day = timezone.datetime(2024, 2, 29).date()
+        self.assertEqual(comparison_period('last_year', leap_day, leap_day)[0].isoformat(), '2023-02-28')
+
+    def test_deltas_in_two_queries_per_grouping(self):
+        from .reports import calculate_date_range_revenue
+
+        # Per grouping, the students' metrics and the payment ledger's sums
+        with self.assertNumQueries(4):
+            batches, courses = calculate_date_range_revenue(
+                Student.objects.all(), '2026-03-01', '2026-03-31', ['previous', 'last_year'],
+            )
+        batch = batches[0]
+        # March: two advances and one second installment; previous period: one second installment
+        self.assertEqual((batch['received_payment'], batch['student_count']), (1400.0, 2))
+        previous = batch['comparison']['previous']
+        self.assertEqual((previous['received_payment'], previous['received_payment_delta'], previous['received_payment_pct']), (600.0, 800.0, 133.3))
+        last_year = batch['comparison']['last_year']
+        self.assertEqual((last_year['received_payment'], last_year['student_count_delta']), (400.0, 1))
+        # Excel had nothing in March but is kept for its previous period
+        excel = {row['courses__name']: row for row in courses}['Excel']
+        self.assertEqual((excel['received_payment'], excel['comparison']['previous']['received_payment_pct']), (1000.0, 66.7))
+
+        plain, _ = calculate_date_range_revenue(Student.objects.all(), '2026-03-01', '2026-03-31')
+        self.assertEqual(plain, [{key: value for key, value in batch.items() if key != 'comparison'}])
+
+    def test_ajax_comparison_fields(self):
+        data = self.client.get(reverse('report_revenue_ajax'), {
+            'start_date': '2026-03-01', 'end_date': '2026-03-31', 'compare': 'previous',
+        }).json()
+        self.assertEqual(data['comparison_periods']['previous'], {'label': 'Previous period', 'start': '2026-01-29', 'end': '2026-02-28'})
+        self.assertEqual(data['batch_revenue'][0]['comparison']['previous']['received_payment_delta'], 800.0)
+        self.assertEqual(data['batch_comparison_totals']['previous']['received_payment'], 600.0)
+        # Without a bounded range there is nothing to compare
+        data = self.client.get(reverse('report_revenue_ajax'), {'start_date': '2026-03-01', 'compare': 'previous'}).json()
+        self.assertEqual(data['comparison_periods'], {})
+        self.assertNotIn('comparison', data['batch_revenue'][0])
+
+        response = self.client.get(reverse('report_revenue'), {
+            'start_date': '2026-03-01', 'end_date': '2026-03-31', 'compare': 'last_year',
+        })
+        self.assertContains(response, 'Received vs <span class="compare-label">Same period last year</span>')
+
+
+class ReportSnapshotTests(TestCase):
+    """The in-memory snapshot answers the revenue report like the queries do, and follows writes."""
+
+    def setUp(self):
+        from . import analytics
+
+        self.admin = User.objects.create_superuser('snapshot_admin', password='x')
+        self.csr = CSRProfile.objects.create(user=User.objects.create_user('snapshot_csr', password='x'), full_name='Snapshot CSR')
+        self.python = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        self.excel = Course.objects.create(name='Excel', trainer_name='T', price=1000, duration='weekend')
+        self.batches = [Batch.objects.create(batch_number=f'SN-{i}') for i in range(2)]
+        at = lambda *args: timezone.make_aware(timezone.datetime(*args))
+        self.students = []
+        for i, (created, paid, courses, creator) in enumerate([
+            (at(2026, 3, 5), None, [self.python], self.csr),
+            (at(2026, 3, 20), timezone.datetime(2026, 3, 25).date(), [self.python, self.excel], None),
+            (at(2026, 1, 10), timezone.datetime(2026, 2, 15).date(), [self.excel], self.csr),
+            (at(2025, 3, 10), None, [self.python], None),
+            (at(2026, 3, 12), None, [], self.csr),
+        ]):
+            student = Student.objects.create(
+                name=f'S{i}', phone_number='03000000000', batch=self.batches[i % 2], total_fees=1000,
+                discounted_price=1000 + i, advance_payment=400 + i, second_installment=600, created_at=created,
+                due_date=paid, created_by=creator,
+            )
+            student.courses.set(courses)
+            Payment.objects.record_advances([student])
+            if paid:
+                Payment.objects.record_installments([student.id], paid_at=timezone.make_aware(timezone.datetime(paid.year, paid.month, paid.day)))
+            self.students.append(student)
+        self.backends = [analytics._ArrayOps] + ([analytics._NumpyOps] if analytics.numpy else [])
+        patcher = mock.patch.object(analytics, '_snapshot', analytics.Snapshot(self.backends[-1]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertMatchesQueries(self, user, batch_id='', course_id='', start=None, end=None, compare=('previous', 'last_year')):
+        from .reports import _revenue_scope, calculate_date_range_revenue, snapshot_revenue
+
+        students, _ = _revenue_scope(user, batch_id, course_id)
+        expected = calculate_date_range_revenue(students, start, end, compare)
+        self.assertEqual(snapshot_revenue(user, batch_id, course_id, start, end, compare), expected)
+        return expected
+
+    def test_matches_queries(self):
+        from . import analytics
+
+        march = (timezone.datetime(2026, 3, 1).date(), timezone.datetime(2026, 3, 31).date())
+        csr_user = self.csr.user
+        for ops in self.backends:
+            with self.subTest(ops=ops.__name__), mock.patch.object(analytics, '_snapshot', analytics.Snapshot(ops)):
+                self.assertMatchesQueries(self.admin)
+                self.assertMatchesQueries(self.admin, start=march[0], end=march[1])
+                self.assertMatchesQueries(self.admin, start=march[0])
+                self.assertMatchesQueries(self.admin, end=march[1])
+                self.assertMatchesQueries(self.admin, str(self.batches[0].id), start=march[0], end=march[1])
+                self.assertMatchesQueries(self.admin, course_id=str(self.excel.id), start=march[0], end=march[1])
+                self.assertMatchesQueries(csr_user, start=march[0], end=march[1])
+                self.assertMatchesQueries(User.objects.create_user(f'nobody-{ops.__name__}'))
+
+    def test_follows_writes(self):
+        march = (timezone.datetime(2026, 3, 1).date(), timezone.datetime(2026, 3, 31).date())
+        self.assertMatchesQueries(self.admin, start=march[0], end=march[1])
+
+        student = self.students[0]
+        student.due_date = timezone.datetime(2026, 3, 28).date()
+        student.save()
+        self.assertMatchesQueries(self.admin, start=march[0], end=march[1])
+        Student.objects.mark_paid([self.students[1].id])
+        Student.objects.mark_paid([self.students[4].id], paid_at=timezone.make_aware(timezone.datetime(2026, 3, 30)))
+        self.assertMatchesQueries(self.admin, start=march[0], end=march[1])
+        Student.objects.mark_pending([self.students[4].id])
+        self.students[3].courses.add(self.excel)
+        self.python.students.remove(self.students[1])
+        self.assertMatchesQueries(self.admin)
+        self.students[2].delete()
+        batches, _ = self.assertMatchesQueries(self.admin)
+        self.assertEqual(sum(row['student_count'] for row in batches), 4)
+
+    def test_refresh_reads_only_changes(self):
+        from . import analytics
+
+        analytics.get_frame()
+        # Unchanged data within the refresh interval: no queries at all
+        with self.assertNumQueries(0):
+            analytics.get_frame()
+        self.students[0].save()
+        # The changed ids, their rows, their courses, the new payments and the two row counts
+        with self.assertNumQueries(6):
+            frame = analytics.get_frame()
+        self.assertEqual(frame.size, 5)
+
+    def test_ajax_uses_snapshot(self):
+        self.client.force_login(self.admin)
+        params = {'start_date': '2026-03-01', 'end_date': '2026-03-31', 'compare': 'previous'}
+        expected = self.client.get(reverse('report_revenue_ajax'), params).json()
+        with self.settings(REPORT_SNAPSHOT=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('report_revenue_ajax'), params)
+        self.assertEqual(response.json(), expected)
+        self.assertFalse([query for query in queries.captured_queries if 'GROUP BY' in query['sql']])
+
+
+class PaymentLedgerTests(TestCase):
+    """Payments are recorded where they are taken, once each, and the reports sum them by paid_at."""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ledger_csr', password='x')
+        self.csr = CSRProfile.objects.create(user=user, full_name='Ledger CSR')
+        InvoiceSettings.objects.create(csr=self.csr, current_serial_number=700)
+        self.batch = Batch.objects.create(batch_number='LG-1', created_by=self.csr)
+        self.course = Course.objects.create(name='Python', trainer_name='T', price=1000, duration='weekend')
+        self.client.force_login(user)
+
+    def enroll(self, name, advance):
+        self.client.post(reverse('student_management'), {
+            'name': name, 'guardian_name': 'G', 'phone_number': '03000000000', 'cnic': '35202-1234567-1',
+            'batch': self.batch.id, 'courses': [self.course.id], 'advance_payment': advance,
+        })
+        return Student.objects.get(name=name)
+
+    def ledger(self, student):
+        return list(student.payments.order_by('id').values_list('kind', 'amount', 'csr'))
+
+    def test_enrollment_and_status_changes(self):
+        student = self.enroll('Ledger 1', 400)
+        self.assertEqual(self.ledger(student), [('advance', 400, self.csr.id)])
+        self.assertEqual(student.payments.get().paid_at, student.created_at)
+
+        url = reverse('update_payment_status', args=[student.id])
+        for status in ('paid', 'paid', 'pending', 'paid'):
+            self.client.post(url, json.dumps({'payment_status': status}), content_type='application/json')
+        # Repeating a status records nothing; back to pending reverses the installment
+        self.assertEqual(
+            [kind for kind, _, _ in self.ledger(student)], ['advance', 'installment', 'reversal', 'installment'],
+        )
+        self.assertEqual(sum(amount for _, amount, _ in self.ledger(student)), 1000)
+
+        # Paid in full at enrollment: only the advance
+        self.assertEqual(self.ledger(self.enroll('Ledger 2', 1000)), [('advance', 1000, self.csr.id)])
+
+    def test_status_changed_in_edit_form(self):
+        student = self.enroll('Ledger 6', 400)
+        url = reverse('edit_student', args=[student.id])
+        data = {
+            'name': student.name, 'guardian_name': 'G', 'phone_number': student.phone_number, 'cnic': student.cnic,
+            'batch': self.batch.id, 'courses': [self.course.id], 'discount': 0, 'advance_payment': 400,
+            'balance': 600, 'total_amount': 400, 'schedule': 'weekend',
+        }
+        for status in ('paid', 'paid', 'pending'):
+            response = self.client.post(url, {**data, 'payment_status': status})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            self.ledger(student),
+            [('advance', 400, self.csr.id), ('installment', 600, self.csr.id), ('reversal', -600, self.csr.id)],
+        )
+
+    def test_pending_invoice_then_collection_records_once(self):
+        student = self.enroll('Ledger 3', 400)
+        self.client.get(reverse('generate_pending_invoice', args=[student.id]))
+        self.client.get(reverse('generate_pending_invoice', args=[student.id]), {'regenerate': '1'})
+        response = self.client.post(reverse('collect_payments'), json.dumps({
+            'student_ids': [student.id], 'payment_date': '2026-01-15',
+        }), content_type='application/json')
+        self.assertEqual(response.json()['updated'], 1)
+        self.assertEqual(self.ledger(student), [('advance', 400, self.csr.id), ('installment', 600, self.csr.id)])
+
+        other = self.enroll('Ledger 4', 300)
+        self.client.post(reverse('collect_payments'), json.dumps({
+            'student_ids': [other.id], 'payment_method': 'bank', 'payment_date': '2026-01-15',
+        }), content_type='application/json')
+        installment = other.payments.get(kind='installment')
+        self.assertEqual((installment.amount, installment.method), (700, 'bank'))
+        self.assertEqual(timezone.localtime(installment.paid_at).date().isoformat(), '2026-01-15')
+
+    def test_received_in_range(self):
+        from .reports import with_payments_in_range
+
+        student = self.enroll('Ledger 5', 400)
+        Student.objects.mark_paid([student.id], paid_at=timezone.make_aware(timezone.datetime(2026, 1, 15, 18)))
+        january = (timezone.datetime(2026, 1, 1).date(), timezone.datetime(2026, 1, 31).date())
+        received = Payment.objects.received_between(*january).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(received, 600)
+        annotated = with_payments_in_range(Student.objects.filter(pk=student.pk), *january).get()
+        self.assertEqual((annotated.advance_in_range, annotated.second_installment_in_range), (0, 600))
+
+        data = self.client.get(reverse('report_students_ajax'), {'start_date': '2026-01-01', 'end_date': '2026-01-31'}).json()
+        self.assertEqual((data['student_count'], data['total_payment_in_range']), (1, 600.0))
+
+    def test_backfill_from_student_fields(self):
+        import importlib
+        from django.apps import apps
+
+        backfill = importlib.import_module('pos.migrations.0028_payment').backfill_payments
+        created = timezone.make_aware(timezone.datetime(2026, 2, 1, 9))
+        Student.objects.create(
+            name='Old 1', phone_number='03000000000', batch=self.batch, total_fees=1000, discounted_price=1000,
+            advance_payment=400, second_installment=600, created_at=created,
+            due_date=timezone.datetime(2026, 3, 5).date(), created_by=self.csr,
+        )
+        Student.objects.create(
+            name='Old 2', phone_number='03000000000', batch=self.batch, total_fees=1000, discounted_price=1000,
+            advance_payment=0, second_installment=1000, created_at=created,
+        )
+        backfill(apps, None)
+        self.assertEqual(
+            sorted(Payment.objects.values_list('student__name', 'kind', 'amount', 'paid_at')),
+            [('Old 1', 'advance', 400, created),
+             ('Old 1', 'installment', 600, timezone.make_aware(timezone.datetime(2026, 3, 5)))],
+        )
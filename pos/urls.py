@@ -2,6 +2,18 @@ from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 
+
+def lazy_view(name):
+    """Route to pos.reports.<name>, importing that module on the first report request.
+    
+    Keeps the report machinery out of cold starts that only serve login or dashboards.
+    """
+    def view(request, *args, **kwargs):
+        from . import reports
+        return getattr(reports, name)(request, *args, **kwargs)
+    view.__name__ = view.__qualname__ = name
+    return view
+
 urlpatterns = [
     # Authentication URLs
     path('login/', views.login_view, name='login'),
@@ -10,8 +22,8 @@ urlpatterns = [
     
     # Admin Dashboard URLs
     path('dashboard/', views.admin_dashboard, name='admin_dashboard'),
-    path('dashboard/commission/', views.commission_report, name='commission_report'),
-    path('dashboard/commission/export/', views.export_commission_csv, name='export_commission_csv'),
+    path('dashboard/commission/', lazy_view('commission_report'), name='commission_report'),
+    path('dashboard/commission/export/', lazy_view('export_commission_csv'), name='export_commission_csv'),
     path('dashboard/csr/', views.csr_management, name='csr_management'),
     path('dashboard/courses/', views.course_management, name='course_management'),
     path('dashboard/batches/', views.admin_batch_management, name='admin_batch_management'),
@@ -19,27 +31,34 @@ urlpatterns = [
     path('dashboard/settings/', views.admin_settings, name='admin_settings'),
     
     # Report Generation URLs
-    path('reports/students/', views.report_students, name='report_students'),
-    path('reports/students/ajax/', views.report_students_ajax, name='report_students_ajax'),
-    path('reports/revenue/', views.report_revenue, name='report_revenue'),
-    path('reports/revenue/ajax/', views.report_revenue_ajax, name='report_revenue_ajax'),
+    path('reports/students/', lazy_view('report_students'), name='report_students'),
+    path('reports/students/ajax/', lazy_view('report_students_ajax'), name='report_students_ajax'),
+    path('reports/revenue/', lazy_view('report_revenue'), name='report_revenue'),
+    path('reports/revenue/ajax/', lazy_view('report_revenue_ajax'), name='report_revenue_ajax'),
+    path('reports/aging/', lazy_view('report_aging'), name='report_aging'),
+    path('reports/aging/students/', lazy_view('report_aging_students'), name='report_aging_students'),
     
     # API Endpoints
     path('api/batch-stats/', views.get_batch_stats, name='get_batch_stats'),
+    path('api/dashboard-widgets/<slug:widget>/', views.dashboard_widget, name='dashboard_widget'),
     
     # CSR Report URLs
-    path('csr/reports/students/', views.report_students, name='report_students_csr'),
-    path('csr/reports/revenue/', views.report_revenue, name='report_revenue_csr'),
+    path('csr/reports/students/', lazy_view('report_students'), name='report_students_csr'),
+    path('csr/reports/revenue/', lazy_view('report_revenue'), name='report_revenue_csr'),
     path('csr/courses/', views.csr_course_management, name='course_management_csr'),
     
     # CSR Dashboard URLs
     path('csr/dashboard/', views.csr_dashboard, name='csr_dashboard'),
     path('csr/batches/', views.csr_batch_management, name='csr_batch_management'),
     path('csr/batches/old/', views.batch_management, name='batch_management'),
+    path('csr/batches/<int:batch_id>/invoices/', views.batch_invoices, name='batch_invoices'),
     path('csr/students/', views.student_management, name='student_management'),
     path('csr/students/<int:student_id>/invoice/', views.generate_invoice, name='generate_invoice'),
     path('csr/students/<int:student_id>/edit/', views.edit_student, name='edit_student'),
     path('csr/students/<int:student_id>/delete/', views.delete_student, name='delete_student'),
+    path('csr/students/import/', views.student_import, name='student_import'),
+    path('csr/students/collect-payments/', views.collect_payments, name='collect_payments'),
+    path('csr/jobs/<int:job_id>/', views.job_status, name='job_status'),
     path('csr/students/<int:student_id>/update-payment-status/', views.update_payment_status, name='update_payment_status'),
     path('csr/students/<int:student_id>/pending-invoice/', views.generate_pending_invoice, name='generate_pending_invoice'),
     path('csr/settings/', views.invoice_settings, name='invoice_settings'),
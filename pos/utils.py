@@ -1,106 +1,157 @@
-from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
 from datetime import datetime
 from django.http import HttpResponse
+from django.urls import reverse
 from django.conf import settings
-from .models import InvoiceSettings, StudentInvoice
+from django.utils import timezone
+from django.db import transaction
+from django.db.models import Q
+from .cache import get_versions
+from .models import CSRProfile, InvoiceSettings, InvoiceSnapshot, StudentInvoice
+import gzip
 import os
-import pytz
+import threading
+from contextlib import nullcontext
+from copy import copy
 
 # Removed ReportLab table styles and flowables
 
 
-def get_invoice_context(student, is_pending=False):
+# Bank details printed when no invoice settings can be resolved
+DEFAULT_BANK_DETAILS = {
+    'school_name': "Devinci Dev",
+    'bank_name': "JS Bank",
+    'account_number': "0002587773",
+    'iban_number': "PK56JSBL9561000002587773",
+}
+
+_UNRESOLVED = object()
+
+
+class InvoiceSettingsResolver:
+    """
+    Resolves the InvoiceSettings used for a student's invoices, memoized per process.
+    
+    Fallback chain: the settings of the CSR who enrolled the student, then a
+    Lead CSR's settings. resolve() can additionally create settings for a
+    given CSR (or the first Lead CSR) when nothing exists yet.
+    
+    The memo is keyed by CSR id and dropped whenever the 'invoice_settings' or
+    'csrs' cache domain changes (see pos.signals), i.e. on any InvoiceSettings
+    or CSRProfile save. The returned instances are shared between requests and
+    threads: only read them. Their current_serial_number is advisory, as
+    reserve_serial_numbers() refreshes it on the instance it is called on;
+    serial numbers are only ever taken from the database row.
+    """
+    
+    DOMAINS = ('invoice_settings', 'csrs')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = None
+        self._by_csr = {}
+        self._lead = _UNRESOLVED
+    
+    def clear(self):
+        with self._lock:
+            self._by_csr = {}
+            self._lead = _UNRESOLVED
+    
+    def _check_versions(self):
+        versions = get_versions(self.DOMAINS)
+        if versions != self._versions:
+            self.clear()
+            self._versions = versions
+    
+    def resolve_many(self, csr_ids):
+        """Return {csr_id: settings or None} using one query for all CSRs not memoized yet"""
+        self._check_versions()
+        with self._lock:
+            # Work on this generation of the memo: a concurrent clear() swaps in a new one
+            by_csr, lead = self._by_csr, self._lead
+        csr_ids = set(csr_ids)
+        unknown = {csr_id for csr_id in csr_ids if csr_id and csr_id not in by_csr}
+        if unknown or lead is _UNRESOLVED:
+            query = Q(csr_id__in=unknown)
+            if lead is _UNRESOLVED:
+                # Fetch the Lead CSR fallback in the same query
+                query |= Q(csr__lead_role=True)
+            rows = list(InvoiceSettings.objects.filter(query).select_related('csr').order_by('pk'))
+            found = {settings.csr_id: settings for settings in rows}
+            for csr_id in unknown:
+                by_csr[csr_id] = found.get(csr_id)
+            if lead is _UNRESOLVED:
+                lead = next((settings for settings in rows if settings.csr.lead_role), None)
+                with self._lock:
+                    if self._by_csr is by_csr:
+                        self._lead = lead
+        return {csr_id: (by_csr.get(csr_id) if csr_id else None) or lead for csr_id in csr_ids}
+    
+    def resolve(self, csr_id, fallback_csr=None):
+        """Return the settings for invoices of students enrolled by `csr_id`.
+        
+        When neither the CSR nor any Lead CSR has settings, settings are created
+        for `fallback_csr`, or for the first Lead CSR when it is None. Pass
+        fallback_csr=False to return None instead of creating anything.
+        """
+        settings = self.resolve_many([csr_id])[csr_id]
+        if settings is None and fallback_csr is not False:
+            owner = fallback_csr or CSRProfile.objects.filter(lead_role=True).first()
+            if owner:
+                settings, _ = InvoiceSettings.objects.get_or_create(
+                    csr=owner,
+                    defaults={'current_serial_number': 1000}
+                )
+        return settings
+
+
+invoice_settings_resolver = InvoiceSettingsResolver()
+
+
+def get_bank_details(invoice_settings):
+    """Bank details printed on an invoice, falling back to the defaults"""
+    if not invoice_settings:
+        return dict(DEFAULT_BANK_DETAILS)
+    return {
+        'school_name': invoice_settings.school_name,
+        'bank_name': invoice_settings.bank_name,
+        'account_number': invoice_settings.account_number,
+        'iban_number': invoice_settings.iban_number,
+    }
+
+
+def get_invoice_context(student, is_pending=False, invoice_settings=None, student_invoice=None):
     """
     Prepare context data for HTML invoice template
     
     Args:
         student: Student object
         is_pending: Boolean indicating if this is a pending payment invoice
+        invoice_settings: InvoiceSettings already resolved by the caller (optional)
+        student_invoice: StudentInvoice already fetched by the caller (optional)
     """
     # Format date
     formatted_date = datetime.now().strftime("%d-%m-%Y")
     
     # Get or create StudentInvoice record for this student
-    student_invoice, created = StudentInvoice.objects.get_or_create(student=student)
+    if student_invoice is None:
+        student_invoice, created = StudentInvoice.objects.get_or_create(student=student)
     
-    # Get invoice settings for this CSR
-    try:
-        # First try to get invoice settings for the student's creator
-        invoice_settings = InvoiceSettings.objects.get(csr=student.created_by)
-        
-        # Get the invoice number from the StudentInvoice model
-        if is_pending:
-            # For pending invoice, use P prefix with the stored pending invoice number
-            if student_invoice.pending_invoice_no > 0:
-                invoice_number = f"{student_invoice.pending_invoice_no}"
-            else:
-                # If no pending invoice number yet, use the current settings number
-                invoice_number = f"{invoice_settings.current_serial_number}"
-        else:
-            # For regular invoice, use the stored present invoice number
-            if student_invoice.present_invoice_no > 0:
-                invoice_number = str(student_invoice.present_invoice_no)
-            else:
-                # If no present invoice number yet, use the current settings number
-                invoice_number = str(invoice_settings.current_serial_number)
-        
-        # Get bank details from settings
-        school_name = invoice_settings.school_name
-        bank_name = invoice_settings.bank_name
-        account_number = invoice_settings.account_number
-        iban_number = invoice_settings.iban_number
-    except InvoiceSettings.DoesNotExist:
-        # If the student's creator doesn't have invoice settings, try to get from a Lead CSR
-        try:
-            # Find a Lead CSR with invoice settings
-            lead_csr_settings = InvoiceSettings.objects.filter(csr__lead_role=True).first()
-            
-            if lead_csr_settings:
-                invoice_settings = lead_csr_settings
-                # Get the invoice number from the StudentInvoice model
-                if is_pending:
-                    # For pending invoice, use P prefix with the stored pending invoice number
-                    if student_invoice.pending_invoice_no > 0:
-                        invoice_number = f"{student_invoice.pending_invoice_no}"
-                    else:
-                        # If no pending invoice number yet, use the current settings number
-                        invoice_number = f"{lead_csr_settings.current_serial_number}"
-                else:
-                    # For regular invoice, use the stored present invoice number
-                    if student_invoice.present_invoice_no > 0:
-                        invoice_number = str(student_invoice.present_invoice_no)
-                    else:
-                        # If no present invoice number yet, use the current settings number
-                        invoice_number = str(lead_csr_settings.current_serial_number)
-                school_name = invoice_settings.school_name
-                bank_name = invoice_settings.bank_name
-                account_number = invoice_settings.account_number
-                iban_number = invoice_settings.iban_number
-            else:
-                # If no Lead CSR settings found, use defaults
-                invoice_settings = None
-                # Use student invoice numbers if available, otherwise use student ID
-                if is_pending:
-                    invoice_number = f"{student_invoice.pending_invoice_no}" if student_invoice.pending_invoice_no > 0 else f"P{student.id}"
-                else:
-                    invoice_number = str(student_invoice.present_invoice_no) if student_invoice.present_invoice_no > 0 else str(student.id)
-                # Fallback to defaults
-                school_name = "Devinci Dev"
-                bank_name = "JS Bank"
-                account_number = "0002587773"
-                iban_number = "PK56JSBL9561000002587773"
-        except Exception:
-            # Final fallback to defaults
-            invoice_settings = None
-            # Use student invoice numbers if available, otherwise use student ID
-            if is_pending:
-                invoice_number = f"P{student_invoice.pending_invoice_no}" if student_invoice.pending_invoice_no > 0 else f"P{student.id}"
-            else:
-                invoice_number = str(student_invoice.present_invoice_no) if student_invoice.present_invoice_no > 0 else str(student.id)
-            school_name = "Devinci Dev"
-            bank_name = "JS Bank"
-            account_number = "0002587773"
-            iban_number = "PK56JSBL9561000002587773"
+    # Get invoice settings for this CSR (creator's, else a Lead CSR's)
+    if invoice_settings is None:
+        invoice_settings = invoice_settings_resolver.resolve(student.created_by_id, fallback_csr=False)
+    
+    # Get the invoice number from the StudentInvoice model
+    number = student_invoice.pending_invoice_no if is_pending else student_invoice.present_invoice_no
+    if number > 0:
+        invoice_number = str(number)
+    elif invoice_settings:
+        # If no invoice number yet, use the current settings number
+        invoice_number = str(invoice_settings.current_serial_number)
+    else:
+        # No settings: use the student ID
+        invoice_number = f"P{student.id}" if is_pending else str(student.id)
     
     # Format due date
     due_date = student.due_date.strftime('%d %b %Y') if student.due_date else 'N/A'
@@ -113,10 +164,7 @@ def get_invoice_context(student, is_pending=False):
         'student': student,
         'formatted_date': formatted_date,
         'invoice_number': invoice_number,
-        'school_name': school_name,
-        'bank_name': bank_name,
-        'account_number': account_number,
-        'iban_number': iban_number,
+        **get_bank_details(invoice_settings),
         'due_date': due_date,
         'csr_name': csr_name
     }
@@ -124,7 +172,7 @@ def get_invoice_context(student, is_pending=False):
     return context
 
 
-def render_printable_invoice(request, student, is_pending=False, receipt_type='DEV'):
+def render_printable_invoice(request, student, is_pending=False, receipt_type='DEV', invoice_settings=None, student_invoice=None):
     """Render HTML invoice for printing
     
     Args:
@@ -132,9 +180,10 @@ def render_printable_invoice(request, student, is_pending=False, receipt_type='D
         student: Student object
         is_pending: Boolean indicating if this is a pending payment invoice
         receipt_type: String indicating receipt type ('AKTI' or 'BBT')
+        invoice_settings, student_invoice: passed on to get_invoice_context
     """
     # Get context data for the invoice
-    context = get_invoice_context(student, is_pending)
+    context = get_invoice_context(student, is_pending, invoice_settings, student_invoice)
     
     # Add pending flag to context
     context['is_pending'] = is_pending
@@ -147,22 +196,197 @@ def render_printable_invoice(request, student, is_pending=False, receipt_type='D
         # For pending invoices, we show the balance amount instead of advance payment
         context['pending_amount'] = student.balance
         
-        # Create a modified student object for the template
-        # This avoids modifying the actual student record in the database
-        from copy import copy
-        modified_student = copy(student)
+        # Replace the student in context with a modified copy
+        context['student'] = pending_invoice_student(student)
+    
+    # Link that re-renders this invoice after a correction
+    context['regenerate_url'] = f"{request.path}?{'pending=true&' if is_pending and 'pending' in request.GET else ''}regenerate=1"
+    
+    # Render the HTML template and keep it as the issued invoice
+    html = render_to_string('invoice/printable_invoice.html', context)
+    snapshot = InvoiceSnapshot.store(
+        student,
+        'pending' if is_pending else 'present',
+        html,
+        invoice_number=context['invoice_number'],
+        amount=student.balance if is_pending else student.advance_payment,
+        csr_name=context['csr_name'],
+    )
+    return invoice_snapshot_response(request, snapshot)
+
+
+def invoice_snapshot_response(request, snapshot):
+    """Serve a stored invoice; the compressed bytes are sent as-is to clients accepting gzip"""
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+        response = HttpResponse(bytes(snapshot.html), content_type='text/html; charset=utf-8')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(snapshot.get_html(), content_type='text/html; charset=utf-8')
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def pending_invoice_student(student):
+    """Return a copy of `student` with the amounts shown on a pending payment invoice.
+    
+    This avoids modifying the actual student record in the database.
+    """
+    modified_student = copy(student)
+    
+    # For pending invoices, we show balance as the payment amount
+    # and set due amount to 0 (since it's being paid in full)
+    modified_student.advance_payment = 0  # Don't show advance payment for pending invoices
+    modified_student.balance = student.balance  # Show current balance
+    modified_student.second_installment = student.balance  # Keep second_installment for backward compatibility
+    
+    # Update total_amount to include the balance payment
+    modified_student.total_amount = student.advance_payment + student.balance
+    return modified_student
+
+
+def assign_invoice_numbers(students, is_pending=False):
+    """
+    Make sure every student has a StudentInvoice with an invoice number
+    
+    Missing StudentInvoice rows are created in one statement and missing
+    numbers are reserved as one block per settings row, so the query count
+    does not depend on the number of students. Students without any
+    resolvable invoice settings keep number 0 (see get_invoice_context).
+    
+    Args:
+        students: list of Student objects, ideally with invoice_numbers selected
+        is_pending: Boolean selecting the pending or the present invoice number
+    
+    Returns:
+        ({student_id: StudentInvoice}, {student_id: InvoiceSettings or None})
+    """
+    number_field = 'pending_invoice_no' if is_pending else 'present_invoice_no'
+    
+    # Invoice records, creating the missing ones in one statement
+    invoices = {}
+    missing = []
+    for student in students:
+        try:
+            invoices[student.id] = student.invoice_numbers
+        except StudentInvoice.DoesNotExist:
+            missing.append(StudentInvoice(student=student))
+    created = StudentInvoice.objects.bulk_create(missing)
+    for student_invoice in created:
+        invoices[student_invoice.student_id] = student_invoice
+    
+    # Invoice settings per creator, with a Lead CSR's settings as the fallback
+    settings_by_csr = invoice_settings_resolver.resolve_many(student.created_by_id for student in students)
+    student_settings = {student.id: settings_by_csr[student.created_by_id] for student in students}
+    
+    # Reserve one block of serial numbers per settings row for invoices without a number
+    unnumbered = [
+        student.id for student in students
+        if student_settings[student.id] and getattr(invoices[student.id], number_field) == 0
+    ]
+    # Records that existed before this call may have been numbered since by a concurrent print
+    created_ids = {student_invoice.student_id for student_invoice in created}
+    read = [student_id for student_id in unnumbered if student_id not in created_ids]
+    if unnumbered:
+        with transaction.atomic() if read else nullcontext():
+            # Lock those rows and re-read their numbers
+            stored = dict(
+                StudentInvoice.objects.select_for_update().filter(student_id__in=read).order_by('pk')
+                .values_list('student_id', number_field)
+            ) if read else {}
+            to_number = {}
+            for student_id in unnumbered:
+                setattr(invoices[student_id], number_field, stored.get(student_id, 0))
+                if stored.get(student_id, 0) == 0:
+                    invoice_settings = student_settings[student_id]
+                    to_number.setdefault(invoice_settings.pk, (invoice_settings, []))[1].append(invoices[student_id])
+            numbered = []
+            now = timezone.now()
+            for invoice_settings, student_invoices in to_number.values():
+                for student_invoice, number in zip(student_invoices, invoice_settings.reserve_serial_numbers(len(student_invoices))):
+                    setattr(student_invoice, number_field, number)
+                    student_invoice.updated_at = now
+                    numbered.append(student_invoice)
+            if numbered:
+                StudentInvoice.objects.bulk_update(numbered, [number_field, 'updated_at'])
+    
+    return invoices, student_settings
+
+
+def get_batch_invoice_contexts(students, is_pending=False, receipt_type='DEV'):
+    """
+    Prepare invoice contexts for many students at once (batch printing)
+    
+    Uses a fixed number of queries regardless of the number of students:
+    students with their batch, creator and invoice record,
+    assign_invoice_numbers() for the invoice records, settings and numbers,
+    then the stored snapshots. Invoices already issued are reprinted from
+    their snapshot (`html`); the numbered ones without a snapshot are
+    rendered as a single print would and stored in one bulk_create.
+    
+    Args:
+        students: Student queryset, in print order
+        is_pending: Boolean indicating if these are pending payment invoices
+        receipt_type: String indicating receipt type ('AKTI' or 'BBT')
+    """
+    number_field = 'pending_invoice_no' if is_pending else 'present_invoice_no'
+    students = list(
+        students.select_related('batch', 'created_by', 'invoice_numbers')
+    )
+    invoices, student_settings = assign_invoice_numbers(students, is_pending)
+    invoice_type = 'pending' if is_pending else 'present'
+    snapshots = {
+        snapshot.student_id: snapshot
+        for snapshot in InvoiceSnapshot.objects.filter(student__in=students, invoice_type=invoice_type)
+    }
+    
+    formatted_date = datetime.now().strftime("%d-%m-%Y")
+    contexts = []
+    issued = []
+    for student in students:
+        invoice_settings = student_settings[student.id]
+        number = getattr(invoices[student.id], number_field)
+        if number > 0:
+            invoice_number = str(number)
+        else:
+            # No settings to number from: same fallback as get_invoice_context
+            invoice_number = f"P{student.id}" if is_pending else str(student.id)
         
-        # For pending invoices, we show balance as the payment amount
-        # and set due amount to 0 (since it's being paid in full)
-        modified_student.advance_payment = 0  # Don't show advance payment for pending invoices
-        modified_student.balance = student.balance  # Show current balance
-        modified_student.second_installment = student.balance  # Keep second_installment for backward compatibility
+        # For pending invoices, use today's date if payment is made before due date
+        if is_pending and student.due_date and student.due_date > datetime.now().date():
+            student.due_date = datetime.now().date()
         
-        # Update total_amount to include the balance payment
-        modified_student.total_amount = student.advance_payment + student.balance
+        context = {
+            'student': pending_invoice_student(student) if is_pending else student,
+            'formatted_date': formatted_date,
+            'invoice_number': invoice_number,
+            **get_bank_details(invoice_settings),
+            'due_date': student.due_date.strftime('%d %b %Y') if student.due_date else 'N/A',
+            'csr_name': student.get_creator_name(),
+            'is_pending': is_pending,
+            'receipt_type': receipt_type.upper(),
+        }
+        if is_pending:
+            context['pending_amount'] = student.balance
         
-        # Replace the student in context with our modified version
-        context['student'] = modified_student
+        snapshot = snapshots.get(student.id)
+        if snapshot is None and number > 0:
+            # First issuance: keep it exactly as printed, like render_printable_invoice
+            regenerate_url = reverse('generate_invoice', args=[student.id])
+            html = render_to_string('invoice/printable_invoice.html', {
+                **context,
+                'regenerate_url': f"{regenerate_url}?{'pending=true&' if is_pending else ''}regenerate=1",
+            })
+            snapshot = InvoiceSnapshot(
+                student=student, invoice_type=invoice_type, invoice_number=invoice_number,
+                amount=student.balance if is_pending else student.advance_payment,
+                csr_name=context['csr_name'], html=gzip.compress(html.encode('utf-8')),
+            )
+            issued.append(snapshot)
+        if snapshot is not None:
+            context['html'] = snapshot.get_body_html()
+        contexts.append(context)
+    
+    # A concurrent single print may have stored one meanwhile; it carries the same number
+    InvoiceSnapshot.objects.bulk_create(issued, ignore_conflicts=True)
     
-    # Render the HTML template
-    return render(request, 'invoice/printable_invoice.html', context)
+    return contexts
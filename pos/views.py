@@ -8,107 +8,22 @@ from django.utils import timezone
 from django.http import HttpResponse, JsonResponse
 from .forms import StudentForm, InvoiceSettingsForm
 from django.contrib.auth.models import User
-from django.db.models import Count, Sum, F, Q
+from django.db.models import Count, Sum, F, Value
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
 from django.db import transaction
 from django.core.paginator import Paginator
-from .models import CSRProfile, Course, Batch, Student, InvoiceSettings,StudentInvoice
-from .utils import render_printable_invoice
+from django.db.models.functions import Coalesce, ExtractMonth
+from django.utils.cache import get_conditional_response, patch_cache_control
+from .models import CSRProfile, Course, Batch, Student, InvoiceSettings,StudentInvoice, InvoiceSnapshot, Job, Payment, day_start
+from .utils import assign_invoice_numbers, get_batch_invoice_contexts, invoice_settings_resolver, invoice_snapshot_response, render_printable_invoice
+from .cache import cached, conditional, fragment_etag, is_shared
+from .importer import IMPORT_COLUMNS, ImportFormatError, import_students
+from .jobs import enqueue
+import base64
 import json
-import io
-import csv
 from datetime import datetime, timedelta
 from decimal import Decimal
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-
-def calculate_date_range_revenue(students, start_date=None, end_date=None):
-    """Helper function to calculate revenue based on payments received within date range"""
-    batch_groups = {}
-    course_groups = {}
-    
-    for student in students:
-        # Calculate payments within date range for this student
-        advance_in_range = 0
-        second_installment_in_range = 0
-        
-        if start_date and end_date:
-            if isinstance(start_date, str):
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            else:
-                start_date_obj = start_date
-                end_date_obj = end_date
-            
-            if student.created_at and start_date_obj <= student.created_at.date() <= end_date_obj:
-                advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            if student.due_date and start_date_obj <= student.due_date <= end_date_obj:
-                second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        elif start_date:
-            if isinstance(start_date, str):
-                start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            else:
-                start_date_obj = start_date
-            
-            if student.created_at and student.created_at.date() >= start_date_obj:
-                advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            if student.due_date and student.due_date >= start_date_obj:
-                second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        elif end_date:
-            if isinstance(end_date, str):
-                end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            else:
-                end_date_obj = end_date
-            
-            if student.created_at and student.created_at.date() <= end_date_obj:
-                advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            if student.due_date and student.due_date <= end_date_obj:
-                second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        else:
-            # No date filter, include all payments
-            advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        
-        payment_in_range = advance_in_range + second_installment_in_range
-        
-        # Group by batch
-        batch_name = student.batch.batch_number if student.batch else 'N/A'
-        if batch_name not in batch_groups:
-            batch_groups[batch_name] = {
-                'total_revenue': 0,
-                'received_payment': 0,
-                'pending_payment': 0,
-                'student_count': 0
-            }
-        
-        batch_groups[batch_name]['total_revenue'] += float(student.discounted_price) if student.discounted_price else 0
-        batch_groups[batch_name]['received_payment'] += payment_in_range
-        batch_groups[batch_name]['pending_payment'] += float(student.balance) if student.balance else 0
-        batch_groups[batch_name]['student_count'] += 1
-        
-        # Group by course
-        for course in student.courses.all():
-            course_name = course.name
-            if course_name not in course_groups:
-                course_groups[course_name] = {
-                    'total_revenue': 0,
-                    'received_payment': 0,
-                    'pending_payment': 0,
-                    'student_count': 0
-                }
-            
-            course_groups[course_name]['total_revenue'] += float(student.discounted_price) if student.discounted_price else 0
-            course_groups[course_name]['received_payment'] += payment_in_range
-            course_groups[course_name]['pending_payment'] += float(student.balance) if student.balance else 0
-            course_groups[course_name]['student_count'] += 1
-    
-    # Convert to list format for template compatibility
-    batch_revenue = [{'batch__batch_number': k, **v} for k, v in batch_groups.items()]
-    course_revenue = [{'courses__name': k, **v} for k, v in course_groups.items()]
-    
-    return batch_revenue, course_revenue
-
 
 # Custom JSON encoder to handle Decimal objects
 class DecimalEncoder(json.JSONEncoder):
@@ -176,9 +91,8 @@ def toggle_dark_mode(request):
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
 
 # Admin Dashboard Views
-@staff_member_required(login_url='login')
-def admin_dashboard(request):
-    """Admin dashboard view"""
+def _build_admin_dashboard_context():
+    """Compute the admin dashboard stat cards (cached, see admin_dashboard)"""
     # Get counts for dashboard stats
     total_csrs = CSRProfile.objects.count()
     total_courses = Course.objects.count()
@@ -199,57 +113,8 @@ def admin_dashboard(request):
     # Pending Payments (sum of balance - remaining amounts to be paid)
     pending_payments = Student.objects.all().aggregate(total=Sum('balance'))['total'] or 0
     
-    # Students per Batch (info-cards per batch with student count)
-    batches_with_students = Batch.objects.annotate(
-        student_count=Count('students')
-    ).order_by('-created_at')
-    
     # Get recent students for activity feed
-    recent_students = Student.objects.select_related('created_by', 'batch').order_by('-created_at')[:5]
-    
-    # Get courses with student counts for course distribution chart
-    courses_with_counts = Course.objects.annotate(
-        student_count=Count('students')
-    ).order_by('-student_count')
-    
-    # Prepare course data for chart.js
-    course_labels = [course.name for course in courses_with_counts]
-    course_data = [course.student_count for course in courses_with_counts]
-    course_colors = [
-        f'rgba({200 + i}, {200 + i}, {200 + i}, {min(0.9 - (i * 0.1), 0.9)})'
-        for i in range(len(courses_with_counts))
-    ]
-    courses_data = {
-        'labels': course_labels,
-        'data': course_data,
-        'colors': course_colors
-    }
-    
-    # Get CSR performance data (number of students enrolled by each CSR)
-    csr_performance = CSRProfile.objects.annotate(
-        students_enrolled=Count('students')
-    ).order_by('-students_enrolled')[:5]
-    
-    # Prepare CSR performance data for chart.js
-    csr_labels = [csr.full_name for csr in csr_performance]
-    csr_data = [csr.students_enrolled for csr in csr_performance]
-    csr_performance_data = {
-        'labels': csr_labels,
-        'data': csr_data
-    }
-    
-    # Get monthly revenue data for the chart
-    current_year = timezone.now().year
-    monthly_revenue = []
-    
-    for month in range(1, 13):
-        month_revenue = Student.objects.filter(
-            created_at__year=current_year,
-            created_at__month=month
-        ).aggregate(total=Sum('discounted_price'))['total'] or 0
-        monthly_revenue.append(month_revenue)
-    
-    monthly_labels = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+    recent_students = list(Student.objects.select_related('created_by', 'batch').order_by('-created_at')[:5])
     
     context = {
         'total_csrs': total_csrs,
@@ -262,18 +127,56 @@ def admin_dashboard(request):
         'total_revenue': total_revenue,
         'payment_received': payment_received,
         'pending_payments': pending_payments,
-        'batches_with_students': batches_with_students,
         'recent_students': recent_students,
-        'courses_with_counts': courses_with_counts,
-        'csr_performance': csr_performance,
-        'monthly_revenue': monthly_revenue,
-        'monthly_labels': monthly_labels,
-        'courses_data': courses_data,
-        'csr_performance_data': csr_performance_data,
     }
     
+    return context
+
+@staff_member_required(login_url='login')
+def admin_dashboard(request):
+    """Admin dashboard view"""
+    # Only the stat cards are rendered here; the charts load from dashboard_widget.
+    # Stats are identical for every admin; cached until students, batches, courses or CSRs change
+    context = cached('admin_dashboard', _build_admin_dashboard_context)
     return render(request, 'invoice/admin_dashboard.html', context)
 
+
+def _build_monthly_revenue_widget(year):
+    """Revenue (sum of discounted prices) per month of `year`, for the revenue chart"""
+    monthly_revenue = [0] * 12
+    rows = Student.objects.filter(created_at__year=year).annotate(
+        month=ExtractMonth('created_at')
+    ).values('month').annotate(total=Sum('discounted_price')).order_by()
+    for row in rows:
+        monthly_revenue[row['month'] - 1] = float(row['total'] or 0)
+    
+    return {
+        'labels': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
+        'data': monthly_revenue,
+    }
+
+
+def _build_course_distribution_widget():
+    """Number of students enrolled per course, for the course distribution chart"""
+    courses_with_counts = Course.objects.annotate(
+        num_students=Count('students')
+    ).order_by('-num_students')
+    return {
+        'labels': [course.name for course in courses_with_counts],
+        'data': [course.num_students for course in courses_with_counts],
+    }
+
+
+def _build_csr_performance_widget():
+    """Top 5 CSRs by number of students enrolled, for the CSR performance chart"""
+    csr_performance = CSRProfile.objects.annotate(
+        students_enrolled=Count('students')
+    ).order_by('-students_enrolled')[:5]
+    return {
+        'labels': [csr.full_name for csr in csr_performance],
+        'data': [csr.students_enrolled for csr in csr_performance],
+    }
+
 @staff_member_required(login_url='login')
 def csr_management(request):
     """CSR management view"""
@@ -380,8 +283,8 @@ def csr_management(request):
         
         return redirect('csr_management')
 
-    # Pagination: 10 CSRs per page
-    paginator = Paginator(csrs_qs, 10)
+    # Pagination: 10 CSRs per page, with their counts annotated (no COUNT per row)
+    paginator = Paginator(csrs_qs.select_related('user').with_stats(), 10)
     page_number = request.GET.get('page')
     csrs_page = paginator.get_page(page_number)
     
@@ -597,6 +500,46 @@ def admin_settings(request):
     return render(request, 'invoice/admin_settings.html', context)
 
 # CSR Dashboard Views
+def _build_csr_dashboard_shared_stats(is_lead):
+    """Compute the CSR dashboard stats shared by every CSR of the same role (cached)"""
+    stats = {
+        'total_batches': Batch.objects.all().count(),  # Show all batches count
+        'active_batches': Batch.objects.filter(status='active').count(),  # Active batches count
+        'total_students': Student.objects.count(),
+        'total_courses': Course.objects.count(),
+    }
+    if is_lead:
+        stats.update({
+            # Get CSR count for lead CSRs (same as admin dashboard)
+            'total_csrs': CSRProfile.objects.count(),
+            'current_students': Student.objects.filter(batch__status='active').count(),  # Students in active batches
+            # Total Revenue (sum of all enrolled-course fees, using discounted price)
+            'total_revenue': Student.objects.all().aggregate(total=Sum('discounted_price'))['total'] or 0,
+            # Payment Received (sum of total_amount - actual payments received)
+            'payment_received': Student.objects.all().aggregate(total=Sum('total_amount'))['total'] or 0,
+            # Pending Payments (sum of balance - remaining amounts to be paid)
+            'pending_payments': Student.objects.all().aggregate(total=Sum('balance'))['total'] or 0,
+            # Get courses for lead role CSRs
+            'courses': list(Course.objects.all().order_by('-created_at')[:5]),
+        })
+    return stats
+
+
+def _build_csr_dashboard_own_stats(csr, is_lead):
+    """Compute the CSR dashboard stats specific to one CSR (cached)"""
+    stats = {
+        # Get recent students for display in the dashboard
+        'recent_students': list(
+            Student.objects.filter(created_by=csr).order_by('-created_at')[:5]
+        ),
+    }
+    if not is_lead:
+        # For regular CSRs, show both total students and their own students
+        stats['csr_students'] = Student.objects.filter(created_by=csr).count()
+        stats['current_students'] = Student.objects.filter(created_by=csr, batch__status='active').count()
+    return stats
+
+
 @login_required(login_url='login')
 def csr_dashboard(request):
     """CSR dashboard view"""
@@ -607,79 +550,33 @@ def csr_dashboard(request):
     except CSRProfile.DoesNotExist:
         messages.error(request, 'You are not authorized to access this page.')
         return redirect('login')
-    print('csr',csr.lead_role)
-    # Get counts for dashboard stats
-    total_batches = Batch.objects.all().count()  # Show all batches count
-    active_batches = Batch.objects.filter(status='active').count()  # Active batches count
-    
-    # Get CSR count for lead CSRs (same as admin dashboard)
-    total_csrs = CSRProfile.objects.count() if (csr.lead_role or request.user.is_superuser) else None
-    
-    # For students, show all for lead/admin, both total and own for regular CSRs
-    if csr.lead_role or request.user.is_superuser:
-        total_students = Student.objects.count()
-        csr_students = None  # Not needed for lead CSRs
-        current_students = Student.objects.filter(batch__status='active').count()  # Students in active batches
-        
-        # Add revenue and pending payment data for lead CSRs
-        # Total Revenue (sum of all enrolled-course fees, using discounted price)
-        total_revenue = Student.objects.all().aggregate(
-            total=Sum('discounted_price')
-        )['total'] or 0
-        
-        # Payment Received (sum of total_amount - actual payments received)
-        payment_received = Student.objects.all().aggregate(total=Sum('total_amount'))['total'] or 0
-        
-        # Pending Payments (sum of balance - remaining amounts to be paid)
-        pending_payments = Student.objects.all().aggregate(total=Sum('balance'))['total'] or 0
-    else:
-        # For regular CSRs, show both total students and their own students
-        total_students = Student.objects.all().count()
-        csr_students = Student.objects.filter(created_by=csr).count()
-        current_students = Student.objects.filter(created_by=csr, batch__status='active').count()
-        # For regular CSRs, we don't calculate revenue metrics
-        total_revenue = None
-        payment_received = None
-        pending_payments = None
-        
-    total_courses = Course.objects.count()
-    
-    # Get recent students for display in the dashboard
-    recent_students = Student.objects.filter(created_by=csr).order_by('-created_at')[:5]
-    
-    # Get courses for lead role CSRs
-    courses = []
-    if csr.lead_role or request.user.is_superuser:
-        courses = Course.objects.all().order_by('-created_at')[:5]
-    
+    is_lead = csr.lead_role or request.user.is_superuser
+
+    # Shared counts are cached per role, the CSR's own numbers per CSR
+    shared = cached('csr_dashboard', lambda: _build_csr_dashboard_shared_stats(is_lead), 'lead' if is_lead else 'regular')
+    own = cached('csr_dashboard', lambda: _build_csr_dashboard_own_stats(csr, is_lead), 'csr', csr.id, is_lead)
+
     context = {
         'csr': csr,
-        'total_batches': total_batches,
-        'active_batches': active_batches,
-        'total_students': total_students,
-        'current_students': current_students,
-        'csr_students': csr_students,  # Add CSR's own student count for regular CSRs
-        'total_courses': total_courses,
-        'total_csrs': total_csrs,  # Add total CSRs count for lead CSRs
-        'students': recent_students,  # Add recent students to context
-        'courses': courses,  # Add courses for lead role CSRs
+        'total_batches': shared['total_batches'],
+        'active_batches': shared['active_batches'],
+        'total_students': shared['total_students'],
+        'current_students': shared['current_students'] if is_lead else own['current_students'],
+        'csr_students': None if is_lead else own['csr_students'],  # CSR's own student count for regular CSRs
+        'total_courses': shared['total_courses'],
+        'total_csrs': shared['total_csrs'] if is_lead else None,  # Total CSRs count for lead CSRs
+        'students': own['recent_students'],  # Recent students
+        'courses': shared['courses'] if is_lead else [],  # Courses for lead role CSRs
     }
     
     # Add revenue data to context for lead CSRs
-    print(f"DEBUG - Lead role: {csr.lead_role}, Is superuser: {request.user.is_superuser}")
-    print(f"DEBUG - Before update, context keys: {context.keys()}")
-    
-    if csr.lead_role or request.user.is_superuser:
+    if is_lead:
         context.update({
-            'total_revenue': total_revenue,
-            'payment_received': payment_received,
-            'pending_payments': pending_payments,
+            'total_revenue': shared['total_revenue'],
+            'payment_received': shared['payment_received'],
+            'pending_payments': shared['pending_payments'],
             'is_lead': True,  # Add explicit flag for template
         })
-        print(f"DEBUG - After update, context keys: {context.keys()}")
-        print(f"DEBUG - Revenue values: {total_revenue}, {payment_received}, {pending_payments}")
-    else:
-        print("DEBUG - User is not lead CSR or admin, not adding revenue data")
     
     return render(request, 'invoice/csr_dashboard.html', context)
 
@@ -712,9 +609,9 @@ def csr_batch_management(request):
             messages.success(request, f'Batch {batch_number} created successfully.')
     
     # Get all batches with counts
-    batches = Batch.objects.all().order_by('-created_at')
-    total_batches = batches.count()
-    active_batches = batches.filter(status='active').count()
+    batches = Batch.objects.select_related('created_by__user').with_stats().order_by('-created_at')
+    total_batches = Batch.objects.count()
+    active_batches = Batch.objects.filter(status='active').count()
     
     # Get student counts
     total_students = Student.objects.count()
@@ -757,7 +654,7 @@ def batch_management(request):
             messages.success(request, f'Batch {batch_number} created successfully.')
     
     # Get all batches (not just those created by this CSR)
-    batches = Batch.objects.all().order_by('-created_at')
+    batches = Batch.objects.with_stats().order_by('-created_at')
     
     context = {
         'batches': batches,
@@ -878,6 +775,9 @@ def student_management(request):
                         except Course.DoesNotExist:
                             pass
                     
+                    # The advance is the first entry in the payment ledger
+                    Payment.objects.record_advances([student], csr=csr)
+                    
                     messages.success(request, f'Student {name} registered successfully.')
                     return redirect('student_management')
             except Batch.DoesNotExist:
@@ -942,6 +842,14 @@ def generate_invoice(request, student_id):
     # Get receipt type (AKTI or BBT), default to AKTI
     receipt_type = request.GET.get('receipt_type', 'AKTI').upper()
     
+    # Reprints serve the invoice exactly as first issued, unless regenerating after a correction
+    if request.GET.get('regenerate') != '1':
+        snapshot = InvoiceSnapshot.objects.filter(
+            student=student, invoice_type='pending' if is_pending else 'present'
+        ).first()
+        if snapshot:
+            return invoice_snapshot_response(request, snapshot)
+    
     # For pending invoices, use today's date if payment is made before due date
     if is_pending and student.due_date and student.due_date > datetime.now().date():
         student.due_date = datetime.now().date()
@@ -949,68 +857,71 @@ def generate_invoice(request, student_id):
     # Get or create StudentInvoice record for this student
     student_invoice, created = StudentInvoice.objects.get_or_create(student=student)
     
-    # Determine which invoice settings will be used (same logic as get_invoice_context)
-    invoice_settings = None
-
-    # 1) Try student's creator invoice settings
-    if student.created_by:
-        invoice_settings = InvoiceSettings.objects.filter(csr=student.created_by).first()
-
-    # 2) If not found, fall back to a Lead CSR with settings
-    if not invoice_settings:
-        invoice_settings = InvoiceSettings.objects.filter(csr__lead_role=True).first()
-
-    # 3) As a final fallback, use (or create) settings for the logged-in CSR
-    if not invoice_settings and csr_profile:
-        invoice_settings, _ = InvoiceSettings.objects.get_or_create(
-            csr=csr_profile,
-            defaults={
-                'current_serial_number': 1000
-            }
-        )
-    
-    # 4) If still no settings found (e.g., for superuser), create default settings with a lead CSR
-    if not invoice_settings:
-        # Try to get any lead CSR's settings
-        invoice_settings = InvoiceSettings.objects.filter(csr__lead_role=True).first()
-        if not invoice_settings:
-            # If no lead CSR has settings, create one for the first lead CSR
-            lead_csr = CSRProfile.objects.filter(lead_role=True).first()
-            if lead_csr:
-                invoice_settings, _ = InvoiceSettings.objects.get_or_create(
-                    csr=lead_csr,
-                    defaults={
-                        'current_serial_number': 1000
-                    }
-                )
+    # Determine which invoice settings will be used (same resolution as get_invoice_context)
+    invoice_settings = invoice_settings_resolver.resolve(student.created_by_id, fallback_csr=csr_profile)
     
     # Safety check: ensure invoice_settings exists
     if not invoice_settings:
         messages.error(request, 'Invoice settings not found. Please contact administrator.')
         return redirect('student_management')
 
-    # Only increment and persist the serial number if this is the first time generating this invoice type
-    if not is_pending and student_invoice.present_invoice_no == 0:
-        # Increment the serial number for regular invoice
-        invoice_settings.current_serial_number += 1
-        invoice_settings.save()
-        
-        # Save the invoice number to the student's invoice record
-        student_invoice.present_invoice_no = invoice_settings.current_serial_number
-        student_invoice.save()
-    elif is_pending and student_invoice.pending_invoice_no == 0:
-        # Increment the serial number for pending invoice
-        invoice_settings.current_serial_number += 1
-        invoice_settings.save()
-        
-        # Save the invoice number to the student's invoice record
-        student_invoice.pending_invoice_no = invoice_settings.current_serial_number
-        student_invoice.save()
+    # Only reserve a serial number if this is the first time generating this invoice type
+    student_invoice.assign_number(invoice_settings, pending=is_pending)
     
     # Use the utility function to render the invoice
-    return render_printable_invoice(request, student, is_pending=is_pending, receipt_type=receipt_type)
+    return render_printable_invoice(
+        request, student, is_pending=is_pending, receipt_type=receipt_type,
+        invoice_settings=invoice_settings, student_invoice=student_invoice,
+    )
 
 @login_required(login_url='login')
+def batch_invoices(request, batch_id):
+    """Printable invoices for all students of a batch in one document"""
+    # Get CSR profile
+    csr_profile = None
+    if not request.user.is_superuser:
+        try:
+            csr_profile = CSRProfile.objects.get(user=request.user)
+        except CSRProfile.DoesNotExist:
+            messages.error(request, 'You are not authorized to access this page.')
+            return redirect('login')
+    
+    batch = get_object_or_404(Batch, id=batch_id)
+    
+    # Lead CSRs and admins print every student of the batch, other CSRs only their own
+    students = Student.objects.filter(batch=batch)
+    if not (request.user.is_superuser or csr_profile.lead_role):
+        students = students.filter(created_by=csr_profile)
+    
+    # Optional payment status filter
+    payment_status = request.GET.get('payment_status', '')
+    if payment_status in ('paid', 'pending'):
+        students = students.filter(payment_status=payment_status)
+    
+    is_pending = request.GET.get('pending', 'false').lower() == 'true'
+    receipt_type = request.GET.get('receipt_type', 'AKTI').upper()
+    if is_pending:
+        # Same rule as generate_pending_invoice: only students with a balance left to pay
+        students = students.receivables()
+    
+    invoices = get_batch_invoice_contexts(students.order_by('name', 'id'), is_pending, receipt_type)
+    
+    # The filter links keep the invoice type and receipt type of this print
+    print_query = request.GET.copy()
+    print_query.pop('payment_status', None)
+    
+    context = {
+        'batch': batch,
+        'invoices': invoices,
+        'payment_status': payment_status,
+        'is_pending': is_pending,
+        'print_query': print_query.urlencode(),
+        'csr': csr_profile,
+    }
+    return render(request, 'invoice/batch_invoices.html', context)
+
+@login_required(login_url='login')
+@conditional('students', 'batches', 'courses')
 def edit_student(request, student_id):
     """Edit an existing student (CSR only) using ModelForm"""
     try:
@@ -1029,6 +940,8 @@ def edit_student(request, student_id):
         print(f"POST data: {request.POST}")
         print(f"POST courses: {request.POST.getlist('courses')}")
         
+        # Validation writes the posted values onto the instance: keep the stored status
+        previous_status = student.payment_status
         form = StudentForm(request.POST, instance=student)
         if form.is_valid():
             # Ensure the batch belongs to this CSR
@@ -1040,8 +953,15 @@ def edit_student(request, student_id):
             
             # Save instance without committing to handle M2M separately
             updated_student = form.save(commit=False)
-            updated_student.save()
-            form.save_m2m()
+            with transaction.atomic():
+                updated_student.save()
+                form.save_m2m()
+                # A status changed here is a payment taken or undone, like update_payment_status
+                if updated_student.payment_status != previous_status:
+                    if updated_student.payment_status == 'paid':
+                        Payment.objects.record_installments([updated_student.id], csr=csr)
+                    else:
+                        Payment.objects.record_reversals([updated_student.id], csr=csr)
             print("Student updated and m2m saved. Schedule:", updated_student.schedule)
             print("Courses after save:", list(updated_student.courses.values_list('id', flat=True)))
             messages.success(request, 'Student updated successfully.')
@@ -1102,6 +1022,71 @@ def delete_student(request, student_id):
         messages.error(request, 'You do not have permission to delete students.')
     return redirect('student_management')
 
+@login_required(login_url='login')
+def student_import(request):
+    """Import a roster of students from a CSV/XLSX upload (CSRs)"""
+    try:
+        csr = CSRProfile.objects.get(user=request.user)
+    except CSRProfile.DoesNotExist:
+        messages.error(request, 'You are not authorized to access this page.')
+        return redirect('login')
+    
+    batches = Batch.objects.filter(status='active').order_by('-created_at')
+    result = None
+    job = None
+    
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        batch = None
+        if request.POST.get('batch'):
+            batch = Batch.objects.filter(id=request.POST['batch']).first()
+        if not upload:
+            messages.error(request, 'Please choose a CSV or XLSX file.')
+        elif request.POST.get('background'):
+            # Large rosters: a worker (manage.py run_worker) imports the file.
+            # Chunks commit as they go, so a failed import is not retried
+            job = enqueue(
+                'pos.import_students', created_by=request.user, max_attempts=1,
+                filename=upload.name, content=base64.b64encode(upload.read()).decode('ascii'),
+                csr_id=csr.id, batch_id=batch.id if batch else None, dry_run=bool(request.POST.get('dry_run')),
+            )
+            messages.success(request, f'Import queued as job #{job.id}.')
+        else:
+            try:
+                result = import_students(upload, upload.name, csr, batch=batch, dry_run=bool(request.POST.get('dry_run')))
+            except ImportFormatError as e:
+                messages.error(request, str(e))
+            else:
+                if result.dry_run:
+                    messages.info(request, f'{result.created} of {result.rows} rows are valid. Nothing was imported.')
+                elif result.created:
+                    messages.success(request, f'Imported {result.created} students in {result.seconds:.1f}s.')
+    
+    context = {
+        'batches': batches,
+        'result': result,
+        'job': job,
+        'columns': ', '.join(IMPORT_COLUMNS),
+    }
+    return render(request, 'invoice/student_import.html', context)
+
+@login_required(login_url='login')
+def job_status(request, job_id):
+    """Status and result of a background job, for the user who queued it (or an admin)"""
+    visible = Job.objects.all() if request.user.is_superuser else Job.objects.filter(created_by=request.user)
+    job = get_object_or_404(visible, id=job_id)
+    return JsonResponse({
+        'id': job.id,
+        'task': job.task,
+        'status': job.status,
+        'attempts': job.attempts,
+        'result': job.result,
+        # Only the exception line of the traceback
+        'error': job.error.strip().splitlines()[-1] if job.error else '',
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+    })
+
 @login_required(login_url='login')
 def update_payment_status(request, student_id):
     """Update payment status for a student (AJAX endpoint)"""
@@ -1128,13 +1113,22 @@ def update_payment_status(request, student_id):
             if payment_status not in ['paid', 'pending']:
                 return JsonResponse({'success': False, 'error': 'Invalid payment status'}, status=400)
             
-            # Update student payment status
-            student.payment_status = payment_status
+            # Flip the status in one conditional UPDATE (same balance rules as Student.save());
+            # the second installment is recorded in (or reversed from) the payment ledger
+            if payment_status == 'paid':
+                updated = Student.objects.mark_paid([student.id], csr=csr_profile)
+            else:
+                updated = Student.objects.mark_pending([student.id], csr=csr_profile)
             
-            # The Student.save() method will handle setting balance to 0 when payment_status is 'paid'
-            # No need to manually set balance here as it's handled in the model's save method
-                
-            student.save()
+            if updated:
+                # Mirror the UPDATE on the loaded instance instead of re-reading it
+                student.payment_status = payment_status
+                if payment_status == 'paid':
+                    student.balance = 0
+                    student.total_amount = student.advance_payment + student.second_installment
+                else:
+                    student.balance = student.second_installment
+                    student.total_amount = student.advance_payment
             
             # Return the updated balance in the response
             return JsonResponse({
@@ -1147,6 +1141,90 @@ def update_payment_status(request, student_id):
     
     return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
 
+# Upper bound on students per collect_payments request
+MAX_BULK_PAYMENTS = 500
+
+@login_required(login_url='login')
+def collect_payments(request):
+    """Mark many students as paid in one request (AJAX endpoint)
+    
+    Expects a JSON body with `student_ids`, and optionally `payment_method`,
+    `payment_date` (YYYY-MM-DD, default today; stored as the due date of
+    students that have none, like generate_pending_invoice, and as the date
+    of their second installment in the payment ledger) and
+    `allocate_invoices` to reserve pending invoice numbers for all of them.
+    """
+    # Get CSR profile
+    try:
+        csr_profile = request.user.csr_profile
+    except:
+        return JsonResponse({'success': False, 'error': 'Not authorized'}, status=403)
+    
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'}, status=405)
+    
+    # Parse and validate the request
+    try:
+        data = json.loads(request.body)
+        student_ids = {int(student_id) for student_id in data.get('student_ids', [])}
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid request data'}, status=400)
+    if not student_ids:
+        return JsonResponse({'success': False, 'error': 'No students selected'}, status=400)
+    if len(student_ids) > MAX_BULK_PAYMENTS:
+        return JsonResponse({'success': False, 'error': f'At most {MAX_BULK_PAYMENTS} students per request'}, status=400)
+    
+    payment_method = data.get('payment_method')
+    if payment_method and payment_method not in dict(Student.PAYMENT_METHOD_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Invalid payment method'}, status=400)
+    
+    payment_date = timezone.now().date()
+    if data.get('payment_date'):
+        try:
+            payment_date = datetime.strptime(data['payment_date'], '%Y-%m-%d').date()
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'error': 'Invalid payment date'}, status=400)
+    
+    changes = {'due_date': Coalesce('due_date', Value(payment_date))}
+    if payment_method:
+        changes['payment_method'] = payment_method
+    
+    with transaction.atomic():
+        # Ownership check: one query, locking the rows so the response matches the UPDATE
+        students = list(
+            Student.objects.filter(id__in=student_ids, created_by=csr_profile)
+            .select_related('invoice_numbers')
+            .select_for_update(of=('self',))
+        )
+        missing = student_ids - {student.id for student in students}
+        if missing:
+            return JsonResponse({'success': False, 'error': 'Student not found', 'missing': sorted(missing)}, status=404)
+        
+        # Same transition rules as update_payment_status, for all students at once
+        paid_at = timezone.now() if payment_date == timezone.now().date() else day_start(payment_date)
+        updated = Student.objects.mark_paid(student_ids, paid_at=paid_at, csr=csr_profile, **changes)
+        
+        invoices = {}
+        if data.get('allocate_invoices'):
+            invoices, _ = assign_invoice_numbers(students, is_pending=True)
+    
+    results = []
+    for student in students:
+        if student.payment_status == 'pending':
+            student.balance = 0
+            student.total_amount = student.advance_payment + student.second_installment
+        result = {
+            'id': student.id,
+            'payment_status': 'paid',
+            'balance': int(student.balance),
+            'total_amount': int(student.total_amount),
+        }
+        if student.id in invoices:
+            result['pending_invoice_no'] = invoices[student.id].pending_invoice_no
+        results.append(result)
+    
+    return JsonResponse({'success': True, 'updated': updated, 'students': results})
+
 @login_required(login_url='login')
 def invoice_settings(request):
     """Manage invoice settings (Lead CSR only)"""
@@ -1207,7 +1285,8 @@ def csr_settings(request):
 
         if avatar:
             settings.avatar = avatar
-            settings.save()
+            # Don't write back a stale current_serial_number
+            settings.save(update_fields=['avatar', 'updated_at'])
 
         messages.success(request, 'Profile updated successfully.')
         return redirect('csr_settings')
@@ -1219,28 +1298,63 @@ def csr_settings(request):
     return render(request, 'invoice/csr_settings.html', context)
 
 # Batch Stats API Endpoint
-def get_batch_stats(request):
-    """API endpoint to get batch-wise student count and revenue data"""
+def _build_batch_stats():
+    """Compute batch-wise student count and revenue data (cached, see get_batch_stats)"""
     # Get all batches with student counts
-    batches = Batch.objects.annotate(
-        student_count=Count('students'),
-        total_revenue=Sum('students__discounted_price'),
-        received_payment=Sum('students__advance_payment'),
-        pending_payment=Sum('students__second_installment')
-    ).values('batch_number', 'student_count', 'total_revenue', 'received_payment', 'pending_payment')
+    batches = Batch.objects.with_stats().values(
+        'batch_number', 'num_students', 'total_revenue', 'received_payment', 'pending_payment'
+    )
     
     # Convert Decimal objects to float for JSON serialization
     batch_data = []
     for batch in batches:
         batch_data.append({
             'batch_number': batch['batch_number'],
-            'student_count': batch['student_count'],
+            'student_count': batch['num_students'],
             'total_revenue': float(batch['total_revenue']) if batch['total_revenue'] else 0,
             'received_payment': float(batch['received_payment']) if batch['received_payment'] else 0,
             'pending_payment': float(batch['pending_payment']) if batch['pending_payment'] else 0
         })
     
-    return JsonResponse({'batches': batch_data})
+    return batch_data
+
+@conditional('students', 'batches', per_user=False)
+def get_batch_stats(request):
+    """API endpoint to get batch-wise student count and revenue data"""
+    return JsonResponse({'batches': cached('batch_stats', _build_batch_stats)})
+
+
+# Dashboard chart widgets: cache fragment, builder and cache TTL (seconds)
+DASHBOARD_WIDGETS = {
+    'monthly-revenue': ('widget_monthly_revenue', _build_monthly_revenue_widget, 600),
+    'course-distribution': ('widget_course_distribution', _build_course_distribution_widget, 300),
+    'csr-performance': ('widget_csr_performance', _build_csr_performance_widget, 300),
+    'batch-stats': ('batch_stats', _build_batch_stats, 120),
+}
+
+
+@staff_member_required(login_url='login')
+def dashboard_widget(request, widget):
+    """JSON data for one admin dashboard chart, with ETag revalidation"""
+    if widget not in DASHBOARD_WIDGETS:
+        return JsonResponse({'error': 'Unknown widget'}, status=404)
+    fragment, builder, ttl = DASHBOARD_WIDGETS[widget]
+    
+    # The monthly revenue chart is per calendar year
+    parts = (timezone.now().year,) if widget == 'monthly-revenue' else ()
+    
+    # The ETag changes whenever the data the widget is built from changes; a
+    # process-local cache never sees other processes' writes, so it gets none
+    etag = fragment_etag(fragment, *parts) if is_shared() else None
+    response = get_conditional_response(request, etag=etag) if etag else None
+    if response is None:
+        data = cached(fragment, lambda: builder(*parts), *parts, timeout=ttl)
+        response = JsonResponse(data, safe=False)
+    if etag:
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=ttl)
+    return response
+
 
 # Pending Payment Invoice View
 @login_required(login_url='login')
@@ -1262,6 +1376,12 @@ def generate_pending_invoice(request, student_id):
         messages.error(request, f"{student.name} does not have any pending payments.")
         return redirect('student_management')
     
+    # Reprints serve the invoice exactly as first issued, unless regenerating after a correction
+    if request.GET.get('regenerate') != '1':
+        snapshot = InvoiceSnapshot.objects.filter(student=student, invoice_type='pending').first()
+        if snapshot:
+            return invoice_snapshot_response(request, snapshot)
+    
     # Calculate the pending amount
     pending_amount = student.remaining_balance
     
@@ -1284,666 +1404,26 @@ def generate_pending_invoice(request, student_id):
     # We don't update second_installment_due_date here as that's set separately
     student.save(update_fields=update_fields)
     
+    # Generating the pending invoice collects the second installment (once, unless reversed since)
+    Payment.objects.record_installments([student.id], csr=csr_profile)
+    
     # Get or create StudentInvoice record for this student
     student_invoice, created = StudentInvoice.objects.get_or_create(student=student)
     
-    # Determine which invoice settings will be used (same logic as get_invoice_context)
-    invoice_settings = None
-
-    # 1) Try student's creator invoice settings
-    if student.created_by:
-        invoice_settings = InvoiceSettings.objects.filter(csr=student.created_by).first()
+    # Determine which invoice settings will be used (same resolution as get_invoice_context)
+    invoice_settings = invoice_settings_resolver.resolve(student.created_by_id, fallback_csr=csr_profile)
 
-    # 2) If not found, fall back to a Lead CSR with settings
-    if not invoice_settings:
-        invoice_settings = InvoiceSettings.objects.filter(csr__lead_role=True).first()
-
-    # 3) As a final fallback, use (or create) settings for the logged-in CSR
-    if not invoice_settings:
-        invoice_settings, _ = InvoiceSettings.objects.get_or_create(
-            csr=csr_profile,
-            defaults={
-                'current_serial_number': 1000
-            }
-        )
-
-    # Only increment and persist the serial number if this is the first time generating a pending invoice
-    if student_invoice.pending_invoice_no == 0:
-        # Increment the serial number
-        invoice_settings.current_serial_number += 1
-        invoice_settings.save()
-        
-        # Save the invoice number to the student's invoice record
-        student_invoice.pending_invoice_no = invoice_settings.current_serial_number
-        student_invoice.save()
+    # Only reserve a serial number if this is the first time generating a pending invoice
+    student_invoice.assign_number(invoice_settings, pending=True)
     
     # Get receipt type (AKTI or BBT), default to AKTI
     receipt_type = request.GET.get('receipt_type', 'AKTI').upper()
     
     # Use the utility function to render the invoice with is_pending=True
-    return render_printable_invoice(request, student, is_pending=True, receipt_type=receipt_type)
-
-# Report Generation Views
-@login_required
-def report_students(request):
-    """Generate student details report with filters"""
-    # Get filter parameters
-    batch_id = request.GET.get('batch')
-    course_id = request.GET.get('course')
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    payment_status = request.GET.get('payment_status')
-    export_format = request.GET.get('export')
-    
-    # Determine base queryset based on user role
-    base_students = Student.objects.select_related('batch', 'created_by').prefetch_related('courses')
-    csr = None
-    if not request.user.is_superuser:
-        try:
-            csr = request.user.csr_profile
-        except CSRProfile.DoesNotExist:
-            csr = None
-
-    if request.user.is_superuser or (csr and csr.lead_role):
-        students = base_students
-    else:
-        # Regular CSRs only see their own students
-        students = base_students.filter(created_by=csr)
-    
-    # Apply filters if provided
-    if batch_id:
-        students = students.filter(batch_id=batch_id)
-    
-    if course_id:
-        students = students.filter(courses__id=course_id)
-    
-    if start_date and end_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-        # Get students who made payments (advance or second installment) within the date range
-        students = students.filter(
-            Q(created_at__date__gte=start_date, created_at__date__lte=end_date) |
-            Q(due_date__gte=start_date, due_date__lte=end_date)
-        ).distinct()
-    elif start_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        # Get students who made payments on or after this date
-        students = students.filter(
-            Q(created_at__date__gte=start_date) | Q(due_date__gte=start_date)
-        ).distinct()
-    elif end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-        # Get students who made payments on or before this date
-        students = students.filter(
-            Q(created_at__date__lte=end_date) | Q(due_date__lte=end_date)
-        ).distinct()
-    
-    if payment_status:
-        students = students.filter(payment_status=payment_status)
-    
-    # Get all batches and courses for the filter dropdown
-    batches = Batch.objects.all()
-    courses = Course.objects.all()
-    
-    # Check if we need to export to Excel
-    if export_format == 'excel':
-        # Create a new workbook
-        wb = Workbook()
-        
-        # Create Student Details Sheet
-        ws = wb.active
-        ws.title = "Student Details"
-        
-        # Define headers for Excel export
-        headers = [
-            'ID', 'Name', 'Course', 'Status', 'CSR', 'Phone', 'Email', 'Batch',
-            'Registration Date', 'Pending Payment Due Date', 'Original Price', 'Discounted Price', 'Advance Payment', 'Second Installment', 'Balance', 'Total Amount',
-            'Advance Payment in Range', 'Second Installment in Range', 'Total Payment in Range'
-        ]
-        
-        # Write headers
-        for col, header in enumerate(headers, 1):
-            ws.cell(row=1, column=col, value=header)
-        
-        # Sort students by date
-        students = sorted(students, key=lambda s: s.created_at if s.created_at else timezone.now())
-        
-        # Write student data
-        row = 2
-        for index, student in enumerate(students, 1):
-            courses_list = ', '.join([course.name for course in student.courses.all()])
-            # Use the balance field from the Student model
-            balance = student.balance if student.balance is not None else 0
-            
-            # Calculate payments within date range
-            advance_in_range = 0
-            second_installment_in_range = 0
-            
-            if start_date and end_date:
-                # Check if advance payment (created_at) falls within range
-                if student.created_at and start_date <= student.created_at.date() <= end_date:
-                    advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-                
-                # Check if second installment (due_date) falls within range
-                if student.due_date and start_date <= student.due_date <= end_date:
-                    second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-            elif start_date:
-                # Check if payments are on or after start date
-                if student.created_at and student.created_at.date() >= start_date:
-                    advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-                if student.due_date and student.due_date >= start_date:
-                    second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-            elif end_date:
-                # Check if payments are on or before end date
-                if student.created_at and student.created_at.date() <= end_date:
-                    advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-                if student.due_date and student.due_date <= end_date:
-                    second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-            
-            total_payment_in_range = advance_in_range + second_installment_in_range
-            
-            # Write student details to Excel
-            ws.cell(row=row, column=1, value=index)
-            ws.cell(row=row, column=2, value=student.name)
-            ws.cell(row=row, column=3, value=courses_list)
-            ws.cell(row=row, column=4, value='Paid' if student.payment_status == 'paid' else 'Pending')
-            ws.cell(row=row, column=5, value=student.get_creator_name() if hasattr(student, 'get_creator_name') else 'N/A')
-            ws.cell(row=row, column=6, value=student.phone_number if hasattr(student, 'phone_number') else '')
-            ws.cell(row=row, column=7, value=student.email if hasattr(student, 'email') else '')
-            ws.cell(row=row, column=8, value=student.batch.batch_number if student.batch else 'N/A')
-            ws.cell(row=row, column=9, value=student.created_at.strftime('%Y-%m-%d') if student.created_at else '')
-            ws.cell(row=row, column=10, value=student.due_date.strftime('%Y-%m-%d') if student.due_date else '')
-            ws.cell(row=row, column=11, value=float(student.total_fees) if student.total_fees else 0)
-            ws.cell(row=row, column=12, value=float(student.discounted_price) if student.discounted_price else 0)
-            ws.cell(row=row, column=13, value=float(student.advance_payment) if student.advance_payment else 0)
-            ws.cell(row=row, column=14, value=float(student.second_installment) if student.second_installment else 0)
-            ws.cell(row=row, column=15, value=float(balance))
-            ws.cell(row=row, column=16, value=float(student.total_amount) if student.total_amount else 0)
-            ws.cell(row=row, column=17, value=advance_in_range)
-            ws.cell(row=row, column=18, value=second_installment_in_range)
-            ws.cell(row=row, column=19, value=total_payment_in_range)
-            
-            row += 1
-        
-        # Auto-adjust column widths for the worksheet
-        for column in ws.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            ws.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
-        
-        # Save to buffer
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        # Create the HttpResponse with Excel content
-        response = HttpResponse(
-            buffer.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename=student_details_report.xlsx'
-        return response
-    
-    # Get the currently logged-in user's CSR profile if it exists
-    csr = None
-    if hasattr(request.user, 'csrprofile'):
-        csr = request.user.csrprofile
-    
-    # Use a single shared template for both admin and CSR; data is already role-filtered above
-    template = 'invoice/report_students.html'
-    
-    # Render the template with context
-    context = {
-        'students': students,
-        'batches': batches,
-        'courses': courses,
-        'selected_batch': batch_id,
-        'selected_course': course_id,
-        'start_date': start_date,
-        'end_date': end_date,
-        'csr': csr,
-    }
-    
-    return render(request, template, context)
-
-@login_required
-def report_students_ajax(request):
-    """AJAX endpoint for student details report with filters"""
-    if not request.user.is_authenticated:
-        return JsonResponse({'error': 'Authentication required'}, status=401)
-    
-    # Get filter parameters
-    batch_id = request.GET.get('batch', '')
-    course_id = request.GET.get('course', '')
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-    payment_status = request.GET.get('payment_status', '')
-    
-    # Base queryset (respect role permissions)
-    base_students = Student.objects.select_related('batch', 'created_by').prefetch_related('courses')
-    csr = None
-    if not request.user.is_superuser:
-        try:
-            csr = request.user.csr_profile
-        except CSRProfile.DoesNotExist:
-            csr = None
-
-    if request.user.is_superuser or (csr and csr.lead_role):
-        students = base_students
-    else:
-        students = base_students.filter(created_by=csr)
-    
-    # Apply filters if provided
-    if batch_id:
-        students = students.filter(batch_id=batch_id)
-    
-    if course_id:
-        students = students.filter(courses__id=course_id)
-    
-    # Apply date filtering - only show students who made payments within the date range
-    if start_date or end_date:
-        date_filter = Q()
-        
-        if start_date and end_date:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            # Students who made advance payment within range OR second installment within range
-            date_filter = (
-                Q(created_at__date__gte=start_date_obj, created_at__date__lte=end_date_obj) |
-                Q(due_date__gte=start_date_obj, due_date__lte=end_date_obj)
-            )
-        elif start_date:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            # Students who made payments on or after this date
-            date_filter = (
-                Q(created_at__date__gte=start_date_obj) |
-                Q(due_date__gte=start_date_obj)
-            )
-        elif end_date:
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            # Students who made payments on or before this date
-            date_filter = (
-                Q(created_at__date__lte=end_date_obj) |
-                Q(due_date__lte=end_date_obj)
-            )
-        
-        students = students.filter(date_filter).distinct()
-    
-    if payment_status:
-        students = students.filter(payment_status=payment_status)
-    
-    # Prepare student data for JSON response
-    student_list = []
-    for student in students:
-        courses_list = [course.name for course in student.courses.all()]
-        
-        # Calculate payments within date range
-        advance_in_range = 0
-        second_installment_in_range = 0
-        
-        if start_date and end_date:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            
-            # Check if advance payment (created_at) falls within range
-            if student.created_at and start_date_obj <= student.created_at.date() <= end_date_obj:
-                advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            
-            # Check if second installment (due_date) falls within range
-            if student.due_date and start_date_obj <= student.due_date <= end_date_obj:
-                second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        elif start_date:
-            start_date_obj = datetime.strptime(start_date, "%Y-%m-%d").date()
-            
-            # Check if payments are on or after start date
-            if student.created_at and student.created_at.date() >= start_date_obj:
-                advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            if student.due_date and student.due_date >= start_date_obj:
-                second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        elif end_date:
-            end_date_obj = datetime.strptime(end_date, "%Y-%m-%d").date()
-            
-            # Check if payments are on or before end date
-            if student.created_at and student.created_at.date() <= end_date_obj:
-                advance_in_range = float(student.advance_payment) if student.advance_payment else 0
-            if student.due_date and student.due_date <= end_date_obj:
-                second_installment_in_range = float(student.second_installment) if student.second_installment else 0
-        
-        total_payment_in_range = advance_in_range + second_installment_in_range
-        
-        student_list.append({
-            'id': student.id,
-            'name': student.name,
-            'courses': courses_list,
-            'payment_status': student.payment_status,
-            'creator_name': student.get_creator_name() if hasattr(student, 'get_creator_name') else 'N/A',
-            'phone_number': student.phone_number,
-            'guardian_name': student.guardian_name,
-            'batch_number': student.batch.batch_number if student.batch else 'N/A',
-            'created_at': student.created_at.strftime('%Y-%m-%d') if student.created_at else '',
-            'total_fees': float(student.total_fees) if student.total_fees else 0,
-            'discounted_price': float(student.discounted_price) if student.discounted_price else 0,
-            'advance_payment': float(student.advance_payment) if student.advance_payment else 0,
-            'second_installment': float(student.second_installment) if student.second_installment else 0,
-            'balance': float(student.balance) if student.balance is not None else 0,
-            'total_amount': float(student.total_amount) if student.total_amount else 0,
-            'advance_in_range': advance_in_range,
-            'second_installment_in_range': second_installment_in_range,
-            'total_payment_in_range': total_payment_in_range,
-        })
-    
-    # Calculate totals for payments within date range
-    total_advance_in_range = sum(student['advance_in_range'] for student in student_list)
-    total_second_installment_in_range = sum(student['second_installment_in_range'] for student in student_list)
-    total_payment_in_range = sum(student['total_payment_in_range'] for student in student_list)
-    
-    # Prepare response data
-    response_data = {
-        'students': student_list,
-        'student_count': len(student_list),
-        'total_advance_in_range': total_advance_in_range,
-        'total_second_installment_in_range': total_second_installment_in_range,
-        'total_payment_in_range': total_payment_in_range
-    }
-    
-    return JsonResponse(response_data)
-
-@login_required
-def report_revenue(request):
-    """Generate revenue report by batch and course with filters"""
-    # Get filter parameters
-    batch_id = request.GET.get('batch')
-    course_id = request.GET.get('course')
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    export_format = request.GET.get('export')
-    
-    # Base queryset (respect role permissions)
-    base_students = Student.objects.select_related('batch').prefetch_related('courses')
-    csr = None
-    if not request.user.is_superuser:
-        try:
-            csr = request.user.csr_profile
-        except CSRProfile.DoesNotExist:
-            csr = None
-
-    if request.user.is_superuser or (csr and csr.lead_role):
-        students = base_students
-    else:
-        students = base_students.filter(created_by=csr)
-    
-    # Apply filters if provided
-    if batch_id:
-        students = students.filter(batch_id=batch_id)
-    
-    if course_id:
-        students = students.filter(courses__id=course_id)
-    
-    if start_date and end_date:
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-        # Get students who made payments (advance or second installment) within the date range
-        students = students.filter(
-            Q(created_at__date__gte=start_date, created_at__date__lte=end_date) |
-            Q(due_date__gte=start_date, due_date__lte=end_date)
-        ).distinct()
-    elif start_date:
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-        # Get students who made payments on or after this date
-        students = students.filter(
-            Q(created_at__date__gte=start_date) | Q(due_date__gte=start_date)
-        ).distinct()
-    elif end_date:
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-        # Get students who made payments on or before this date
-        students = students.filter(
-            Q(created_at__date__lte=end_date) | Q(due_date__lte=end_date)
-        ).distinct()
-    
-    # Get all batches and courses for the filter dropdown
-    batches = Batch.objects.all()
-    courses = Course.objects.all()
-    
-    # Generate revenue data using date-range-specific payments
-    batch_revenue, course_revenue = calculate_date_range_revenue(students, start_date, end_date)
-    
-    # Calculate totals for batch revenue
-    batch_total_revenue = sum(item['total_revenue'] or 0 for item in batch_revenue)
-    batch_received_payment = sum(item['received_payment'] or 0 for item in batch_revenue)
-    batch_pending_payment = sum(item['pending_payment'] or 0 for item in batch_revenue)
-    batch_student_count = sum(item['student_count'] or 0 for item in batch_revenue)
-    
-    # Calculate totals for course revenue
-    course_total_revenue = sum(item['total_revenue'] or 0 for item in course_revenue)
-    course_received_payment = sum(item['received_payment'] or 0 for item in course_revenue)
-    course_pending_payment = sum(item['pending_payment'] or 0 for item in course_revenue)
-    course_student_count = sum(item['student_count'] or 0 for item in course_revenue)
-    
-    # Check if we need to export
-    if export_format == 'excel':
-        # Create a new workbook
-        wb = Workbook()
-        
-        # Create Batch Revenue Sheet
-        ws_batch = wb.active
-        ws_batch.title = "Revenue by Batch"
-        
-        # Write headers
-        headers = ['Batch', 'Total Revenue', 'Received Payment', 'Pending Payment', 'Student Count']
-        for col, header in enumerate(headers, 1):
-            ws_batch.cell(row=1, column=col, value=header)
-        
-        # Write batch data
-        row = 2
-        for item in batch_revenue:
-            ws_batch.cell(row=row, column=1, value=item['batch__batch_number'] or 'N/A')
-            ws_batch.cell(row=row, column=2, value=float(item['total_revenue'] or 0))
-            ws_batch.cell(row=row, column=3, value=float(item['received_payment'] or 0))
-            ws_batch.cell(row=row, column=4, value=float(item['pending_payment'] or 0))
-            ws_batch.cell(row=row, column=5, value=item['student_count'] or 0)
-            row += 1
-        
-        # Add totals row
-        ws_batch.cell(row=row, column=1, value='TOTAL')
-        ws_batch.cell(row=row, column=2, value=float(sum(item['total_revenue'] or 0 for item in batch_revenue)))
-        ws_batch.cell(row=row, column=3, value=float(sum(item['received_payment'] or 0 for item in batch_revenue)))
-        ws_batch.cell(row=row, column=4, value=float(sum(item['pending_payment'] or 0 for item in batch_revenue)))
-        ws_batch.cell(row=row, column=5, value=sum(item['student_count'] or 0 for item in batch_revenue))
-        
-        # Create Course Revenue Sheet
-        ws_course = wb.create_sheet(title="Revenue by Course")
-        
-        # Write headers
-        for col, header in enumerate(headers, 1):
-            ws_course.cell(row=1, column=col, value=header.replace('Batch', 'Course'))
-        
-        # Write course data
-        row = 2
-        for item in course_revenue:
-            ws_course.cell(row=row, column=1, value=item['courses__name'] or 'N/A')
-            ws_course.cell(row=row, column=2, value=float(item['total_revenue'] or 0))
-            ws_course.cell(row=row, column=3, value=float(item['received_payment'] or 0))
-            ws_course.cell(row=row, column=4, value=float(item['pending_payment'] or 0))
-            ws_course.cell(row=row, column=5, value=item['student_count'] or 0)
-            row += 1
-        
-        # Add totals row
-        ws_course.cell(row=row, column=1, value='TOTAL')
-        ws_course.cell(row=row, column=2, value=float(sum(item['total_revenue'] or 0 for item in course_revenue)))
-        ws_course.cell(row=row, column=3, value=float(sum(item['received_payment'] or 0 for item in course_revenue)))
-        ws_course.cell(row=row, column=4, value=float(sum(item['pending_payment'] or 0 for item in course_revenue)))
-        ws_course.cell(row=row, column=5, value=sum(item['student_count'] or 0 for item in course_revenue))
-        
-        # Auto-adjust column widths for both worksheets
-        for worksheet in [ws_batch, ws_course]:
-            for column in worksheet.columns:
-                max_length = 0
-                column = [cell for cell in column]
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-            adjusted_width = (max_length + 2)
-            worksheet.column_dimensions[get_column_letter(column[0].column)].width = adjusted_width
-        
-        # Save to buffer
-        buffer = io.BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        # Create the HttpResponse with Excel content
-        response = HttpResponse(
-            buffer.getvalue(),
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        response['Content-Disposition'] = 'attachment; filename=student_details_report.xlsx'
-        return response
-    
-    # Get the current CSR profile for the sidebar (if any)
-    try:
-        csr = request.user.csr_profile
-    except:
-        csr = None
-    
-    # Render the template with filters using a shared template for both admin and CSR
-    context = {
-        'batch_revenue': batch_revenue,
-        'course_revenue': course_revenue,
-        'batches': batches,
-        'courses': courses,
-        'selected_batch': batch_id,
-        'selected_course': course_id,
-        'start_date': start_date,
-        'end_date': end_date,
-        'csr': csr,
-        # Add calculated totals
-        'batch_total_revenue': batch_total_revenue,
-        'batch_received_payment': batch_received_payment,
-        'batch_pending_payment': batch_pending_payment,
-        'batch_student_count': batch_student_count,
-        'course_total_revenue': course_total_revenue,
-        'course_received_payment': course_received_payment,
-        'course_pending_payment': course_pending_payment,
-        'course_student_count': course_student_count,
-    }
-    
-    return render(request, 'invoice/report_revenue.html', context)
-
-
-@login_required
-def report_revenue_ajax(request):
-    """AJAX endpoint for revenue report filtering"""
-    if not request.user.is_authenticated:
-        return JsonResponse({'error': 'Authentication required'}, status=401)
-    
-    # Get filter parameters
-    batch_id = request.GET.get('batch', '')
-    course_id = request.GET.get('course', '')
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-    
-    # Query students with filters and role restrictions
-    base_students = Student.objects.all()
-    csr = None
-    if not request.user.is_superuser:
-        try:
-            csr = request.user.csr_profile
-        except CSRProfile.DoesNotExist:
-            csr = None
-
-    if request.user.is_superuser or (csr and csr.lead_role):
-        students = base_students
-    else:
-        students = base_students.filter(created_by=csr)
-    
-    if batch_id:
-        students = students.filter(batch_id=batch_id)
-    
-    if course_id:
-        students = students.filter(courses__id=course_id)
-    
-    if start_date and end_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-        # Get students who made payments (advance or second installment) within the date range
-        students = students.filter(
-            Q(created_at__date__gte=start_date, created_at__date__lte=end_date) |
-            Q(due_date__gte=start_date, due_date__lte=end_date)
-        ).distinct()
-    elif start_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
-        # Get students who made payments on or after this date
-        students = students.filter(
-            Q(created_at__date__gte=start_date) | Q(due_date__gte=start_date)
-        ).distinct()
-    elif end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-        # Get students who made payments on or before this date
-        students = students.filter(
-            Q(created_at__date__lte=end_date) | Q(due_date__lte=end_date)
-        ).distinct()
-    
-    # Generate revenue data using date-range-specific payments
-    batch_revenue, course_revenue = calculate_date_range_revenue(students, start_date, end_date)
-    
-    # Calculate totals for batch revenue
-    batch_total_revenue = sum(item['total_revenue'] or 0 for item in batch_revenue)
-    batch_received_payment = sum(item['received_payment'] or 0 for item in batch_revenue)
-    batch_pending_payment = sum(item['pending_payment'] or 0 for item in batch_revenue)
-    batch_student_count = sum(item['student_count'] or 0 for item in batch_revenue)
-    
-    # Calculate totals for course revenue
-    course_total_revenue = sum(item['total_revenue'] or 0 for item in course_revenue)
-    course_received_payment = sum(item['received_payment'] or 0 for item in course_revenue)
-    course_pending_payment = sum(item['pending_payment'] or 0 for item in course_revenue)
-    course_student_count = sum(item['student_count'] or 0 for item in course_revenue)
-    
-    # Convert Decimal objects to float for JSON serialization
-    batch_revenue_list = []
-    for item in batch_revenue:
-        batch_revenue_list.append({
-            'batch__batch_number': item['batch__batch_number'],
-            'total_revenue': float(item['total_revenue']) if item['total_revenue'] else 0,
-            'received_payment': float(item['received_payment']) if item['received_payment'] else 0,
-            'pending_payment': float(item['pending_payment']) if item['pending_payment'] else 0,
-            'student_count': item['student_count']
-        })
-    
-    course_revenue_list = []
-    for item in course_revenue:
-        course_revenue_list.append({
-            'courses__name': item['courses__name'],
-            'total_revenue': float(item['total_revenue']) if item['total_revenue'] else 0,
-            'received_payment': float(item['received_payment']) if item['received_payment'] else 0,
-            'pending_payment': float(item['pending_payment']) if item['pending_payment'] else 0,
-            'student_count': item['student_count']
-        })
-    
-    # Prepare response data
-    response_data = {
-        'batch_revenue': batch_revenue_list,
-        'course_revenue': course_revenue_list,
-        'batch_total_revenue': float(batch_total_revenue),
-        'batch_received_payment': float(batch_received_payment),
-        'batch_pending_payment': float(batch_pending_payment),
-        'batch_student_count': batch_student_count,
-        'course_total_revenue': float(course_total_revenue),
-        'course_received_payment': float(course_received_payment),
-        'course_pending_payment': float(course_pending_payment),
-        'course_student_count': course_student_count,
-    }
-    
-    return JsonResponse(response_data)
-
+    return render_printable_invoice(
+        request, student, is_pending=True, receipt_type=receipt_type,
+        invoice_settings=invoice_settings, student_invoice=student_invoice,
+    )
 
 @login_required
 def change_password(request):
@@ -2014,9 +1494,9 @@ def admin_batch_management(request):
             messages.success(request, f'Batch {batch_number} created successfully.')
     
     # Get all batches with counts
-    batches = Batch.objects.all().order_by('-created_at')
-    total_batches = batches.count()
-    active_batches = batches.filter(status='active').count()
+    batches = Batch.objects.select_related('created_by__user').with_stats().order_by('-created_at')
+    total_batches = Batch.objects.count()
+    active_batches = Batch.objects.filter(status='active').count()
     
     # Get student counts
     total_students = Student.objects.count()
@@ -2082,223 +1562,10 @@ def batch_management(request):
         return redirect('batch_management')
     
     # Get all batches for display
-    batches = Batch.objects.all().order_by('-created_at')
+    batches = Batch.objects.with_stats().order_by('-created_at')
     
     context = {
         'batches': batches,
     }
     
     return render(request, 'invoice/batch_management.html', context)
-def commission_report(request):
-    """Commission report view for admin dashboard"""
-    if not request.user.is_authenticated or not request.user.is_staff:
-        return redirect('login')
-    
-    # Get filter parameters
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-    commission_percent = request.GET.get('commission_percent', 1)  # Default 1%
-    
-    try:
-        commission_percent = float(commission_percent)
-    except ValueError:
-        commission_percent = 1.0
-    
-    # Get all CSRs for the cards display with student counts
-    csrs = CSRProfile.objects.all().order_by('user__first_name', 'user__last_name')
-    
-    # Add completed student count for each CSR
-    for csr in csrs:
-        csr.completed_students_count = Student.objects.filter(
-            created_by=csr,
-            balance=0,
-            payment_status='paid'
-        ).count()
-    
-    # Initialize commission data
-    commission_data = []
-    total_commission = 0
-    total_admissions = 0
-    total_revenue = 0
-    total_payment_in_range = 0
-    
-    if start_date and end_date:
-        try:
-            start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-            end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-            
-            # Get students with completed payments (paid status) whose completion fell in range
-            # Include: 
-            # - Paid in full at registration (created_at in range)
-            # - Paid via installments with final payment recorded by due_date (due_date in range)
-            completed_students = Student.objects.filter(
-                payment_status='paid'
-            ).filter(
-                Q(created_at__date__range=[start_dt, end_dt]) | Q(due_date__range=[start_dt, end_dt])
-            ).select_related('created_by', 'batch').prefetch_related('courses')
-            
-            # Calculate commission for each CSR
-            for csr in csrs:
-                csr_students = completed_students.filter(created_by=csr)
-                
-                if csr_students.exists():
-                    # Calculate total revenue and commission
-                    csr_total_revenue = sum(student.discounted_price for student in csr_students)
-                    csr_commission = (csr_total_revenue * commission_percent) / 100
-                    csr_admissions = csr_students.count()
-                    
-                    # Calculate total payment received in range for this CSR's students
-                    csr_total_payment_in_range = 0
-                    
-                    # Add individual commission amounts to each student
-                    for student in csr_students:
-                        student.commission_amount = (student.discounted_price * commission_percent) / 100
-                        # Calculate payment received in range (advance + second installment if within range)
-                        payment_in_range = 0
-                        if start_dt <= student.created_at.date() <= end_dt:
-                            payment_in_range += student.advance_payment or 0
-                        if student.due_date and start_dt <= student.due_date <= end_dt:
-                            payment_in_range += student.second_installment or 0
-                        csr_total_payment_in_range += payment_in_range
-                    
-                    commission_data.append({
-                        'csr': csr,
-                        'total_revenue': csr_total_revenue,
-                        'commission': csr_commission,
-                        'admissions': csr_admissions,
-                        'students': csr_students,
-                        'total_payment_in_range': csr_total_payment_in_range
-                    })
-                    
-                    total_commission += csr_commission
-                    total_admissions += csr_admissions
-                    total_revenue += csr_total_revenue
-                    total_payment_in_range += csr_total_payment_in_range
-            
-            # Sort by commission amount (highest first)
-            commission_data.sort(key=lambda x: x['commission'], reverse=True)
-            
-        except ValueError as e:
-            # Invalid date format
-            messages.error(request, f"Invalid date format: {e}")
-        except Exception as e:
-            # General error handling
-            messages.error(request, f"Error calculating commissions: {e}")
-    
-    context = {
-        'csrs': csrs,
-        'commission_data': commission_data,
-        'total_commission': total_commission,
-        'total_admissions': total_admissions,
-        'total_revenue': total_revenue,
-        'total_payment_in_range': total_payment_in_range,
-        'commission_percent': commission_percent,
-        'start_date': start_date,
-        'end_date': end_date,
-        'has_filters': bool(start_date and end_date)
-    }
-    
-    # Debug information (remove in production)
-    print(f"Debug: Found {len(csrs)} CSRs")
-    for csr in csrs:
-        print(f"Debug: CSR {csr.get_full_name()} has {csr.completed_students_count} completed students")
-    
-    return render(request, 'invoice/commission.html', context)
-
-
-@staff_member_required(login_url='login')
-def export_commission_csv(request):
-    """Export commission report as CSV.
-    - If csr_id is provided, export for that CSR only.
-    - Otherwise, export for all CSRs.
-    Uses paid-only students within date range by created_at or due_date.
-    Last column contains CSR total commission for easy summarization per row.
-    """
-    # Validate filters
-    start_date = request.GET.get('start_date', '')
-    end_date = request.GET.get('end_date', '')
-    commission_percent = request.GET.get('commission_percent', '1')
-    csr_id = request.GET.get('csr_id')
-
-    try:
-        start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
-    except Exception:
-        return HttpResponse('Invalid or missing start_date/end_date', status=400)
-
-    try:
-        commission_percent_val = float(commission_percent)
-    except Exception:
-        commission_percent_val = 1.0
-
-    # Base students: paid and in date window by created_at or due_date
-    base_students = Student.objects.filter(
-        payment_status='paid'
-    ).filter(
-        Q(created_at__date__range=[start_dt, end_dt]) | Q(due_date__range=[start_dt, end_dt])
-    ).select_related('created_by', 'batch')
-
-    # Resolve CSRs to export
-    if csr_id:
-        csrs = CSRProfile.objects.filter(id=csr_id)
-        if not csrs.exists():
-            return HttpResponse('CSR not found', status=404)
-    else:
-        csrs = CSRProfile.objects.all().order_by('user__first_name', 'user__last_name')
-
-    # Prepare CSV
-    filename = 'commission_report_all.csv' if not csr_id else f'commission_report_csr_{csr_id}.csv'
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    writer = csv.writer(response)
-
-    # Headers
-    if csr_id:
-        writer.writerow([
-            'CSR', 'Student', 'Price', 'Commission', 'Registration Date', 'Due Date', 'CSR Total Commission'
-        ])
-    else:
-        writer.writerow([
-            'CSR', 'Student', 'Price', 'Commission', 'Registration Date', 'Due Date', 'CSR Total Commission'
-        ])
-
-    grand_total_commission = 0.0
-
-    for csr in csrs:
-        csr_students = base_students.filter(created_by=csr)
-        if not csr_students.exists():
-            continue
-
-        csr_total_revenue = sum(s.discounted_price for s in csr_students)
-        csr_total_commission = (csr_total_revenue * commission_percent_val) / 100
-        grand_total_commission += csr_total_commission
-
-        # Emit rows per student; last column always CSR total commission for quick pivoting
-        for s in csr_students:
-            commission_amount = (s.discounted_price * commission_percent_val) / 100
-            writer.writerow([
-                csr.get_full_name() if hasattr(csr, 'get_full_name') else getattr(csr, 'full_name', 'CSR'),
-                s.name,
-                int(s.discounted_price or 0),
-                int(commission_amount),
-                s.created_at.strftime('%Y-%m-%d') if s.created_at else '',
-                s.due_date.strftime('%Y-%m-%d') if s.due_date else '',
-                int(csr_total_commission),
-            ])
-
-        # Add a summary row for the CSR
-        writer.writerow([
-            csr.get_full_name() if hasattr(csr, 'get_full_name') else getattr(csr, 'full_name', 'CSR'),
-            'TOTAL',
-            int(csr_total_revenue),
-            int(csr_total_commission),
-            '',
-            '',
-            int(csr_total_commission),
-        ])
-
-    if not csr_id:
-        # Add grand total at end when exporting all CSRs
-        writer.writerow(['', 'GRAND TOTAL', '', int(grand_total_commission), '', '', int(grand_total_commission)])
-
-    return response